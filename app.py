@@ -1,3 +1,5 @@
+import time
+STARTED = time.perf_counter() # Before the heavier imports, for the startup timing report
 from src.gui.app_controller import AppController
 from tkinter import messagebox
 import traceback
@@ -6,7 +8,7 @@ import os
 
 def main():
     try:
-        app = AppController()
+        app = AppController(started=STARTED)
         app.mainloop()
     except Exception as e:
         print(f"[ERROR] Application failed to launch: {e}", file=sys.stderr)
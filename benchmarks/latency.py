@@ -0,0 +1,77 @@
+import os
+import time
+import builtins
+import threading
+from collections import Counter
+
+class LatencyInjector:
+    """
+    Makes a local folder behave a little like a NAS share: every filesystem call on a path
+    under one of `roots` (open, stat, listing, mkdir, rename, remove, set times...) counts
+    as one operation and, with `latency` > 0, sleeps that many seconds first, the way each
+    SMB request waits for a round trip. Reads and writes on an already open file are not
+    delayed; like SMB, they are bandwidth, not latency.
+
+    Used as a context manager it patches the os module and builtins.open for the whole
+    process, so it needs no FUSE or root access. Threads sleep independently, so code
+    that overlaps requests on a real share overlaps them here too.
+    `ops` counts operations per call name, with or without latency.
+    """
+    PATH_CALLS = (
+        "stat", "lstat", "scandir", "listdir", "mkdir", "rmdir", "remove", "unlink",
+        "utime", "chmod", "truncate", "open",
+    )
+    TWO_PATH_CALLS = ("rename", "replace", "link")
+
+    def __init__(self, roots, latency=0.0):
+        self.roots = tuple(os.path.abspath(root) + os.sep for root in roots)
+        self.latency = latency
+        self.ops = Counter()
+        self._lock = threading.Lock()
+        self._saved = {}
+
+    def __repr__(self):
+        return f"LatencyInjector(roots={list(self.roots)}, latency={self.latency})"
+
+    def __enter__(self):
+        for name in LatencyInjector.PATH_CALLS:
+            self._patch(os, name, lambda args: args[:1])
+        for name in LatencyInjector.TWO_PATH_CALLS:
+            self._patch(os, name, lambda args: args[:2])
+        self._patch(builtins, "open", lambda args: args[:1], label="open_file")
+        return self
+
+    def __exit__(self, *exc):
+        for (module, name), original in self._saved.items():
+            setattr(module, name, original)
+        self._saved.clear()
+        return False
+
+    @property
+    def total_ops(self):
+        with self._lock:
+            return sum(self.ops.values())
+
+    # --- Internal ---
+    def _patch(self, module, name, paths_of, label=None):
+        original = getattr(module, name)
+        self._saved[(module, name)] = original
+        label = label or name
+
+        def wrapper(*args, **kwargs):
+            if any(self._is_remote(path) for path in paths_of(args)):
+                with self._lock:
+                    self.ops[label] += 1
+                if self.latency:
+                    time.sleep(self.latency)
+            return original(*args, **kwargs)
+        setattr(module, name, wrapper)
+
+    def _is_remote(self, path):
+        if isinstance(path, int): # A file descriptor; the open that made it was already paid for
+            return False
+        try:
+            path = os.fsdecode(os.fspath(path))
+        except TypeError:
+            return False
+        return os.path.isabs(path) and (path + os.sep).startswith(self.roots)
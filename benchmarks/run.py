@@ -0,0 +1,239 @@
+"""
+Benchmark suite: back up synthetic trees with each mode and record how fast it went.
+
+    python -m benchmarks.run [--trees tiny huge deep mixed] [--modes mirror zip ...]
+                             [--scale 1.0] [--latency-ms 0] [--repeat 1] [--work DIR]
+                             [--output FILE] [--baseline FILE] [--tolerance 0.15]
+
+Trees are generated once per scale and seed (see benchmarks/trees.py) and reused. Every
+case runs in its own process, so peak RSS belongs to that case alone. Modes that compare
+against an earlier backup (incremental, snapshot, zip-differential) get one untimed run
+first; then 1% of the files are touched and the second run is timed.
+--latency-ms delays every filesystem call on the destination (benchmarks/latency.py) to
+imitate a NAS. Each case reports files/s and MiB/s (of the whole tree), CPU seconds,
+peak RSS, read/write syscalls (from /proc/self/io) and destination filesystem operations.
+
+Results are written as JSON (default benchmarks/results/<time>.json). With --baseline,
+cases slower, bigger or chattier than the baseline by more than --tolerance are flagged
+and the exit status is 1.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+# BackupJob keyword arguments per mode; "prepare" modes are timed on their second run
+MODES = {
+    "mirror": {"kwargs": {}},
+    "mirror-pack": {"kwargs": {"pack_small_files": True}},
+    "incremental": {"kwargs": {"incremental": True}, "prepare": True},
+    "snapshot": {"kwargs": {"snapshot": True}, "prepare": True},
+    "zip": {"kwargs": {"compress": True}},
+    "zip-differential": {"kwargs": {"compress": True, "zip_mode": "differential"}, "prepare": True},
+}
+TOUCH_EVERY = 100 # Files changed between the two runs of a "prepare" mode: one in this many
+# Metrics compared against a baseline, and which direction is worse
+COMPARED = {"files_per_s": "lower", "peak_rss_mb": "higher", "fs_ops": "higher"}
+
+def parse_args(argv):
+    from benchmarks.trees import TREES
+    parser = argparse.ArgumentParser(description="Benchmark backup modes on synthetic trees.")
+    parser.add_argument("--trees", nargs="+", choices=sorted(TREES), default=sorted(TREES))
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--scale", type=float, default=1.0, help="Tree size factor (0.1 for a quick run)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay per destination filesystem call")
+    parser.add_argument("--workers", type=int, help="BackupJob workers (default: BackupJob's own)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the median run is kept")
+    parser.add_argument("--work", default=os.path.join(tempfile.gettempdir(), "backup-benchmarks"),
+                        help="Folder for generated trees and backups")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed change before flagging (0.15 = 15%%)")
+    parser.add_argument("--child", help=argparse.SUPPRESS) # One case, run in a fresh process
+    return parser.parse_args(argv)
+
+# --- One case, in its own process ---
+def run_child(spec):
+    import resource
+    from src.utils.backup_job import BackupJob
+    from benchmarks.latency import LatencyInjector
+    from benchmarks.trees import TREE_MTIME
+    mode = MODES[spec["mode"]]
+    dest = spec["dest"]
+    kwargs = dict(mode["kwargs"])
+    if spec.get("workers"):
+        kwargs["workers"] = spec["workers"]
+    touched = []
+    if spec["phase"] == "prepare" or not mode.get("prepare"):
+        shutil.rmtree(dest, ignore_errors=True)
+        os.makedirs(dest)
+    # No JSON run report: it would land in the app's logs/ and be written inside the timed run
+    job = BackupJob(spec["src"], dest, report=False, **kwargs)
+    if spec["phase"] == "prepare":
+        job.timestamp = "2000-01-01" # So the timed run writes a new dated backup next to this one
+        job.run()
+        return {}
+    if mode.get("prepare"):
+        touched = _files(spec["src"])[::TOUCH_EVERY]
+        for path in touched:
+            os.utime(path, (TREE_MTIME + 1, TREE_MTIME + 1))
+    files = _files(spec["src"])
+    total_bytes = sum(os.path.getsize(path) for path in files)
+    io_before = _proc_io()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        with LatencyInjector([dest], spec["latency_ms"] / 1000.0) as fs:
+            started = time.perf_counter()
+            ok = job.run()
+            seconds = time.perf_counter() - started
+    finally:
+        for path in touched:
+            os.utime(path, (TREE_MTIME, TREE_MTIME))
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    io_after = _proc_io()
+    return {
+        "tree": spec["tree"],
+        "mode": spec["mode"],
+        "ok": ok,
+        "files": len(files),
+        "bytes": total_bytes,
+        "changed": len(touched),
+        "seconds": round(seconds, 4),
+        "files_per_s": round(len(files) / seconds, 1),
+        "mb_per_s": round(total_bytes / (1024 * 1024) / seconds, 2),
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime - usage_before.ru_utime - usage_before.ru_stime, 3),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1), # ru_maxrss is in KiB on Linux
+        "read_syscalls": _delta(io_before, io_after, "syscr"),
+        "write_syscalls": _delta(io_before, io_after, "syscw"),
+        "fs_ops": sum(fs.ops.values()),
+        "fs_ops_by_call": dict(sorted(fs.ops.items())),
+    }
+
+def _files(root):
+    return sorted(os.path.join(current, file) for current, _, files in os.walk(root) for file in files)
+
+def _proc_io():
+    """Counters from /proc/self/io, or {} where there is no such file."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except OSError:
+        return {}
+
+def _delta(before, after, key):
+    return after[key] - before[key] if key in before and key in after else None
+
+# --- Orchestration ---
+def run_case(tree, src, mode, args):
+    """Run one case `args.repeat` times, each in a fresh process. Returns the median run."""
+    spec = {
+        "tree": tree, "mode": mode, "src": src, "dest": os.path.join(args.work, "runs", f"{tree}-{mode}"),
+        "latency_ms": args.latency_ms, "workers": args.workers,
+    }
+    runs = []
+    for _ in range(max(1, args.repeat)):
+        if MODES[mode].get("prepare"):
+            _spawn(dict(spec, phase="prepare"))
+        runs.append(_spawn(dict(spec, phase="measure")))
+    shutil.rmtree(spec["dest"], ignore_errors=True)
+    runs.sort(key=lambda run: run["seconds"])
+    return runs[len(runs) // 2]
+
+def _spawn(spec):
+    process = subprocess.run(
+        [sys.executable, "-m", "benchmarks.run", "--child", json.dumps(spec)],
+        cwd=REPO_ROOT, capture_output=True, text=True,
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"Benchmark {spec['tree']}/{spec['mode']} ({spec['phase']}) failed:\n{process.stderr.strip()}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+def compare(results, baseline, tolerance):
+    """Lines describing every case that got worse than `baseline` by more than `tolerance`."""
+    previous = {(entry["tree"], entry["mode"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        base = previous.get((entry["tree"], entry["mode"]))
+        if base is None:
+            continue
+        for metric, worse in COMPARED.items():
+            old, new = base.get(metric), entry.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if worse == "lower" else (change > tolerance):
+                regressions.append(f"{entry['tree']}/{entry['mode']}: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _print_table(results):
+    print(f"{'tree':<7} {'mode':<17} {'files':>7} {'seconds':>8} {'files/s':>9} {'MiB/s':>8} "
+          f"{'CPU s':>7} {'RSS MiB':>8} {'fs ops':>8}")
+    for r in results:
+        print(f"{r['tree']:<7} {r['mode']:<17} {r['files']:>7} {r['seconds']:>8.2f} {r['files_per_s']:>9.0f} "
+              f"{r['mb_per_s']:>8.1f} {r['cpu_seconds']:>7.2f} {r['peak_rss_mb']:>8.1f} {r['fs_ops']:>8}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        print(json.dumps(run_child(json.loads(args.child))))
+        return 0
+    from benchmarks.trees import build
+    meta = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "seed": args.seed,
+        "latency_ms": args.latency_ms,
+        "workers": args.workers,
+        "repeat": args.repeat,
+    }
+    results = []
+    for tree in args.trees:
+        print(f"Generating tree '{tree}' (scale {args.scale})...", file=sys.stderr, flush=True)
+        src = build(tree, args.work, args.scale, args.seed)
+        for mode in args.modes:
+            print(f"  {tree}/{mode}", file=sys.stderr, flush=True)
+            results.append(run_case(tree, src, mode, args))
+    _print_table(results)
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print(f"Results written to {output}")
+    if not args.baseline:
+        return 0
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    for key in ("scale", "seed", "latency_ms", "workers"):
+        if baseline["meta"].get(key) != meta[key]:
+            print(f"[WARNING] Baseline was run with {key}={baseline['meta'].get(key)}, this run with {meta[key]}",
+                  file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+    for line in regressions:
+        print(f"[REGRESSION] {line}")
+    if not regressions:
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%}).")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
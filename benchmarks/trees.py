@@ -0,0 +1,97 @@
+import os
+import json
+import shutil
+import random
+
+# Words for compressible "source code / documents" content
+_WORDS = (
+    "backup mirror archive manifest journal snapshot retention throttle copy verify scan index "
+    "def class return import self value path size mtime hash error result file folder share"
+).split()
+
+def text_bytes(rng, size):
+    """Compressible content: random words, a few times smaller once deflated."""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).encode("ascii")[:size]
+
+def random_bytes(rng, size):
+    """Incompressible content, like media or already-compressed files."""
+    return rng.randbytes(size)
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+# --- Tree shapes. Each takes (root, rng, scale) and writes its files. ---
+def tiny(root, rng, scale):
+    """Many 0.5-4 KB source-like files in a few hundred folders (the per-file overhead case)."""
+    files = max(1, int(20000 * scale))
+    folders = max(1, files // 100)
+    for i in range(files):
+        _write(os.path.join(root, f"module{i % folders:03d}", f"file{i:05d}.c"), text_bytes(rng, rng.randint(512, 4096)))
+
+def huge(root, rng, scale):
+    """A few large files: one incompressible, one compressible, one mostly zeros."""
+    size = max(1024 * 1024, int(64 * 1024 * 1024 * scale))
+    _write(os.path.join(root, "media.bin"), random_bytes(rng, size))
+    _write(os.path.join(root, "dump.sql"), text_bytes(rng, size))
+    _write(os.path.join(root, "disk.img"), bytes(size - 4096) + random_bytes(rng, 4096))
+
+def deep(root, rng, scale):
+    """Deep nesting: a chain of folders, each with a few small files and a side branch."""
+    depth = max(2, int(40 * min(scale, 1.0)))
+    width = max(1, int(20 * scale))
+    path = root
+    for level in range(depth):
+        path = os.path.join(path, f"level{level:02d}")
+        for i in range(width):
+            _write(os.path.join(path, f"item{i:03d}.txt"), text_bytes(rng, rng.randint(100, 8192)))
+        _write(os.path.join(path, "branch", "leaf", "note.txt"), text_bytes(rng, 1000))
+
+def mixed(root, rng, scale):
+    """Sizes spread from 1 KB to 4 MB, a third each text, random and already-compressed formats."""
+    files = max(3, int(2000 * scale))
+    for i in range(files):
+        size = int(1024 * 4096 ** rng.random()) # Log-uniform 1 KB .. 4 MB
+        kind = i % 3
+        folder = os.path.join(root, f"project{i % 25:02d}")
+        if kind == 0:
+            _write(os.path.join(folder, f"doc{i:05d}.txt"), text_bytes(rng, size))
+        elif kind == 1:
+            _write(os.path.join(folder, f"data{i:05d}.dat"), random_bytes(rng, size))
+        else:
+            _write(os.path.join(folder, f"photo{i:05d}.jpg"), random_bytes(rng, size))
+
+TREES = {"tiny": tiny, "huge": huge, "deep": deep, "mixed": mixed}
+TREE_MTIME = 1700000000 # Every generated file gets this mtime
+
+def build(name, work_dir, scale=1.0, seed=1):
+    """
+    Generate tree `name` under work_dir/trees/<name> unless an identical one (same scale
+    and seed) is already there. The same arguments always give byte-identical trees.
+    Returns the tree's root.
+    """
+    root = os.path.join(work_dir, "trees", name)
+    marker = os.path.join(work_dir, "trees", f"{name}.json") # Kept outside the tree so it isn't backed up
+    params = {"tree": name, "scale": scale, "seed": seed}
+    if os.path.isdir(root) and os.path.exists(marker):
+        with open(marker, "r", encoding="utf-8") as f:
+            if json.load(f) == params:
+                return root
+    if os.path.isdir(root):
+        shutil.rmtree(root)
+    os.makedirs(root)
+    TREES[name](root, random.Random(f"{name}:{seed}"), scale)
+    # Fixed mtimes, so incremental and snapshot runs see the same tree every time
+    for current, _, files in os.walk(root):
+        for file in files:
+            os.utime(os.path.join(current, file), (TREE_MTIME, TREE_MTIME))
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return root
@@ -0,0 +1,73 @@
+"""
+Headless entry point: run the backup jobs listed in a JSON job file, without the GUI.
+
+    python cli.py jobs.json [--only NAME ...] [--max-jobs N] [--max-per-destination N]
+                            [--verify] [--report PATH] [--quiet]
+
+Prints a JSON report to stdout (and to --report if given). Exit status:
+    0  every job succeeded
+    1  every job ran, but some files failed
+    2  a job failed, was cancelled or was skipped
+    3  the job file or command line is invalid
+"""
+import sys
+import json
+import argparse
+from datetime import datetime
+from src.utils.job_runner import JobRunner, load_jobs
+from src.utils.logger import flush_logs
+
+EXIT_INVALID = 3
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Run backup jobs from a JSON job file without the GUI.")
+    parser.add_argument("job_file", help="JSON file listing the jobs (see src/utils/job_runner.py)")
+    parser.add_argument("--only", nargs="+", metavar="NAME", help="Run only the named jobs")
+    parser.add_argument("--max-jobs", type=int, help="Jobs running at once (overrides the job file)")
+    parser.add_argument("--max-per-destination", type=int,
+                        help="Jobs writing to one destination server or disk at once (overrides the job file)")
+    parser.add_argument("--verify", action="store_true", help="Verify every backup after it is written")
+    parser.add_argument("--report", metavar="PATH", help="Also write the JSON report to this file")
+    parser.add_argument("--quiet", action="store_true", help="Don't echo log lines to stderr")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        settings, specs = load_jobs(args.job_file)
+        if args.only:
+            missing = set(args.only) - {spec["name"] for spec in specs}
+            if missing:
+                raise ValueError(f"No job named: {', '.join(sorted(missing))}")
+            specs = [spec for spec in specs if spec["name"] in args.only]
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return EXIT_INVALID
+    if args.verify:
+        for spec in specs:
+            spec["verify_after"] = True
+    runner = JobRunner(
+        specs,
+        max_jobs=args.max_jobs or settings["max_jobs"],
+        max_per_destination=args.max_per_destination or settings["max_per_destination"],
+        log_callback=None if args.quiet else lambda msg: print(msg, file=sys.stderr, flush=True),
+        destinations=settings["destinations"],
+    )
+    started = datetime.now()
+    results = runner.run()
+    report = {
+        "started": started.isoformat(timespec="seconds"),
+        "finished": datetime.now().isoformat(timespec="seconds"),
+        "exit_code": runner.exit_code,
+        "jobs": [result.to_dict() for result in results],
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    flush_logs()
+    return runner.exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
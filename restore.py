@@ -0,0 +1,88 @@
+"""
+Restore files from the backups in a destination, without the job that wrote them.
+
+    python restore.py DEST NAME TARGET [PATH ...] [--as-of DATE] [--workers N]
+    python restore.py DEST NAME --where PATH [PATH ...] [--as-of DATE]
+    python restore.py DEST NAME --list [PATH ...] [--as-of DATE]
+    python restore.py DEST NAME --history PATH
+    python restore.py DEST NAME --backups
+
+DEST is the backup destination and NAME the source folder's name (the mirror folder, or
+the prefix of its snapshots and ZIPs). PATHs are files or folders relative to the source
+root; without any, everything is restored. DATE is YYYY-MM-DD (the end of that day) or
+YYYY-MM-DDTHH:MM; the default is the newest backup. What each backup holds is cached
+locally (see src/utils/restore.py), so only new backups are read from the share.
+Exit status: 0 on success, 1 if some files failed, 3 on bad arguments or nothing found.
+"""
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+from src.utils.restore import RestoreIndex, Restorer, parse_as_of
+
+EXIT_INVALID = 3
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Restore files from backups, as of a date.")
+    parser.add_argument("dest", help="Backup destination")
+    parser.add_argument("name", help="Source folder name")
+    parser.add_argument("target", nargs="?", help="Folder to restore into")
+    parser.add_argument("paths", nargs="*", metavar="PATH", help="Files or folders to restore (default: all)")
+    parser.add_argument("--as-of", help="Date (YYYY-MM-DD) or time (YYYY-MM-DDTHH:MM) to restore (default: newest)")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument("--where", action="store_true", help="Print which backup holds each PATH instead of restoring")
+    action.add_argument("--list", action="store_true", help="List the files that would be restored")
+    action.add_argument("--history", action="store_true", help="Print every backed-up version of each PATH")
+    action.add_argument("--backups", action="store_true", help="List the backups found in DEST")
+    parser.add_argument("--workers", type=int, default=8, help="Files read at once")
+    parser.add_argument("--cache-dir", help="Folder for the local index cache")
+    return parser.parse_intermixed_args(argv) # PATHs may follow the options
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        parse_as_of(args.as_of)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return EXIT_INVALID
+    if not os.path.isdir(args.dest):
+        print(f"[ERROR] Destination not found: {args.dest}", file=sys.stderr)
+        return EXIT_INVALID
+    with RestoreIndex(args.dest, args.name, args.cache_dir) as index:
+        index.refresh()
+        if args.backups:
+            for path, kind, created, files in index.backups():
+                print(f"{datetime.fromtimestamp(created):%Y-%m-%d %H:%M}  {kind:<8} {files:>8} files  {path}")
+            return 0
+        # Without a restore, the first PATH lands in `target`
+        paths = ([args.target] if args.target else []) + args.paths
+        if args.where or args.history:
+            if not paths:
+                print("[ERROR] No PATH given", file=sys.stderr)
+                return EXIT_INVALID
+            found = {path: index.locate(path, args.as_of) if args.where else index.versions(path) for path in paths}
+            print(json.dumps({
+                path: (value.to_dict() if value else None) if args.where else [version.to_dict() for version in value]
+                for path, value in found.items()
+            }, indent=2))
+            return 0 if all(found.values()) else EXIT_INVALID
+        if args.list:
+            for rel_path, version in sorted(index.select(paths or None, args.as_of).items()):
+                print(f"{rel_path}  ({version.location})")
+            return 0
+        if not args.target:
+            print("[ERROR] No target folder given", file=sys.stderr)
+            return EXIT_INVALID
+        versions = index.select(args.paths or None, args.as_of)
+    if not versions:
+        print(f"[ERROR] Nothing to restore as of {args.as_of or 'now'}", file=sys.stderr)
+        return EXIT_INVALID
+    result = Restorer(args.dest, args.workers).extract(list(versions.values()), args.target)
+    for rel_path, error in result.errors:
+        print(f"[ERROR] {rel_path}: {error}", file=sys.stderr)
+    print(f"Restored {result.copied} files to {args.target}" + (f", {len(result.errors)} failed" if result.errors else ""))
+    return 1 if result.errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,26 @@
-from src.gui.backup_manager_page import BackupManagerPage
-from src.gui.drive_manager_page import DriveManagerPage
 from src.gui.landing_page import LandingPage
 from src.utils.logger import setup_logger, clean_old_logs, get_default_log_dir
+from src.utils.startup_timer import StartupTimer
 from tkinter import Tk, Menu, Frame
+from collections import deque
+import threading
+import time
 import sys
 import os
 
 class AppController(Tk):
-    def __init__(self):
+    LOG_POLL_INTERVAL = 100 # ms between deliveries of log lines emitted by worker threads
+
+    def __init__(self, started=None):
+        # `started` is the perf_counter() taken before the app's imports, if the caller has one
+        self.startup = StartupTimer(started)
+        if started is not None:
+            self.startup.mark("imports")
         super().__init__()
+        self.startup.mark("tk")
         self.title("Backup Utility Suite")
-        clean_old_logs(get_default_log_dir()) # Clean old logs on startup
+        self.current_page = None
+        self._pending_logs = deque() # Lines logged off the Tk thread, shown by _drain_logs
         # self.geometry("700x550")
         # self.resizable(False, False)
         self.logger = setup_logger("backup_app", log_callback=self.gui_log_callback)
@@ -25,17 +35,49 @@ class AppController(Tk):
         # Page container
         self.container = Frame(self)
         self.container.pack(fill="both", expand=True, padx=10, pady=10)
-        self.pages = {} # Page cache
-        self._init_pages()
+        self.pages = {} # Page cache, filled by show_frame the first time each page is opened
         self._init_menu()
+        self.startup.mark("window")
         self.show_frame("LandingPage")
+        self.startup.mark("landing page")
+        # Globbing the log folder can be slow on a NAS share; nothing waits for it
+        threading.Thread(
+            target=lambda: clean_old_logs(get_default_log_dir()), name="clean-logs", daemon=True
+        ).start()
+        self.after(AppController.LOG_POLL_INTERVAL, self._drain_logs)
+        self.after_idle(self._report_startup)
 
-    def _init_pages(self):
-        for PageClass in (LandingPage, BackupManagerPage, DriveManagerPage):
+    def _get_page(self, page_name):
+        """The page called `page_name`, built on first use; None if there is no such page."""
+        page = self.pages.get(page_name)
+        if page is None:
+            PageClass = self._page_class(page_name)
+            if PageClass is None:
+                return None
+            started = time.perf_counter()
             page = PageClass(parent=self.container, controller=self)
-            page_name = PageClass.__name__
-            self.pages[page_name] = page
             page.grid(row=0, column=0, sticky="nsew")
+            self.pages[page_name] = page
+            self.logger.debug(f"Built {page_name} in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return page
+
+    @staticmethod
+    def _page_class(page_name):
+        # Imported on first use: the backup page pulls in the whole backup engine
+        if page_name == "LandingPage":
+            return LandingPage
+        if page_name == "BackupManagerPage":
+            from src.gui.backup_manager_page import BackupManagerPage
+            return BackupManagerPage
+        if page_name == "DriveManagerPage":
+            from src.gui.drive_manager_page import DriveManagerPage
+            return DriveManagerPage
+        return None
+
+    def _report_startup(self):
+        # Runs once the event loop is idle, i.e. the first window has been drawn
+        self.startup.mark("idle")
+        self.logger.info(self.startup.report())
 
     def _init_menu(self):
         menubar = Menu(self)
@@ -54,16 +96,32 @@ class AppController(Tk):
         self.config(menu=menubar)
 
     def show_frame(self, page_name):
-        if page_name in self.pages:
-            frame = self.pages[page_name]
+        frame = self._get_page(page_name)
+        if frame is not None:
             frame.tkraise()
+            self.current_page = page_name
         else:
             self.logger.warning(f"Unknown page: {page_name}")
 
     def gui_log_callback(self, msg):
-        """Override this if pages implement their own log displays."""
-        current_page = self.pages.get(self.tk.call('raise', self.container.winfo_children()[0]))
+        """Show a log line on the current page. Safe to call from any thread."""
+        if threading.current_thread() is not threading.main_thread():
+            # Tk must only be used from its own thread; queue it for the next drain
+            self._pending_logs.append(msg)
+            return
+        self._show_log(msg)
+
+    def _show_log(self, msg):
+        current_page = self.pages.get(self.current_page)
         if hasattr(current_page, "_log"):
             current_page._log(msg)
         else:
-            print(msg)
\ No newline at end of file
+            print(msg)
+
+    def _drain_logs(self):
+        if self._pending_logs:
+            lines = []
+            while self._pending_logs:
+                lines.append(self._pending_logs.popleft())
+            self._show_log("\n".join(lines)) # One widget update per batch, not per line
+        self.after(AppController.LOG_POLL_INTERVAL, self._drain_logs)
\ No newline at end of file
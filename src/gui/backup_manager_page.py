@@ -1,17 +1,23 @@
 from src.utils.backup_job import BackupJob
+from src.utils.backup_worker import BackupWorker
+from src.utils.throttle import parse_rate
+from src.utils.run_stats import format_eta
 from src.utils.logger import setup_logger
+from src.gui.log_pane import LogPane
 from tkinter.ttk import Progressbar
 from os.path import expanduser
 from tkinter import (
     Frame, Label, Entry, 
-    Button, Checkbutton, 
-    Text, Scrollbar, LabelFrame,
+    Button, Checkbutton, OptionMenu,
+    LabelFrame,
     BooleanVar, StringVar,
     filedialog,
-    END, DISABLED, NORMAL
+    DISABLED, NORMAL
 )
 
 class BackupManagerPage(Frame):
+    POLL_INTERVAL = 100 # ms between progress refreshes while a backup runs
+
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
@@ -21,7 +27,15 @@ class BackupManagerPage(Frame):
         self.src_path = StringVar()
         self.dst_path = StringVar()
         self.compress = BooleanVar()
+        self.incremental = BooleanVar()
+        self.snapshot = BooleanVar()
+        self.verify = BooleanVar()
+        self.pack_small = BooleanVar()
+        self.zip_mode = StringVar(value="full")
+        self.rate_limit = StringVar() # MiB/s (or with a K/M/G suffix); blank = unlimited
         self.status_var = StringVar(value="Ready")
+        self.detail_var = StringVar() # Phase, MiB done, throughput and ETA while running
+        self.worker = None # BackupWorker of the run in progress
         # Build UI
         self._build_layout()
 
@@ -50,24 +64,41 @@ class BackupManagerPage(Frame):
         # --- Options ---
         options_frame = LabelFrame(self, text="Options", padx=10, pady=5)
         options_frame.pack(fill="x", padx=10, pady=5)
-        Checkbutton(options_frame, text="Compress to ZIP", variable=self.compress).pack(anchor="w")
+        zip_row = Frame(options_frame)
+        zip_row.pack(anchor="w")
+        Checkbutton(zip_row, text="Compress to ZIP", variable=self.compress).pack(side="left")
+        Label(zip_row, text="ZIP mode:").pack(side="left", padx=(10, 2))
+        OptionMenu(zip_row, self.zip_mode, "full", "differential", "incremental").pack(side="left")
+        Checkbutton(options_frame, text="Incremental mirror (copy changed files only)", variable=self.incremental).pack(anchor="w")
+        Checkbutton(options_frame, text="Hard-link snapshots (unchanged files share storage)", variable=self.snapshot).pack(anchor="w")
+        Checkbutton(options_frame, text="Verify backup after copying (rehash destination)", variable=self.verify).pack(anchor="w")
+        Checkbutton(options_frame, text="Pack small files into bundles (mirror mode, faster on slow links)", variable=self.pack_small).pack(anchor="w")
+        limit_row = Frame(options_frame)
+        limit_row.pack(anchor="w")
+        Label(limit_row, text="Bandwidth limit (MiB/s, blank = unlimited):").pack(side="left")
+        Entry(limit_row, textvariable=self.rate_limit, width=8).pack(side="left", padx=5)
+        Button(limit_row, text="Apply", command=self._apply_rate_limit).pack(side="left")
         # --- Progress and Status ---
         progress_frame = Frame(self)
         progress_frame.pack(pady=(10, 0))
         self.progress = Progressbar(progress_frame, length=500, mode="determinate")
         self.progress.pack()
+        Label(progress_frame, textvariable=self.detail_var, font=("Helvetica", 9)).pack()
         Label(self, textvariable=self.status_var, font=("Helvetica", 10, "italic")).pack(pady=(2, 10))
-        # --- Start Button ---
-        self.start_btn = Button(self, text="Start Backup", command=self._start_backup, state=DISABLED)
-        self.start_btn.pack(pady=5)
+        # --- Start / Pause / Cancel Buttons ---
+        button_row = Frame(self)
+        button_row.pack(pady=5)
+        self.start_btn = Button(button_row, text="Start Backup", command=self._start_backup, state=DISABLED)
+        self.start_btn.pack(side="left", padx=5)
+        self.pause_btn = Button(button_row, text="Pause", width=8, command=self._toggle_pause, state=DISABLED)
+        self.pause_btn.pack(side="left", padx=5)
+        self.cancel_btn = Button(button_row, text="Cancel", width=8, command=self._cancel_backup, state=DISABLED)
+        self.cancel_btn.pack(side="left", padx=5)
         # Log output
         log_frame = LabelFrame(self, text="Backup Log", padx=10, pady=5)
         log_frame.pack(fill="both", expand=True, padx=10, pady=(10, 5))
-        self.log_text = Text(log_frame, height=12, width=80, state=DISABLED, wrap="word")
-        self.log_text.pack(side="left", fill="both", expand=True)
-        scroll = Scrollbar(log_frame, command=self.log_text.yview)
-        scroll.pack(side="right", fill="y")
-        self.log_text.config(yscrollcommand=scroll.set)
+        self.log_pane = LogPane(log_frame, height=12, width=80)
+        self.log_pane.pack(fill="both", expand=True)
 
     def _bind_validation_events(self, widget): 
         # Bind validation events to all children of the specified widget
@@ -89,7 +120,7 @@ class BackupManagerPage(Frame):
     def _validate_paths(self, *_):
         src = self.src_path.get().strip()
         dst = self.dst_path.get().strip()
-        if not (src and dst):
+        if not (src and dst) or self.worker:
             self.start_btn.config(state=DISABLED)
             return
         valid_src = BackupJob.validate_source_path(src)
@@ -100,31 +131,125 @@ class BackupManagerPage(Frame):
         src = self.src_path.get().strip()
         dst = self.dst_path.get().strip()
         compress = self.compress.get()
+        incremental = self.incremental.get()
+        snapshot = self.snapshot.get()
+        verify = self.verify.get()
+        zip_mode = self.zip_mode.get()
         self.progress['value'] = 0
-        self.status_var.set("Backup in progress...")
-        self.update()
-        def update_progress(current, total):
-            pct = int((current/total) * 100)
-            self.progress['value'] = pct
-            self.update_idletasks()
         try:
+            bytes_per_second = self._rate_limit()
+            # Log lines reach this page through the shared logger, so no log_callback here
             job = BackupJob(
                 src=src,
                 dest=dst,
                 compress=compress,
-                log_callback=self._log
+                incremental=incremental,
+                snapshot=snapshot,
+                zip_mode=zip_mode,
+                verify_after=verify,
+                bytes_per_second=bytes_per_second,
+                pack_small_files=self.pack_small.get() or None,
             )
-            job.run(progress_callback=update_progress)
+        except Exception as e:
+            self.logger.error(f"Backup failed: {e}")
+            self.status_var.set("Backup failed.")
+            return
+        self.status_var.set("Backup in progress...")
+        self.worker = BackupWorker(job)
+        self.worker.start()
+        self._set_running(True)
+        self.after(BackupManagerPage.POLL_INTERVAL, self._poll_worker)
+
+    def _poll_worker(self):
+        # The worker only records progress; the widgets are refreshed here, a few times a second
+        stats = self.worker.job.stats.progress()
+        if stats and stats["fraction"] is not None:
+            # Byte-weighted where the phase knows its size, so large files move the bar as they copy
+            self.progress['value'] = int(stats["fraction"] * 100)
+            self.detail_var.set(self._describe(stats))
+        else:
+            done, total = self.worker.progress
+            if total:
+                self.progress['value'] = int((done / total) * 100)
+        for event, value in self.worker.drain():
+            self._finish_backup(event, value)
+            return
+        self.after(BackupManagerPage.POLL_INTERVAL, self._poll_worker)
+
+    @staticmethod
+    def _describe(stats):
+        phase = stats["phase"].capitalize()
+        if stats["by"] != "bytes":
+            rate = f" at {stats['rate']:.0f} files/s" if stats["rate"] else ""
+            return f"{phase}: {stats['files_done']}/{stats['files']} files{rate}, ETA {format_eta(stats['eta'])}"
+        mib = 1024 * 1024
+        rate = f" at {stats['rate'] / mib:.1f} MiB/s" if stats["rate"] else ""
+        return (f"{phase}: {stats['bytes_done'] / mib:.1f}/{stats['bytes'] / mib:.1f} MiB{rate}, "
+                f"ETA {format_eta(stats['eta'])}")
+
+    def _finish_backup(self, event, value):
+        job = self.worker.job
+        self.worker = None
+        self.detail_var.set("")
+        self._set_running(False)
+        if event == "done" and value:
             self.logger.info("Backup complete.")
             self.status_var.set("Backup complete.")
             self.progress['value'] = 100
-        except Exception as e:
-            self.logger.error(f"Backup failed: {e}")
+        elif event == "done":
+            self.logger.warning(f"Backup completed with {len(job.errors)} file error(s).")
+            self.status_var.set("Backup completed with errors.")
+            self.progress['value'] = 100
+        elif event == "cancelled":
+            self.status_var.set("Backup cancelled.")
+        else:
+            self.logger.error(f"Backup failed: {value}")
             self.status_var.set("Backup failed.")
             self.progress['value'] = 0
+        self._validate_paths()
+
+    def _toggle_pause(self):
+        if not self.worker:
+            return
+        if self.worker.paused:
+            self.worker.resume()
+            self.pause_btn.config(text="Pause")
+            self.status_var.set("Backup in progress...")
+        else:
+            self.worker.pause()
+            self.pause_btn.config(text="Resume")
+            self.status_var.set("Backup paused.")
+
+    def _cancel_backup(self):
+        if not self.worker:
+            return
+        self.worker.cancel()
+        self.cancel_btn.config(state=DISABLED)
+        self.pause_btn.config(state=DISABLED)
+        self.status_var.set("Cancelling after the files in progress...")
+
+    def _rate_limit(self):
+        """Bytes per second from the limit field; a bare number is MiB/s."""
+        text = self.rate_limit.get().strip()
+        if text and text.replace(".", "", 1).isdigit():
+            text += "M"
+        return parse_rate(text or None)
+
+    def _apply_rate_limit(self):
+        # Takes effect on the running backup at once (and on the next one started)
+        try:
+            bytes_per_second = self._rate_limit()
+        except ValueError as e:
+            self.logger.error(str(e))
+            return
+        if self.worker:
+            self.worker.job.throttle.set_limits(bytes_per_second=bytes_per_second)
+            self.logger.info(f"Throttle changed to {self.worker.job.throttle.describe()}.")
+
+    def _set_running(self, running):
+        self.start_btn.config(state=DISABLED if running else NORMAL)
+        self.pause_btn.config(state=NORMAL if running else DISABLED, text="Pause")
+        self.cancel_btn.config(state=NORMAL if running else DISABLED)
 
     def _log(self, msg, level="info"):
-        self.log_text.config(state=NORMAL)
-        self.log_text.insert(END, msg+"\n")
-        self.log_text.see(END)
-        self.log_text.config(state=DISABLED)
\ No newline at end of file
+        self.log_pane.append(msg)
\ No newline at end of file
@@ -1,17 +1,24 @@
 from src.gui.nas_credential_prompt import NasCredentialPrompt
 from src.utils.network_drive import NetworkDrive
+from src.utils.drive_status import DriveStatusService
 from src.utils.logger import setup_logger
+from src.gui.log_pane import LogPane
 from tkinter import (
-    Frame, LabelFrame, Label, Listbox, Button, Scrollbar, StringVar, Text,
-    END, SINGLE, DISABLED, NORMAL,
+    Frame, LabelFrame, Label, Listbox, Button, Scrollbar, StringVar,
+    END, SINGLE,
     messagebox
 )
 
 class DriveManagerPage(Frame):
+    POLL_INTERVAL = 200 # ms between checks for a finished drive status refresh
+
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
         self.status = StringVar(value="Ready")
+        self.drive_status = DriveStatusService()
+        self.drives = [] # Entries shown in the list, in order
+        self._shown_generation = 0
         #self.logger = setup_logger("backup_app", self._log)
         self.logger = controller.logger
         Label(
@@ -38,32 +45,49 @@ class DriveManagerPage(Frame):
         Button(btn_row, text="Map New Drive", width=18, command=self._map_new).pack(side="left", padx=5)
         Button(btn_row, text="Unmap Selected", width=18, command=self._unmap_selected).pack(side="left", padx=5)
         Button(btn_row, text="Reconnect Selected", width=18, command=self._reconnect_selected).pack(side="left", padx=5)
+        Button(btn_row, text="Refresh", width=10, command=lambda: self._refresh_drive_list(force=True)).pack(side="left", padx=5)
         # --- Log Panel ---
         log_frame = LabelFrame(self, text="Drive Manager Log", padx=10, pady=5)
         log_frame.pack(fill="both", expand=True, padx=10, pady=5)
-        self.log_text = Text(log_frame, height=10, width=80, state=DISABLED, wrap="word")
-        self.log_text.pack(side="left", fill="both", expand=True)
-        scroll = Scrollbar(log_frame, command=self.log_text.yview)
-        scroll.pack(side="right", fill="y")
-        self.log_text.config(yscrollcommand=scroll.set)
-        # Refresh view
+        self.log_pane = LogPane(log_frame, height=10, width=80)
+        self.log_pane.pack(fill="both", expand=True)
+        # Refresh view (in the background; the list fills in when `net use` answers)
         self._refresh_drive_list()
+        self.after(self.POLL_INTERVAL, self._poll_drive_status)
     
-    def _refresh_drive_list(self):
+    def _refresh_drive_list(self, force=False):
+        if self.drive_status.refresh(force=force):
+            self._set_status("Checking mapped drives...", "neutral")
+
+    def _poll_drive_status(self):
+        if self.drive_status.generation != self._shown_generation:
+            self._shown_generation = self.drive_status.generation
+            self._show_drives(self.drive_status.snapshot())
+        elif self.winfo_ismapped():
+            self.drive_status.refresh() # No-op while the cache is fresh
+        self.after(self.POLL_INTERVAL, self._poll_drive_status)
+
+    def _show_drives(self, drives):
+        self.drives = drives
         self.drive_list.delete(0, END)
-        drives = NetworkDrive.list_mapped()
-        for d in drives:
+        for index, d in enumerate(drives):
             entry = f"{d['drive']} -> {d['remote']} -> {d['status']}"
+            if d.get('reachable') is False:
+                entry += " (unreachable)"
             self.drive_list.insert(END, entry)
-            index = self.drive_list.size() - 1
             # Set color based on status
-            if d['status'] == 'OK':
+            if d.get('reachable') is False:
+                self.drive_list.itemconfig(index, {'fg': 'red'})
+            elif d['status'] == 'OK':
                 self.drive_list.itemconfig(index, {'fg': 'green'})
             elif d['status'] == 'DISCONNECTED' or d['status'] == 'Disconnected':
                 self.drive_list.itemconfig(index, {'fg': 'gray'})
             else:
                 self.drive_list.itemconfig(index, {'fg': 'red'})
-        self._set_status(f"{len(drives)} drive(s) mapped.", "neutral")
+        if self.drive_status.error:
+            self._set_status(f"Could not list drives: {self.drive_status.error}", "error")
+        else:
+            self._set_status(f"{len(drives)} drive(s) mapped.", "neutral")
     
     def _map_new(self):
         cred = NasCredentialPrompt(self).result
@@ -74,7 +98,7 @@ class DriveManagerPage(Frame):
                 self.logger.info(f"Mapped {drive}.")
                 self._set_status(f"Mapped {drive.drive_letter}: -> {drive.unc_path}", "success")
                 messagebox.showinfo("Success", f"Mapped to {drive.drive_letter}:")
-                self._refresh_drive_list()
+                self._refresh_drive_list(force=True)
             else:
                 self.logger.error(f"Failed to map {drive}")
                 self._set_status("Mapping failed.", "error")
@@ -92,7 +116,7 @@ class DriveManagerPage(Frame):
             if success:
                 self.logger.info(f"Unmapped {drive}")
                 self._set_status(f"Unmapped {drive.drive_letter}:", "success")
-                self._refresh_drive_list()
+                self._refresh_drive_list(force=True)
             else:
                 self.logger.error(f"Failed to unmap {drive}")
                 self._set_status("Unmap failed.", "error")
@@ -102,11 +126,8 @@ class DriveManagerPage(Frame):
         selected = self.drive_list.curselection()
         if not selected:
             return
-        entry = self.drive_list.get(selected[0])
-        parts = entry.split("->")
-        if len(parts) >= 2:
-            mapping = parts[:2]
-            drive = NetworkDrive.from_mapping(mapping)
+        if selected[0] < len(self.drives):
+            drive = NetworkDrive.from_mapping(self.drives[selected[0]])
             cred = NasCredentialPrompt(self).result
             if cred:
                 success = drive.reconnect(username=cred.get('user'), password=cred.get('password'))
@@ -114,7 +135,7 @@ class DriveManagerPage(Frame):
                     self._log(f"Reconnected {drive}")
                     self._set_status(f"Reconnected {drive.drive_letter}:", "success")
                     messagebox.showinfo("Success", f"Reconnected {drive}")
-                    self._refresh_drive_list()
+                    self._refresh_drive_list(force=True)
                 else:
                     self._log(f"Reconnect failed for {drive}", level="error")
                     self._set_status("Reconnect failed.", "error")
@@ -130,7 +151,4 @@ class DriveManagerPage(Frame):
         self.status_label.config(fg=color)
 
     def _log(self, msg, level="info"):
-        self.log_text.config(state=NORMAL)
-        self.log_text.insert(END, f"{msg}\n")
-        self.log_text.see(END)
-        self.log_text.config(state=DISABLED)
\ No newline at end of file
+        self.log_pane.append(msg)
\ No newline at end of file
@@ -0,0 +1,37 @@
+from collections import deque
+from tkinter import Frame, Text, Scrollbar, END, DISABLED, NORMAL
+
+class LogPane(Frame):
+    """
+    Read-only log display backed by a ring buffer of the newest `max_lines` lines.
+    Older lines are dropped from the buffer and the widget alike, so a long run
+    can't grow the Text widget (and every redraw of it) without limit.
+    """
+    MAX_LINES = 2000
+
+    def __init__(self, parent, height=12, width=80, max_lines=MAX_LINES):
+        super().__init__(parent)
+        self.lines = deque(maxlen=max_lines)
+        self.text = Text(self, height=height, width=width, state=DISABLED, wrap="word")
+        self.text.pack(side="left", fill="both", expand=True)
+        scroll = Scrollbar(self, command=self.text.yview)
+        scroll.pack(side="right", fill="y")
+        self.text.config(yscrollcommand=scroll.set)
+
+    def append(self, msg):
+        """Add one or more newline-separated lines; one widget update per call."""
+        self.lines.extend(msg.split("\n"))
+        self.text.config(state=NORMAL)
+        self.text.insert(END, msg + "\n")
+        # The widget ends with an empty line after the final newline
+        excess = int(self.text.index("end-1c").split(".")[0]) - 1 - self.lines.maxlen
+        if excess > 0:
+            self.text.delete("1.0", f"{excess + 1}.0")
+        self.text.see(END)
+        self.text.config(state=DISABLED)
+
+    def clear(self):
+        self.lines.clear()
+        self.text.config(state=NORMAL)
+        self.text.delete("1.0", END)
+        self.text.config(state=DISABLED)
@@ -1,24 +1,92 @@
 import os
+import re
+import json
+import time
 import shutil
-import zipfile
+import threading
 from datetime import datetime
 from src.utils.logger import setup_logger
+from src.utils.manifest import Manifest
+from src.utils.snapshot import SnapshotStore
+from src.utils.copy_engine import CopyEngine, copy_with_hash
+from src.utils.fast_copy import default_backend
+from src.utils.verifier import Verifier, VerifyResult
+from src.utils.scanner import scan, rescan
+from src.utils.zip_writer import ParallelZipWriter
+from src.utils.journal import RunJournal
+from src.utils.compression_policy import CompressionPolicy
+from src.utils.zip_chain import ZipChain
+from src.utils.throttle import Throttle
+from src.utils.retention import RetentionManager, RetentionPolicy, check_free_space, parse_size
+from src.utils.move_detector import MoveDetector
+from src.utils.pack import PackWriter, PackReader, PACK_DIR
+from src.utils.run_stats import RunStats, RunReporting, format_eta
+from src.utils.restore import RestoreIndex, Restorer
+from src.utils.watcher import ChangeJournal, journal_path
+from src.utils.filters import FileFilter
 
-class BackupJob:
-    def __init__(self, src, dest, compress=False, log_callback=None):
+class BackupCancelled(Exception):
+    """Raised out of BackupJob.run() after cancel(). Interrupted runs resume from their journal."""
+
+class BackupJob(RunReporting):
+    MAX_REPORTED_ERRORS = 50 # Per-file errors written to the log before summarising
+    SUMMARY_INTERVAL = 5.0 # Seconds between INFO progress summaries; per-file lines are DEBUG
+
+    def __init__(self, src, dest, compress=False, log_callback=None, incremental=False, use_hash=False,
+                 snapshot=False, keep_snapshots=None, workers=CopyEngine.DEFAULT_WORKERS,
+                 compress_workers=None, compression_policy=None, zip_mode="full", checksums=True,
+                 verify_after=False, name=None, bytes_per_second=None, files_per_second=None,
+                 throttle_schedule=None, throttle=None, copy_backend=None, retention=None, min_free_space=None,
+                 pack_small_files=None, report=True, report_dir=None, watch=False, watch_dir=None, filters=None):
         self.logger = setup_logger("backup_app")
+        self.name = name # Prefixes log lines when several jobs share one log
         self.src = src
         self.dest = dest
         self.compress = compress
+        self.incremental = incremental
+        self.use_hash = use_hash
+        self.snapshot = snapshot
+        self.keep_snapshots = keep_snapshots
+        self.workers = workers
+        self.compress_workers = compress_workers # None = one per CPU core
+        self.compression_policy = compression_policy or CompressionPolicy()
+        self.zip_mode = zip_mode # "full" (one archive per day), "differential" or "incremental"
+        self.checksums = checksums # Hash every file as it is written and keep the hashes with the backup
+        self.verify_after = verify_after # Rehash the destination once the run is done
+        self.copy_backend = copy_backend or default_backend() # Reflink / copy_file_range / sparse-aware copies
+        self.retention = RetentionPolicy.from_value(retention) # GFS pruning of this job's old backups, run alongside the backup
+        self.min_free_space = min_free_space # Bytes, "50G" or "10%" that must stay free; checked before a run starts
+        # Mirror mode: files below this size ("64K", or True for the default) go into bundles under <mirror>/.packs
+        self.pack_threshold = PackWriter.DEFAULT_THRESHOLD if pack_small_files is True else parse_size(pack_small_files)
+        # Include/exclude rules and size/age limits for the source; excluded folders are never listed
+        self.file_filter = FileFilter.from_value(filters)
+        self.errors = [] # [(path, error), ...] from the last run
+        self.compression = None # ZipWriteResult of the last run, in ZIP modes
+        self.stats = RunStats() # Phases, throughput, latencies and progress of the current (or last) run
+        self.report = report # Write a JSON run report next to the log when a run ends
+        self.report_dir = report_dir # Defaults to the log folder
+        self.report_path = None # Report of the last run
+        # Incremental mode: list only the folders a Watcher (watch.py) recorded as changed since the last run
+        self.watch = watch
+        self.watch_dir = watch_dir # The watcher's journal folder, if not the default
         self.timestamp = datetime.now().strftime("%Y-%m-%d")
         self.log = self._build_logger_proxy(log_callback)
+        self._cancelled = threading.Event()
+        self._unpaused = threading.Event()
+        self._unpaused.set()
+        # Paces copies and archive writes; `throttle` is a shared parent, e.g. the destination's.
+        # Adjust while running with job.throttle.set_limits(bytes_per_second=..., files_per_second=...)
+        self.throttle = Throttle(
+            bytes_per_second, files_per_second, parent=throttle, schedule=throttle_schedule,
+            cancelled=self._cancelled,
+        )
 
     # --- Magic Methods ---
     def __str__(self):
-        return f"BackupJob: {self.src} -> {self.dest} (compress={self.compress})"
+        return f"BackupJob: {self.src} -> {self.dest} (compress={self.compress}, incremental={self.incremental})"
     
     def __repr__(self):
-        return f"BackupJob(src='{self.src}', dest='{self.dest}', compress={self.compress})"
+        return f"BackupJob(src='{self.src}', dest='{self.dest}', compress={self.compress}, incremental={self.incremental})"
 
     # --- Properties with validation ---
     @property
@@ -50,17 +118,195 @@ class BackupJob:
 
     # --- Public method ---
     def run(self, progress_callback=None):
+        """
+        Returns True if every file was backed up, False if some files failed (see `errors`).
+        Raises BackupCancelled if cancel() is called while it runs.
+        """
+        self.errors = []
+        self.compression = None
+        self.stats = RunStats()
+        if self.file_filter:
+            self.file_filter.reset()
+        self.copy_backend.reset()
+        self._cancelled.clear()
+        progress_callback = self._controlled(progress_callback)
+        if self.throttle.active:
+            self.log(f"Throttled to {self.throttle.describe()}.")
+        retention = self._retention_manager()
+        free_before = None
+        finished = False
+        status, error = "failed", None
         try:
-            if self.compress:
+            free_before = self._check_free_space(retention)
+            if self.retention:
+                retention.start() # Old backups go while this one is written
+            if self.compress and self.zip_mode != "full":
+                self._zip_chain_backup(progress_callback)
+            elif self.compress:
                 self._zip_backup(progress_callback)
+            elif self.snapshot:
+                self._snapshot_backup(progress_callback)
+            elif self.incremental:
+                self._incremental_backup(progress_callback)
             else:
                 self._full_backup(progress_callback)
-            return True
+            copied_by = self.copy_backend.summary()
+            if copied_by:
+                self.log(f"Copy methods: {copied_by}.")
+            if self.verify_after:
+                self.verify(progress_callback)
+            finished = True
+            status = "errors" if self.errors else "ok"
+            if self.errors:
+                self.log(f"Backup finished with {len(self.errors)} file error(s).", level="warning")
+            return not self.errors
+        except BackupCancelled:
+            status = "cancelled"
+            self.log("Backup cancelled. Running it again resumes where it stopped.", level="warning")
+            raise
         except Exception as e:
+            error = str(e)
             self.log(f"Backup failed: {e}", level="error")
             raise
+        finally:
+            if retention:
+                self._finish_retention(retention, free_before if finished else None)
+            self.stats.finished = time.time()
+            if self.report:
+                self._write_report(status, error)
+
+    # --- Run control (safe to call from any thread) ---
+    def cancel(self):
+        """Stop the run at the next file boundary; files in flight are finished first."""
+        self._cancelled.set()
+        self._unpaused.set() # A paused run has to wake up to notice
+
+    def pause(self):
+        self._unpaused.clear()
+
+    def resume(self):
+        self._unpaused.set()
+
+    @property
+    def paused(self):
+        return not self._unpaused.is_set()
+
+    def prune_snapshots(self, keep_last, dry_run=False):
+        """Drop all but the newest `keep_last` hard-link snapshots. Returns (removed, reclaimed_bytes)."""
+        removed, reclaimed = self._snapshot_store().prune(keep_last, dry_run=dry_run, log=self.log)
+        self.log(f"Snapshot prune: {len(removed)} removed, {reclaimed / (1024 * 1024):.1f} MiB reclaimed.")
+        return removed, reclaimed
+
+    def verify(self, progress_callback=None):
+        """
+        Rehash the newest backup of this job's mode against the hashes recorded when it was written.
+        Only the destination is read. Returns a VerifyResult; failures are also added to `errors`.
+        """
+        with self.stats.phase("verify", files=0, counted=False):
+            result = self._verify(progress_callback)
+        problems = result.problems()
+        self.errors.extend(problems)
+        for path, error in problems[:BackupJob.MAX_REPORTED_ERRORS]:
+            self.log(f"Verification failed for {path}: {error}", level="error")
+        self.log(
+            f"Verification {'passed' if result.ok else 'FAILED'}: {result.checked} files checked, "
+            f"{len(result.mismatches)} mismatched, {len(result.missing)} missing, "
+            f"{result.unhashed} without a recorded hash."
+        )
+        return result
+
+    def restore_zip_chain(self, target_dir, as_of=None, progress_callback=None):
+        """Rebuild this job's source as of `as_of` (datetime or ISO string) from its ZIP chain."""
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        chain = ZipChain(self.dest, folder_name)
+        restored = chain.restore(target_dir, as_of, progress_callback, log=self.log)
+        self.log(f"Restored {restored} files to: {target_dir}")
+        return restored
+
+    def restore_packed(self, target_dir, rel_paths=None, mirror=None, progress_callback=None):
+        """
+        Extract files packed by a mirror run into `target_dir`: all of them, or only `rel_paths`
+        (files or folders). `mirror` defaults to this job's mirror; pass an archived one instead.
+        Returns the number of files restored; failures are added to `errors`.
+        """
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        reader = PackReader(os.path.join(mirror or os.path.join(self.dest, folder_name), PACK_DIR))
+        if not len(reader):
+            raise FileNotFoundError(f"No packed files in {reader.pack_dir}")
+        result = reader.extract(target_dir, rel_paths, self.workers, progress_callback)
+        self._report_file_errors(result, "restore")
+        self.log(f"Restored {result.copied} packed files to: {target_dir}")
+        return result.copied
+
+    def locate(self, rel_path, as_of=None):
+        """
+        Where `rel_path` (relative to the source) was backed up as of `as_of` (datetime, date or
+        ISO string; default newest), from the local restore index. Returns a FileVersion or None.
+        """
+        with self._restore_index() as index:
+            return index.locate(rel_path, as_of)
+
+    def restore(self, target_dir, paths=None, as_of=None, progress_callback=None):
+        """
+        Restore files or folders (`paths`, relative to the source; everything if None) as they were
+        at `as_of` into `target_dir`, from whichever mirror, snapshot, archive or ZIP holds them.
+        Returns the number of files restored; failures are added to `errors`.
+        """
+        with self._restore_index() as index:
+            versions = index.select(paths, as_of)
+        if not versions:
+            raise FileNotFoundError(f"Nothing to restore for {paths or 'the whole source'} as of {as_of or 'now'}")
+        backups = sorted({version.source for version in versions.values()})
+        self.log(f"Restoring {len(versions)} files as of {as_of or 'now'} from {len(backups)} backup(s) to: {target_dir}")
+        restorer = Restorer(self.dest, self.workers, self.copy_backend)
+        result = restorer.extract(list(versions.values()), target_dir, progress_callback)
+        self._report_file_errors(result, "restore")
+        self.log(f"Restored {result.copied} files to: {target_dir}")
+        return result.copied
 
     # --- Internal methods ---
+    def _restore_index(self):
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        index = RestoreIndex(self.dest, folder_name, log=self.log)
+        index.refresh()
+        return index
+
+    def _verify(self, progress_callback):
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        verifier = Verifier(self.workers)
+        result = VerifyResult()
+        if self.compress and self.zip_mode != "full":
+            chain = ZipChain(self.dest, folder_name)
+            newest = chain.find()
+            if newest is None:
+                raise FileNotFoundError(f"No ZIP chain for '{folder_name}' in {self.dest}")
+            for archive in chain.resolve(newest):
+                self.log(f"Verifying archive: {archive['file']}")
+                result.extend(verifier.verify_zip(chain.path(archive['file']), chain.hashes(archive['file']), progress_callback))
+        elif self.compress:
+            zip_name = self._latest_zip(folder_name)
+            if zip_name is None:
+                raise FileNotFoundError(f"No ZIP archive for '{folder_name}' in {self.dest}")
+            self.log(f"Verifying archive: {zip_name}")
+            hashes = {arcname: entry['hash'] for arcname, entry in Manifest.load(self._zip_manifest_path(zip_name)).entries.items()}
+            result = verifier.verify_zip(os.path.join(self.dest, zip_name), hashes, progress_callback)
+        elif self.snapshot:
+            store = self._snapshot_store()
+            snapshot = store.latest()
+            if snapshot is None:
+                raise FileNotFoundError(f"No snapshot for '{folder_name}' in {store.backups_dir}")
+            self.log(f"Verifying snapshot: {store.path(snapshot)}")
+            result = verifier.verify_tree(store.path(snapshot), Manifest.load(store.manifest_path(snapshot)), progress_callback)
+        else:
+            target_path = os.path.join(self.dest, folder_name)
+            self.log(f"Verifying mirror: {target_path}")
+            result = verifier.verify_tree(target_path, Manifest.load(self._manifest_path(folder_name)), progress_callback)
+            pack_dir = os.path.join(target_path, PACK_DIR)
+            if os.path.isdir(pack_dir):
+                self.log(f"Verifying packed files: {pack_dir}")
+                result.extend(verifier.verify_pack(PackReader(pack_dir), progress_callback))
+        return result
+
     def _zip_backup(self, progress_callback=None):
         folder_name = os.path.basename(os.path.normpath(self.src))
         zip_name = f"{folder_name}_{self.timestamp}.zip"
@@ -68,72 +314,637 @@ class BackupJob:
         if os.path.exists(zip_path):
             self.log(f"ZIP archive already exists: {zip_path}. Skipping backup.")
             return
-        total_files = sum(len(files) for _, _, files in os.walk(self.src))
-        processed = 0
+        index = self._scan(self.src)
+        journal = RunJournal(self._journal_path(folder_name), key=f"zip:{zip_name}")
         self.log(f"Creating ZIP archive: {zip_path}")
         try:
-            with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-                for root, _, files in os.walk(self.src):
-                    for file in files:
-                        abs_path = os.path.join(root, file)
-                        arcname = os.path.relpath(abs_path, self.src)
-                        zipf.write(abs_path, arcname)
-                        self.log(f"Added {arcname}")
-                        processed += 1
-                        if progress_callback:
-                            progress_callback(processed, total_files)
-            self.log("ZIP archive completed.")
+            result = self._write_zip(zip_path, index, journal, progress_callback)
+        except BackupCancelled:
+            raise
+        except Exception as e:
+            self.log(f"ZIP backup failed: {e}", level="error")
+            raise RuntimeError(f"Backup failed: {e}")
+        # Hashes live next to the archive, so the archive itself stays a plain copy of the source
+        manifest = Manifest(self._zip_manifest_path(zip_name))
+        for rel_path, size, mtime, _ in index:
+            arcname = ZipChain.arcname(rel_path)
+            if arcname in result.hashes:
+                manifest.set(arcname, size, mtime, result.hashes[arcname])
+        manifest.save()
+        self._report_file_errors(result, "add")
+        self.compression = result
+        self._log_compression_summary(result)
+        self.log("ZIP archive completed.")
+
+    def _zip_chain_backup(self, progress_callback=None):
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        chain = ZipChain(self.dest, folder_name)
+        index = self._scan(self.src)
+        archive_type, changed, deleted = chain.plan(index, self.zip_mode)
+        if archive_type != "full" and not len(changed) and not deleted:
+            self.log("No changes since the last archive. Skipping backup.")
+            return
+        created = datetime.now()
+        journal = RunJournal(self._journal_path(folder_name), key=f"zip-chain:{archive_type}")
+        committed = journal.open(archive=chain.archive_name(archive_type, created), created=created.isoformat())
+        if journal.resumed:
+            # Continue the interrupted archive under its original name and time
+            created = datetime.fromisoformat(journal.header["created"])
+        zip_path = chain.path(journal.header["archive"])
+        self.log(
+            f"Creating {archive_type} ZIP archive: {zip_path} "
+            f"({len(changed)} changed, {len(deleted)} deleted)"
+        )
+
+        def extras(result):
+            added = [(rel_path, size, mtime, result.hashes[ZipChain.arcname(rel_path)])
+                     for rel_path, size, mtime, _ in changed if ZipChain.arcname(rel_path) in result.hashes]
+            return [(ZipChain.MANIFEST_MEMBER, chain.manifest_member(archive_type, created, added, deleted))]
+
+        try:
+            result = self._write_zip(zip_path, changed, journal, progress_callback, extras, committed)
+            # Failed files stay out of the recorded state so the next run picks them up again
+            failed = {src_file for src_file, _ in result.errors}
+            state = [(rel_path, size, mtime) for rel_path, size, mtime, _ in index
+                     if index.abspath(rel_path) not in failed]
+            chain.commit(os.path.basename(zip_path), archive_type, created, state)
+        except BackupCancelled:
+            raise
         except Exception as e:
             self.log(f"ZIP backup failed: {e}", level="error")
             raise RuntimeError(f"Backup failed: {e}")
+        self._report_file_errors(result, "add")
+        self.compression = result
+        self._log_compression_summary(result)
+        self.log("ZIP archive completed.")
 
     def _full_backup(self, progress_callback=None):
         folder_name = os.path.basename(os.path.normpath(self.src))
         target_path = os.path.join(self.dest, folder_name)
+        journal = RunJournal(self._journal_path(folder_name), key=f"mirror:{self.timestamp}")
+        committed = journal.open()
+        manifest = Manifest(self._manifest_path(folder_name))
+        if journal.resumed:
+            # The mirror in place is the interrupted copy itself, not a previous backup
+            self.log(f"Resuming interrupted backup: {len(committed)} files already copied.")
+            for rel_path, entry in committed.items():
+                if 'b' not in entry: # Packed files are listed in their bundle's index instead
+                    manifest.set(rel_path, entry['s'], entry['m'], entry.get('h'))
         # Handle existing folder
-        if os.path.exists(target_path):
+        elif os.path.exists(target_path):
             backups_dir = os.path.join(self.dest, "backups")
             os.makedirs(backups_dir, exist_ok=True)
             archived_name = f"{folder_name}_{self.timestamp}"
             archived_path = os.path.join(backups_dir, archived_name)
             if os.path.exists(archived_path):
+                journal.close()
                 self.log(f"An archive for today already exists: {archived_path}. Skipping backup.")
                 return
             self.log(f"Archiving existing backup to: {archived_path}")
             try:
-                shutil.move(target_path, archived_path)
+                with self.stats.phase("archive"):
+                    self._move_to_archive(target_path, archived_path, self.copy_backend)
             except Exception as e:
+                journal.close()
                 self.log(f"Failed to archive existing backup: {e}", level="error")
                 raise RuntimeError(f"Backup failed: {e}")
         # Copy new
         self.log(f"Copying new backup to: {target_path}")
         try:
-            total_files = sum(len(files) for _, _, files in os.walk(self.src))
-            processed = 0
-            os.makedirs(target_path, exist_ok=True)
-            for root, dirs, files in os.walk(self.src):
-                rel_root = os.path.relpath(root, self.src)
-                target_root = os.path.join(target_path, rel_root)
-                os.makedirs(target_root, exist_ok=True)
-                for file in files:
-                    src_file = os.path.join(root, file)
-                    dst_file = os.path.join(target_root, file)
-                    shutil.copy2(src_file, dst_file) # Method preserving metadata
-                    processed += 1
-                    if progress_callback:
-                        progress_callback(processed, total_files)
-            self.log("Copy complete.")
+            index = self._scan(self.src)
+            remaining = index.subset(lambda rel_path, size, mtime, _: not self._is_committed(committed, rel_path, size, mtime))
+            packed = None
+            if self.pack_threshold:
+                packed = remaining.subset(lambda rel_path, size, mtime, _: size < self.pack_threshold)
+                remaining = remaining.subset(lambda rel_path, size, mtime, _: size >= self.pack_threshold)
+                with self.stats.phase("pack", files=len(packed), bytes=packed.total_bytes):
+                    packed_result = self._pack_files(packed, target_path, journal, progress_callback, len(remaining))
+
+            def on_copied(src_file, dst_file, rel_path, size, mtime, file_hash):
+                manifest.set(rel_path, size, mtime, file_hash)
+                journal.record(rel_path, s=size, m=mtime, h=file_hash)
+
+            copy_progress = progress_callback
+            if packed is not None and progress_callback:
+                copy_progress = lambda done, total: progress_callback(len(packed) + done, len(packed) + total)
+            with self.stats.phase("copy", files=len(remaining), bytes=remaining.total_bytes,
+                                  files_offset=len(packed) if packed is not None else 0):
+                result = self._copy_engine().copy_index(remaining, target_path, copy_progress, on_copied)
+            if packed is not None:
+                result.errors.extend(packed_result.errors)
+            # Describes the new mirror, so a later incremental run or verify can start from it
+            manifest.save()
+        except BackupCancelled:
+            journal.close(complete=False)
+            raise
         except Exception as e:
+            journal.close(complete=False)
             self.log(f"Backup failed during copy: {e}", level="error")
             raise RuntimeError(f"Backup failed: {e}")
+        journal.close()
+        self._report_file_errors(result)
+        self.log("Copy complete.")
     
-    def _build_logger_proxy(self, log_callback):
-        def log(msg, level="info"):
-            getattr(self.logger, level)(msg)
-            if log_callback:
-                log_callback(msg)
-        return log
-    
+    def _incremental_backup(self, progress_callback=None):
+        """
+        Mirror only what changed since the last run, as recorded in the destination manifest.
+        Replaced and vanished files are moved to backups/<name>_<date>/ instead of the whole tree.
+        """
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        target_path = os.path.join(self.dest, folder_name)
+        archived_path = os.path.join(self.dest, "backups", f"{folder_name}_{self.timestamp}")
+        manifest = Manifest.load(self._manifest_path(folder_name))
+        if not len(manifest) and os.path.isdir(target_path):
+            self.log(f"No manifest found. Indexing existing mirror: {target_path}")
+            self._seed_manifest(manifest, target_path)
+        journal = RunJournal(self._journal_path(folder_name), key="incremental")
+        committed = journal.open()
+        if journal.resumed:
+            # Files copied by the interrupted run are already in place; only the manifest missed them
+            self.log(f"Resuming interrupted backup: {len(committed)} files already copied.")
+            for rel_path, entry in committed.items():
+                manifest.set(rel_path, entry['s'], entry['m'], entry.get('h'))
+        change_journal = ChangeJournal(journal_path(self.src, self.watch_dir)) if self.watch else None
+        mark = change_journal.mark() if change_journal else None # Before scanning: later changes are the next run's
+        self.log(f"Scanning source for changes: {self.src}")
+        try:
+            if change_journal:
+                index, pruned = self._scan_changes(change_journal, manifest, folder_name)
+            else:
+                index, pruned = self._scan(self.src), None
+            total_files = len(index)
+            # Renamed and moved files become renames in the mirror, before anything is copied
+            with self.stats.phase("moves"):
+                self._apply_moves(index, manifest, target_path, journal)
+            os.makedirs(target_path, exist_ok=True)
+            for rel_dir in index.subdirs:
+                os.makedirs(os.path.join(target_path, rel_dir), exist_ok=True)
+            to_copy = []
+            current = set()
+            for rel_path, size, mtime, _ in index:
+                current.add(rel_path)
+                if not manifest.is_changed(rel_path, size, mtime):
+                    continue
+                src_file = os.path.join(self.src, rel_path)
+                dst_file = os.path.join(target_path, rel_path)
+                if os.path.exists(dst_file):
+                    if self.use_hash:
+                        # Same content with a touched mtime: refresh the manifest, skip the copy
+                        entry = manifest.get(rel_path)
+                        file_hash = Manifest.file_hash(src_file)
+                        if entry and entry['size'] == size and entry.get('hash') == file_hash:
+                            shutil.copystat(src_file, dst_file)
+                            manifest.set(rel_path, size, mtime, file_hash)
+                            continue
+                    self._archive_file(dst_file, os.path.join(archived_path, rel_path))
+                to_copy.append((src_file, dst_file, rel_path, size, mtime))
+            unchanged = total_files - len(to_copy)
+
+            def on_copied(src_file, dst_file, rel_path, size, mtime, file_hash):
+                manifest.set(rel_path, size, mtime, file_hash)
+                journal.record(rel_path, s=size, m=mtime, h=file_hash)
+                self.log(f"Updated {rel_path}", level="debug")
+
+            def copy_progress(done, _):
+                progress_callback(unchanged + done, total_files)
+
+            copy_function = self._copy_and_hash if self.use_hash or self.checksums else self._copy_file
+            with self.stats.phase("copy", files=len(to_copy), bytes=sum(item[3] for item in to_copy), files_offset=unchanged):
+                result = self._copy_engine(copy_function).copy_files(
+                    to_copy, copy_progress if progress_callback else None, on_copied
+                )
+            if progress_callback and not to_copy:
+                progress_callback(total_files, total_files)
+            # Archive what vanished from the source
+            removed = [rel_path for rel_path in manifest.entries if rel_path not in current]
+            for rel_path in removed:
+                dst_file = os.path.join(target_path, rel_path)
+                if os.path.exists(dst_file):
+                    self._archive_file(dst_file, os.path.join(archived_path, rel_path))
+                manifest.remove(rel_path)
+            self._prune_empty_dirs(target_path, index.subdirs, pruned)
+            manifest.save()
+            if change_journal:
+                self._save_watch_mark(folder_name, mark)
+        except BackupCancelled:
+            journal.close(complete=False)
+            raise
+        except Exception as e:
+            journal.close(complete=False)
+            self.log(f"Backup failed during incremental copy: {e}", level="error")
+            raise RuntimeError(f"Backup failed: {e}")
+        journal.close()
+        self._report_file_errors(result)
+        self.log(
+            f"Incremental backup complete: {result.copied} copied, "
+            f"{unchanged} unchanged, {len(removed)} removed."
+        )
+
+    def _snapshot_backup(self, progress_callback=None):
+        store = self._snapshot_store()
+        snapshot = f"{store.name}_{self.timestamp}"
+        journal_path = self._journal_path(snapshot)
+        if snapshot in store.list() and not os.path.exists(journal_path):
+            self.log(f"A snapshot for today already exists: {store.path(snapshot)}. Skipping backup.")
+            return
+        journal = RunJournal(journal_path, key=f"snapshot:{snapshot}")
+        committed = journal.open()
+        if journal.resumed:
+            self.log(f"Resuming interrupted snapshot: {len(committed)} files already in place.")
+        self.log(f"Creating snapshot: {store.path(snapshot)}")
+        try:
+            index = self._scan(self.src)
+            previous = store.latest(before=snapshot)
+            with self.stats.phase("moves"):
+                moves = MoveDetector(self.workers).detect(index, Manifest.load(store.manifest_path(previous))) if previous else {}
+            if moves:
+                self.log(f"Detected {len(moves)} moved or renamed files; linking them to their old path.")
+            with self.stats.phase("copy", files=len(index)):
+                result, linked = store.create(
+                    index, self.timestamp, progress_callback, log=self.log, copy_engine=self._copy_engine(),
+                    completed=committed, moves=moves,
+                    on_committed=lambda rel_path, size, mtime, file_hash: journal.record(rel_path, s=size, m=mtime, h=file_hash),
+                    on_planned=lambda files, size: self.stats.set_totals(bytes=size),
+                )
+        except BackupCancelled:
+            journal.close(complete=False)
+            raise
+        except Exception as e:
+            journal.close(complete=False)
+            self.log(f"Backup failed during snapshot: {e}", level="error")
+            raise RuntimeError(f"Backup failed: {e}")
+        journal.close()
+        self._report_file_errors(result)
+        self.log(f"Snapshot complete: {result.copied} copied, {linked} hard-linked.")
+        if self.keep_snapshots:
+            self.prune_snapshots(self.keep_snapshots)
+
+    def _apply_moves(self, index, manifest, target_path, journal):
+        """
+        Rename files (and whole directories) that moved in the source to their new place in
+        `target_path`, updating `manifest` and `journal` as if they had been copied there.
+        """
+        moves = MoveDetector(self.workers).detect(index, manifest)
+        if not moves:
+            return
+        renamed_dirs = []
+        for old_dir, new_dir in MoveDetector.directory_moves(moves, manifest, index.subdirs):
+            old_path, new_path = os.path.join(target_path, old_dir), os.path.join(target_path, new_dir)
+            if not os.path.isdir(old_path) or os.path.exists(new_path):
+                continue
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.rename(old_path, new_path)
+            renamed_dirs.append(old_dir + os.sep)
+            self.log(f"Renamed folder {old_dir} -> {new_dir}", level="debug")
+        renamed = 0
+        for new_rel, (old_rel, file_hash) in moves.items():
+            old_file, new_file = os.path.join(target_path, old_rel), os.path.join(target_path, new_rel)
+            if not old_rel.startswith(tuple(renamed_dirs)): # Not already moved with its folder
+                if not os.path.isfile(old_file) or os.path.lexists(new_file):
+                    continue # Gone from the mirror, or something is in the way; it will be copied
+                os.makedirs(os.path.dirname(new_file), exist_ok=True)
+                os.rename(old_file, new_file)
+                self.log(f"Moved {old_rel} -> {new_rel}", level="debug")
+            entry = manifest.remove(old_rel)
+            manifest.set(new_rel, entry['size'], entry['mtime'], file_hash)
+            journal.record(new_rel, s=entry['size'], m=entry['mtime'], h=file_hash)
+            renamed += 1
+        self.log(f"Detected {renamed} moved or renamed files ({len(renamed_dirs)} whole folders); renamed instead of copied.")
+
+    def _pack_files(self, packed, target_path, journal, progress_callback, still_to_copy):
+        """Write the files of `packed` into bundles under <target_path>/.packs, journaling each bundle."""
+        writer = PackWriter(
+            os.path.join(target_path, PACK_DIR), workers=self.workers,
+            algorithm=Manifest.HASH_ALGORITHM if self.checksums else None, throttle=self.throttle,
+            progress=self.stats.add_bytes,
+        )
+        self.log(f"Packing {len(packed)} files under {self.pack_threshold // 1024} KiB into bundles.")
+        sizes = {}
+        for rel_path, size, mtime, _ in packed:
+            sizes[rel_path] = (size, mtime)
+
+        def on_packed(bundle, entries):
+            for rel_path, entry in entries.items():
+                size, mtime = sizes[rel_path]
+                journal.record(rel_path, s=size, m=mtime, h=entry.get("h"), b=bundle)
+            self.log(f"Packed {len(entries)} files into {bundle}", level="debug")
+
+        progress = None
+        if progress_callback:
+            progress = lambda done, total: progress_callback(done, total + still_to_copy)
+        result = writer.write_index(packed, progress, on_packed)
+        self.log(f"Packed {result.copied} files into bundles in {writer.pack_dir}.")
+        return result
+
+    def _snapshot_store(self):
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        return SnapshotStore(os.path.join(self.dest, "backups"), folder_name)
+
+    def _scan(self, root):
+        started = time.monotonic()
+        with self.stats.phase("scan"):
+            index = scan(root, on_listed=self.stats.dir_listed, file_filter=self.file_filter)
+        self._log_scan(index, started)
+        return index
+
+    def _scan_changes(self, change_journal, manifest, folder_name):
+        """
+        Index of the source for a watched incremental run: the manifest, with the folders the
+        watcher recorded since the last run (and those with errors then) listed again.
+        Falls back to a full scan when the journal cannot vouch for everything in between.
+        Returns (index, pruned) as scanner.rescan() does; pruned is None after a full scan.
+        """
+        saved = self._load_watch_mark(folder_name)
+        dirty, reason = change_journal.changes(saved) if len(manifest) else (None, "no earlier backup")
+        if dirty is not None and saved.get("filters") != self._filter_config():
+            dirty, reason = None, "the filters changed"
+        if dirty is None:
+            self.log(f"Scanning the whole source: {reason}.")
+            return self._scan(self.src), None
+        for rel_dir in saved.get("retry", ()):
+            dirty.setdefault(rel_dir, False)
+        started = time.monotonic()
+        with self.stats.phase("scan"):
+            previous = [(rel_path, entry['size'], entry['mtime']) for rel_path, entry in manifest.entries.items()]
+            index, pruned = rescan(self.src, previous, dirty, on_listed=self.stats.dir_listed, file_filter=self.file_filter)
+        self._log_scan(index, started, f"; listed {len(dirty)} changed folder(s) only")
+        return index, pruned
+
+    def _log_scan(self, index, started, detail=""):
+        self.log(
+            f"Scanned {len(index)} files ({index.total_bytes / (1024 * 1024):.1f} MiB) "
+            f"in {time.monotonic() - started:.1f}s{detail}."
+        )
+        if self.file_filter:
+            skipped = self.file_filter.to_dict()
+            self.log(
+                f"Filters skipped {skipped['skipped_files']} files ({skipped['skipped_bytes'] / (1024 * 1024):.1f} MiB) "
+                f"and {skipped['pruned_dirs']} folders."
+            )
+        self.errors.extend(index.errors)
+        for path, error in index.errors[:BackupJob.MAX_REPORTED_ERRORS]:
+            self.log(f"Could not read {path}: {error}", level="warning")
+
+    def _log_compression_summary(self, result):
+        mib = 1024 * 1024
+        for name, stats in sorted(result.methods.items()):
+            self.log(
+                f"  {name}: {stats['files']} files, {stats['bytes_in'] / mib:.1f} MiB -> "
+                f"{stats['bytes_out'] / mib:.1f} MiB, {stats['cpu_seconds']:.1f}s CPU"
+            )
+        self.log(
+            f"Compression saved {(result.bytes_in - result.bytes_out) / mib:.1f} MiB. "
+            f"Policy stored {result.policy_stored_bytes / mib:.1f} MiB of incompressible data "
+            f"(~{result.estimated_cpu_saved(self.compression_policy.default[1]):.1f}s CPU saved)."
+        )
+
+    def _controlled(self, progress_callback):
+        """
+        Wrap a progress callback so every finished file is a pause/cancel point, and the
+        log gets a progress summary every SUMMARY_INTERVAL instead of a line per file.
+        """
+        last_summary = time.monotonic()
+
+        def progress(done, total):
+            nonlocal last_summary
+            self._unpaused.wait()
+            if self._cancelled.is_set():
+                raise BackupCancelled("Backup cancelled")
+            self.stats.files_progress(done, total)
+            now = time.monotonic()
+            if now - last_summary >= BackupJob.SUMMARY_INTERVAL:
+                last_summary = now
+                self.log(f"Progress: {done}/{total} files{self._describe_progress()}")
+            if progress_callback:
+                progress_callback(done, total)
+        return progress
+
+    def _describe_progress(self):
+        """" (30%), 1228.8/4096.0 MiB at 45.0 MiB/s, ETA 1m05s" for the running phase."""
+        progress = self.stats.progress()
+        if not progress or progress["fraction"] is None:
+            return ""
+        if progress["by"] != "bytes":
+            return f" ({progress['fraction'] * 100:.0f}%), ETA {format_eta(progress['eta'])}"
+        mib = 1024 * 1024
+        rate = f" at {progress['rate'] / mib:.1f} MiB/s" if progress["rate"] else ""
+        return (
+            f" ({progress['fraction'] * 100:.0f}%), {progress['bytes_done'] / mib:.1f}/{progress['bytes'] / mib:.1f} MiB"
+            f"{rate}, ETA {format_eta(progress['eta'])}"
+        )
+
+    def _retention_manager(self):
+        if not (self.retention or self.min_free_space):
+            return None
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        return RetentionManager(self.dest, folder_name, self.retention, log=self.log, cancelled=self._cancelled)
+
+    def _check_free_space(self, retention):
+        """
+        Refuse to start if the run would leave less than min_free_space free, counting on
+        about as much space as the last run took and on what pruning will free.
+        Returns the free bytes before the run.
+        """
+        if self.min_free_space:
+            needed = retention.last_run_bytes or 0
+            try:
+                check_free_space(self.dest, self.min_free_space, needed)
+            except RuntimeError:
+                reclaim = retention.estimated_reclaim() if self.retention else 0
+                if not reclaim:
+                    raise
+                check_free_space(self.dest, self.min_free_space, needed - reclaim)
+        return shutil.disk_usage(self.dest).free
+
+    def _finish_retention(self, retention, free_before):
+        """Wait for the prune, then record the space this run took (if it finished)."""
+        with self.stats.phase("retention"):
+            result = retention.wait() if self.retention else None
+        if free_before is None:
+            return
+        reclaimed = result.reclaimed_bytes if result else 0
+        retention.record_run(free_before - shutil.disk_usage(self.dest).free + reclaimed)
+
+    def _report_details(self):
+        return {
+            "workers": self.workers,
+            "throttle": self.throttle.describe() if self.throttle.active else None,
+            "copy_methods": dict(self.copy_backend.stats),
+            "compression": self.compression.to_dict(self.compression_policy.default[1]) if self.compression else None,
+        }
+
+    def _mode_name(self):
+        if self.compress:
+            return "zip" if self.zip_mode == "full" else f"zip-{self.zip_mode}"
+        return "snapshot" if self.snapshot else "incremental" if self.incremental else "mirror"
+
+    def _copy_engine(self, copy_function=None):
+        return CopyEngine(
+            self.workers, copy_function or (self._copy_and_hash if self.checksums else self._copy_file), stats=self.stats,
+        )
+
+    def _report_file_errors(self, result, action="copy"):
+        self.errors.extend(result.errors)
+        for src_file, error in result.errors[:BackupJob.MAX_REPORTED_ERRORS]:
+            self.log(f"Failed to {action} {src_file}: {error}", level="error")
+        hidden = len(result.errors) - BackupJob.MAX_REPORTED_ERRORS
+        if hidden > 0:
+            self.log(f"... and {hidden} more {action} error(s).", level="error")
+
+    @staticmethod
+    def _copy(src_file, dst_file, copy_function=shutil.copy2): # Method preserving metadata
+        # Copy under a temporary name and rename, so an interrupted copy never looks finished
+        part_file = f"{dst_file}.part"
+        try:
+            value = copy_function(src_file, part_file)
+            os.replace(part_file, dst_file)
+        except BaseException:
+            if os.path.exists(part_file):
+                os.remove(part_file)
+            raise
+        return value
+
+    def _copy_file(self, src_file, dst_file):
+        self.throttle.consume_file()
+        return self._copy(src_file, dst_file, lambda src, dst: self.copy_backend.copy(
+            src, dst, throttle=self.throttle, progress=self.stats.add_bytes,
+        ))
+
+    def _copy_and_hash(self, src_file, dst_file):
+        # Hashes the data as it is written (or cloned) instead of reading the copy back
+        self.throttle.consume_file()
+        return self._copy(src_file, dst_file, lambda src, dst: copy_with_hash(
+            src, dst, throttle=self.throttle, backend=self.copy_backend, progress=self.stats.add_bytes,
+        ))
+
+    def _write_zip(self, zip_path, index, journal, progress_callback=None, extras=None, committed=None):
+        """
+        Write `index` to `zip_path` through `<zip_path>.part`, journaling every committed member.
+        An interrupted attempt recorded in `journal` is continued rather than rebuilt.
+        """
+        part_path = f"{zip_path}.part"
+        writer = ParallelZipWriter(
+            part_path, workers=self.compress_workers, policy=self.compression_policy,
+            hash_algorithm=Manifest.HASH_ALGORITHM if self.checksums else None, throttle=self.throttle,
+            progress=self.stats.add_bytes, stats=self.stats,
+        )
+        journal.before_flush = writer.sync
+        if committed is None:
+            committed = journal.open()
+        resume = self._zip_resume_point(part_path, index, committed) if journal.resumed else []
+        if resume:
+            self.log(f"Resuming interrupted archive: {len(resume)} files already committed.")
+            done = {arcname for arcname, _ in resume}
+            index = index.subset(lambda rel_path, size, mtime, _: ZipChain.arcname(rel_path) not in done)
+        self.log(f"Compressing {len(index)} files with {writer.workers} threads.")
+        try:
+            with self.stats.phase("compress", files=len(index), bytes=index.total_bytes):
+                result = writer.write_index(
+                    index, progress_callback,
+                    on_added=lambda arcname: self.log(f"Added {arcname}", level="debug"),
+                    extras=extras,
+                    resume=resume,
+                    on_committed=lambda arcname, entry: journal.record(arcname, **entry),
+                )
+        except Exception:
+            journal.close(complete=False)
+            raise
+        journal.close()
+        os.replace(part_path, zip_path)
+        return result
+
+    @staticmethod
+    def _zip_resume_point(part_path, index, committed):
+        """Members of an interrupted archive that can be kept: unchanged since and fully on disk."""
+        if not os.path.exists(part_path):
+            return []
+        part_size = os.path.getsize(part_path)
+        current = {ZipChain.arcname(rel_path): (size, mtime) for rel_path, size, mtime, _ in index}
+        keep = [
+            (arcname, entry) for arcname, entry in committed.items()
+            if current.get(arcname) == (entry["s"], entry["m"]) and entry["e"] <= part_size
+        ]
+        return sorted(keep, key=lambda item: item[1]["o"])
+
+    def _zip_manifest_path(self, zip_name):
+        return os.path.join(self.dest, f".{zip_name}.manifest.json")
+
+    def _latest_zip(self, folder_name):
+        """Newest daily archive of `folder_name` in the destination, or None."""
+        pattern = re.compile(rf"^{re.escape(folder_name)}_\d{{4}}-\d{{2}}-\d{{2}}\.zip$")
+        archives = sorted(entry for entry in os.listdir(self.dest) if pattern.match(entry))
+        return archives[-1] if archives else None
+
+    def _journal_path(self, folder_name):
+        return os.path.join(self.dest, f".{folder_name}.journal")
+
+    @staticmethod
+    def _is_committed(committed, rel_path, size, mtime):
+        entry = committed.get(rel_path)
+        return entry is not None and entry["s"] == size and entry["m"] == mtime
+
+    def _manifest_path(self, folder_name):
+        return os.path.join(self.dest, f".{folder_name}.manifest.json")
+
+    def _watch_mark_path(self, folder_name):
+        return os.path.join(self.dest, f".{folder_name}.watch.json")
+
+    def _load_watch_mark(self, folder_name):
+        try:
+            with open(self._watch_mark_path(folder_name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save_watch_mark(self, folder_name, mark):
+        """Keep where the change journal stood before this run's scan, and the folders to retry."""
+        path = self._watch_mark_path(folder_name)
+        if mark is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        retry = {os.path.dirname(os.path.relpath(error_path, self.src)) for error_path, _ in self.errors}
+        if self.file_filter:
+            retry.update(self.file_filter.deferred) # Files too new to back up yet
+        retry = sorted(rel_dir for rel_dir in retry if not rel_dir.startswith(".."))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dict(mark, retry=retry, filters=self._filter_config()), f)
+
+    def _filter_config(self):
+        return self.file_filter.config() if self.file_filter else None
+
+    def _seed_manifest(self, manifest, target_path):
+        # copy2 preserves mtimes, so an existing mirror describes the source it was copied from
+        for rel_path, size, mtime, _ in scan(target_path):
+            manifest.set(rel_path, size, mtime)
+
+
+    def _archive_file(self, path, archived_file):
+        # Keep the oldest version if this file was already archived today
+        if os.path.exists(archived_file):
+            os.remove(path)
+            return
+        with self.stats.phase("archive"):
+            self._move_to_archive(path, archived_file, self.copy_backend)
+
+    @staticmethod
+    def _move_to_archive(path, archived_path, copy_backend):
+        """Move a file or a previous mirror under backups/ (also used by fan-out mirrors)."""
+        os.makedirs(os.path.dirname(archived_path), exist_ok=True)
+        # A rename on the same filesystem; across filesystems the backend can clone or keep holes
+        shutil.move(path, archived_path, copy_function=copy_backend.copy)
+
+    @staticmethod
+    def _prune_empty_dirs(target_path, source_dirs, within=None):
+        """Remove empty mirror folders the source no longer has; only below `within` (rel_dirs) if given."""
+        keep = set(source_dirs)
+        tops = [target_path] if within is None else [os.path.join(target_path, rel_dir) for rel_dir in within]
+        for top in tops:
+            for current, _, _ in os.walk(top, topdown=False):
+                rel_root = os.path.relpath(current, target_path)
+                if rel_root != "." and rel_root not in keep and not os.listdir(current):
+                    os.rmdir(current)
+
     # --- Utility methods ---
     @staticmethod
     def validate_destination_path(path:str)->bool:
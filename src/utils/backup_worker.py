@@ -0,0 +1,64 @@
+import queue
+import threading
+from src.utils.backup_job import BackupCancelled
+
+class BackupWorker:
+    """
+    Runs a BackupJob on a background thread so the caller (the Tk event loop) never blocks.
+    Progress is kept as the latest (done, total) pair rather than queued per file, so a
+    100k-file run costs the owner one read per poll. The outcome arrives on `events`:
+        ("done", ok)        run finished; ok is False if some files failed
+        ("cancelled", None) cancel() stopped the run
+        ("failed", error)   run aborted with an exception
+    """
+    def __init__(self, job):
+        self.job = job
+        self.events = queue.SimpleQueue()
+        self.progress = (0, 0) # (done, total) of the current phase
+        self._thread = threading.Thread(target=self._run, name="backup-worker", daemon=True)
+
+    def __repr__(self):
+        return f"BackupWorker(job={self.job!r}, alive={self.is_alive()})"
+
+    # --- Control ---
+    def start(self):
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread.is_alive()
+
+    def cancel(self):
+        self.job.cancel()
+
+    def pause(self):
+        self.job.pause()
+
+    def resume(self):
+        self.job.resume()
+
+    @property
+    def paused(self):
+        return self.job.paused
+
+    def drain(self):
+        """All events queued since the last call, oldest first."""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    # --- Internal ---
+    def _run(self):
+        try:
+            ok = self.job.run(progress_callback=self._progress)
+        except BackupCancelled:
+            self.events.put(("cancelled", None))
+        except Exception as e:
+            self.events.put(("failed", e))
+        else:
+            self.events.put(("done", ok))
+
+    def _progress(self, done, total):
+        self.progress = (done, total)
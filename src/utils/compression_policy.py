@@ -0,0 +1,102 @@
+import os
+import bz2
+import zlib
+import zipfile
+
+class CompressionPolicy:
+    """
+    Chooses a ZIP compression method per file. Formats that are already compressed are
+    stored as-is; anything unknown is judged by deflating a small sample of its first block.
+
+    Methods are given as "stored", "deflate", "bzip2" or "lzma", optionally with a level
+    ("deflate:9", "bzip2:5"). Example:
+        CompressionPolicy(default="deflate:6", rules={".log": "lzma", ".bak": "stored"})
+    Windows Explorer only opens STORED and DEFLATE members; use BZIP2/LZMA for archives
+    that are restored with Python or 7-Zip.
+    """
+    METHODS = {
+        "stored": zipfile.ZIP_STORED,
+        "deflate": zipfile.ZIP_DEFLATED,
+        "bzip2": zipfile.ZIP_BZIP2,
+        "lzma": zipfile.ZIP_LZMA,
+    }
+    STORED_EXTENSIONS = {
+        # Images / audio / video
+        ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".mp3", ".aac", ".ogg", ".flac",
+        ".mp4", ".m4v", ".mov", ".avi", ".mkv", ".wmv", ".webm",
+        # Archives and packages
+        ".zip", ".7z", ".rar", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".cab", ".msi", ".jar",
+        # Office Open XML / OpenDocument are ZIP containers, PDFs are mostly deflated streams
+        ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".pdf",
+    }
+    SAMPLE_SIZE = 64 * 1024 # Bytes deflated to judge an unknown file
+    MIN_SAVING = 0.10 # Store files whose sample shrinks by less than this
+
+    def __init__(self, default="deflate", rules=None, stored_extensions=None,
+                 sample_size=SAMPLE_SIZE, min_saving=MIN_SAVING):
+        self.default = self.parse_method(default)
+        self.rules = {ext.lower(): self.parse_method(method) for ext, method in (rules or {}).items()}
+        self.stored_extensions = {ext.lower() for ext in (stored_extensions or CompressionPolicy.STORED_EXTENSIONS)}
+        self.sample_size = sample_size
+        self.min_saving = min_saving
+
+    def __repr__(self):
+        return f"CompressionPolicy(default={self.method_name(self.default)!r}, rules={len(self.rules)})"
+
+    # --- Decisions ---
+    def by_name(self, arcname):
+        """Method decided from the file name alone, or None if the content must be sampled."""
+        ext = os.path.splitext(arcname)[1].lower()
+        if ext in self.rules:
+            return self.rules[ext]
+        if ext in self.stored_extensions:
+            return self.stored()
+        if self.default[0] == zipfile.ZIP_STORED or not self.sample_size:
+            return self.default
+        return None
+
+    def by_sample(self, sample):
+        """Method decided from the first block of the file."""
+        if len(sample) < 512: # Too small to judge, and too small to matter
+            return self.default
+        compressed = zlib.compress(sample[:self.sample_size], 1)
+        if len(compressed) > len(sample[:self.sample_size]) * (1 - self.min_saving):
+            return self.stored()
+        return self.default
+
+    # --- Helpers ---
+    @staticmethod
+    def stored():
+        return (zipfile.ZIP_STORED, None)
+
+    @staticmethod
+    def parse_method(method):
+        if isinstance(method, tuple):
+            return method
+        name, _, level = str(method).lower().partition(":")
+        if name not in CompressionPolicy.METHODS:
+            raise ValueError(f"Unknown compression method: '{method}'")
+        return (CompressionPolicy.METHODS[name], int(level) if level else None)
+
+    @staticmethod
+    def method_name(method):
+        compress_type, level = method
+        name = {v: k for k, v in CompressionPolicy.METHODS.items()}[compress_type]
+        return f"{name}:{level}" if level is not None else name
+
+    @staticmethod
+    def is_chunkable(method):
+        """DEFLATE and STORED data can be produced in independent chunks; BZIP2 and LZMA cannot."""
+        return method[0] in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+
+    @staticmethod
+    def compressor(method):
+        """A streaming compressor for a whole member, or None for STORED."""
+        compress_type, level = method
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED, -15)
+        if compress_type == zipfile.ZIP_BZIP2:
+            return bz2.BZ2Compressor(9 if level is None else level)
+        if compress_type == zipfile.ZIP_LZMA:
+            return zipfile.LZMACompressor()
+        return None
@@ -0,0 +1,118 @@
+import os
+import time
+import shutil
+import hashlib
+from src.utils.scanner import scan
+from src.utils.manifest import Manifest
+from src.utils.fast_copy import shared_backend
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+def copy_with_hash(src_file, dst_file, algorithm=None, throttle=None, backend=None, progress=None):
+    """
+    Copy like shutil.copy2, hashing each block from the same buffer that is written,
+    so the data is read once. Returns the hex digest of the copied content.
+    With a `throttle`, every block is paid for before it is written. `backend` (a
+    fast_copy.CopyBackend) may clone the file instead and hash the source as it reads it.
+    `progress(amount)` is told about the bytes as they are written.
+    """
+    hasher = hashlib.new(algorithm or Manifest.HASH_ALGORITHM)
+    (backend or shared_backend()).copy(src_file, dst_file, hasher, throttle, progress)
+    return hasher.hexdigest()
+
+def copy_throttled(src_file, dst_file, throttle, backend=None):
+    """Copy like shutil.copy2 at the pace `throttle` allows."""
+    (backend or shared_backend()).copy(src_file, dst_file, throttle=throttle)
+
+class CopyResult:
+    def __init__(self):
+        self.copied = 0
+        self.errors = [] # [(src_file, error), ...]
+
+    def __repr__(self):
+        return f"CopyResult(copied={self.copied}, errors={len(self.errors)})"
+
+    @property
+    def ok(self):
+        return not self.errors
+
+class CopyEngine:
+    """
+    Copies files on a pool of worker threads. Copying is I/O bound, so threads keep
+    a high-latency link (SMB/NAS) busy while each worker waits on its own round trips.
+    Directories are created before any worker starts, failures are collected per file,
+    and callbacks always run on the calling thread. With `stats` (a RunStats), every file's
+    copy time is recorded.
+    """
+    DEFAULT_WORKERS = 8
+    QUEUE_DEPTH = 4 # In-flight files per worker
+
+    def __init__(self, workers=DEFAULT_WORKERS, copy_function=shutil.copy2, stats=None):
+        self.workers = max(1, int(workers))
+        self.copy_function = copy_function
+        self.stats = stats
+
+    def __repr__(self):
+        return f"CopyEngine(workers={self.workers})"
+
+    def copy_tree(self, src, dst, progress_callback=None, on_copied=None):
+        """Mirror every file under `src` into `dst`."""
+        return self.copy_index(scan(src), dst, progress_callback, on_copied)
+
+    def copy_index(self, index, dst, progress_callback=None, on_copied=None):
+        """
+        Mirror every file in a FileIndex into `dst`, without listing the source again.
+        `on_copied(src_file, dst_file, rel_path, size, mtime, value)` runs after each file.
+        """
+        os.makedirs(dst, exist_ok=True)
+        for rel_dir in index.subdirs:
+            os.makedirs(os.path.join(dst, rel_dir), exist_ok=True)
+        pairs = (
+            (index.abspath(rel_path), os.path.join(dst, rel_path), rel_path, size, mtime)
+            for rel_path, size, mtime, _ in index
+        )
+        return self.copy_files(pairs, progress_callback, on_copied, total=len(index))
+
+    def copy_files(self, pairs, progress_callback=None, on_copied=None, total=None):
+        """
+        Copy (src_file, dst_file, *extra) tuples. Destination directories must already exist.
+        `pairs` may be a generator if `total` is given.
+        `on_copied(src_file, dst_file, *extra, value)` receives whatever `copy_function` returned.
+        Copy times are recorded with the size from `extra` when it is (rel_path, size, ...).
+        """
+        result = CopyResult()
+        total = len(pairs) if total is None else total
+        processed = 0
+        pending = {}
+        items = iter(pairs)
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="copy") as pool:
+            while True:
+                # Keep a bounded window of work queued so huge trees don't allocate a future per file up front
+                for pair in items:
+                    future = pool.submit(self._timed, pair[0], pair[1])
+                    pending[future] = pair
+                    if len(pending) >= self.workers * CopyEngine.QUEUE_DEPTH:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pair = pending.pop(future)
+                    try:
+                        value, seconds = future.result()
+                    except Exception as e:
+                        result.errors.append((pair[0], e))
+                    else:
+                        result.copied += 1
+                        if self.stats:
+                            self.stats.file_done(pair[0], pair[3] if len(pair) > 3 else None, seconds)
+                        if on_copied:
+                            on_copied(*pair, value)
+                    processed += 1
+                    if progress_callback:
+                        progress_callback(processed, total)
+        return result
+
+    def _timed(self, src_file, dst_file):
+        started = time.perf_counter()
+        value = self.copy_function(src_file, dst_file)
+        return value, time.perf_counter() - started
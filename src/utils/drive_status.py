@@ -0,0 +1,119 @@
+import time
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.network_drive import NetworkDrive, run_command
+from src.utils.logger import setup_logger
+
+class DriveStatusService:
+    """
+    Keeps the list of mapped drives in memory and refreshes it off the caller's thread.
+    `net use` can take seconds when a server is gone, so the GUI reads snapshot() (never
+    blocks) and asks for refresh(), which runs `net use` on a background thread and then
+    probes every server in parallel with a short TCP connect to its SMB port. Each entry
+    of the snapshot is a list_mapped() dict plus:
+        'host'       server name from the UNC path (None if it has none)
+        'reachable'  True/False from the probe, None if the host wasn't probed
+    `generation` goes up after every refresh, so a Tk page can poll it with after()
+    instead of being called back from a worker thread. on_update(snapshot), if given,
+    is called on the refresh thread.
+    """
+    DEFAULT_TTL = 30.0 # Seconds before refresh() re-runs `net use`
+    PROBE_TIMEOUT = 1.0 # Seconds per connect attempt
+    PROBE_PORTS = (445, 139) # SMB, then NetBIOS session service
+    MAX_PROBES = 8
+
+    def __init__(self, runner=None, ttl=DEFAULT_TTL, probe_timeout=PROBE_TIMEOUT, ports=PROBE_PORTS,
+                 on_update=None):
+        self.runner = runner or run_command
+        self.ttl = ttl
+        self.probe_timeout = probe_timeout
+        self.ports = tuple(ports)
+        self.on_update = on_update
+        self.generation = 0
+        self.refreshed_at = None # time.monotonic() of the last finished refresh
+        self.error = None # Message of the last failed refresh
+        self.logger = setup_logger("backup_app")
+        self._drives = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def __repr__(self):
+        return f"DriveStatusService(drives={len(self._drives)}, generation={self.generation}, ttl={self.ttl})"
+
+    # --- Public methods ---
+    def snapshot(self):
+        """Copy of the cached entries; empty until the first refresh finishes."""
+        with self._lock:
+            return [dict(d) for d in self._drives]
+
+    def is_stale(self):
+        return self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.ttl
+
+    def is_refreshing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def refresh(self, force=False):
+        """
+        Start a background refresh unless one is running or the cache is still fresh
+        (force=True ignores the TTL, e.g. after mapping a drive). Returns at once;
+        True if a refresh was started.
+        """
+        with self._lock:
+            if self.is_refreshing() or not (force or self.is_stale()):
+                return False
+            self._thread = threading.Thread(target=self.refresh_now, name="drive-status", daemon=True)
+            self._thread.start()
+            return True
+
+    def refresh_now(self):
+        """Refresh on the calling thread and return the new snapshot."""
+        started = time.monotonic()
+        try:
+            result = self.runner(["net", "use"], NetworkDrive.NET_TIMEOUT)
+            drives = NetworkDrive.parse_net_use(result.stdout)
+            self.error = None
+        except Exception as e:
+            self.logger.error(f"Failed to list mapped drives: {e}")
+            self.error = str(e)
+            drives = self.snapshot() # Keep showing the last known list
+        hosts = {NetworkDrive.host_of(d["remote"]) for d in drives} - {None}
+        reachable = self.probe_hosts(hosts)
+        for d in drives:
+            d["host"] = NetworkDrive.host_of(d["remote"])
+            d["reachable"] = reachable.get(d["host"])
+        with self._lock:
+            self._drives = drives
+            self.refreshed_at = time.monotonic()
+            self.generation += 1
+        down = sorted(host for host, up in reachable.items() if not up)
+        self.logger.debug(f"Drive status: {len(drives)} drive(s), {len(hosts)} host(s) probed in "
+                          f"{time.monotonic() - started:.2f}s" + (f", unreachable: {', '.join(down)}" if down else ""))
+        snapshot = self.snapshot()
+        if self.on_update:
+            self.on_update(snapshot)
+        return snapshot
+
+    def probe_hosts(self, hosts):
+        """{host: reachable} for every host, probed in parallel."""
+        hosts = list(hosts)
+        if not hosts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(hosts), self.MAX_PROBES), thread_name_prefix="probe") as pool:
+            return dict(zip(hosts, pool.map(self.probe, hosts)))
+
+    def probe(self, host):
+        """True if a TCP connection to any of the SMB ports opens within probe_timeout."""
+        for port in self.ports:
+            try:
+                with socket.create_connection((host, port), timeout=self.probe_timeout):
+                    return True
+            except OSError:
+                continue
+        return False
+
+    def wait(self, timeout=None):
+        """Block until the running refresh (if any) finishes. For scripts and shutdown."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
@@ -0,0 +1,562 @@
+import os
+import time
+import zlib
+import queue
+import shutil
+import hashlib
+import zipfile
+import threading
+from datetime import datetime
+from src.utils.logger import setup_logger
+from src.utils.manifest import Manifest
+from src.utils.journal import RunJournal
+from src.utils.scanner import scan
+from src.utils.filters import FileFilter
+from src.utils.run_stats import RunStats, RunReporting
+from src.utils.fast_copy import default_backend
+from src.utils.verifier import Verifier, VerifyResult
+from src.utils.compression_policy import CompressionPolicy
+from src.utils.zip_chain import ZipChain
+from src.utils.zip_writer import zip_info, begin_member, end_member, ZipWriteResult
+from src.utils.backup_job import BackupJob, BackupCancelled
+
+class TargetResult:
+    """What one destination of a fan-out run got."""
+    def __init__(self, dest, mode):
+        self.dest = dest
+        self.mode = mode
+        self.path = None # Mirror folder or ZIP archive written
+        self.status = "pending" # pending, ok, errors (some files failed), failed, skipped, cancelled
+        self.copied = 0
+        self.bytes = 0
+        self.errors = [] # [(path, error), ...]: source files it did not get, or its own failed writes
+        self.error = None
+        self.seconds = 0.0
+        self.waited = 0.0 # Seconds the reader was held up because this destination's buffer was full
+        self.verified = None # With verify_after: whether the destination rehashed clean
+        self.compression = None # ZIP destinations: ZipWriteResult.to_dict() of what was written
+
+    def __repr__(self):
+        return f"TargetResult(dest='{self.dest}', mode='{self.mode}', status='{self.status}', copied={self.copied})"
+
+    def to_dict(self):
+        return {
+            "dest": self.dest,
+            "mode": self.mode,
+            "path": self.path,
+            "status": self.status,
+            "copied": self.copied,
+            "bytes": self.bytes,
+            "file_errors": len(self.errors),
+            "error": self.error,
+            "seconds": round(self.seconds, 3),
+            "reader_waited_seconds": round(self.waited, 3),
+            "verified": self.verified,
+            "compression": self.compression,
+        }
+
+class FanOutJob(RunReporting):
+    """
+    One source backed up to several destinations, reading it once: the tree is scanned once
+    and every file is read once, hashed once, and the same blocks are handed to one writer
+    thread per destination. Each destination is a mirror (like BackupJob's mirror mode:
+    the previous mirror is archived to backups/<name>_<date>) or a dated ZIP (like its ZIP
+    mode), and they can be mixed, e.g. a local USB disk and a NAS:
+        FanOutJob(src, [("E:\\Backups", "mirror"), ("\\\\nas01\\backups", "zip")]).run()
+    Each writer has a bounded buffer (BUFFER_SIZE); a slow destination holds the others up
+    only once its buffer is full, and the time it did so is reported. A destination that
+    fails (or fails MAX_ERRORS_IN_A_ROW files in a row) is dropped and the others carry on.
+    Every destination gets its own TargetResult in `results`, and the run report lists them.
+    Mirrors keep BackupJob's journal, so an interrupted run resumes there; ZIPs start over.
+    With `verify_after`, every destination written is rehashed against its manifest afterwards.
+    """
+    BLOCK_SIZE = 1024 * 1024 # Bytes read at a time and handed to every writer
+    BUFFER_SIZE = 64 * 1024 * 1024 # Per destination
+    MAX_ERRORS_IN_A_ROW = 50
+    MODES = ("mirror", "zip")
+
+    def __init__(self, src, targets, log_callback=None, name=None, filters=None, compression_policy=None,
+                 checksums=True, verify_after=False, throttles=None, copy_backend=None, report=True, report_dir=None):
+        self.logger = setup_logger("backup_app")
+        self.name = name
+        if not os.path.isdir(src):
+            raise ValueError(f"Source path is not a valid directory: {src}")
+        self.src = os.path.abspath(src)
+        self.targets = []
+        for target in targets:
+            dest, mode = (target["dest"], target.get("mode", "mirror")) if isinstance(target, dict) else target
+            if mode not in FanOutJob.MODES:
+                raise ValueError(f"Unknown fan-out mode '{mode}'. Expected one of {FanOutJob.MODES}")
+            if not BackupJob.validate_destination_path(dest):
+                raise ValueError(f"Destination path is not a writeable directory: {dest}")
+            self.targets.append((os.path.abspath(dest), mode))
+        if not self.targets:
+            raise ValueError("A fan-out job needs at least one destination")
+        self.file_filter = FileFilter.from_value(filters)
+        self.compression_policy = compression_policy or CompressionPolicy()
+        self.checksums = checksums
+        self.verify_after = verify_after # Rehash every destination once the run is done
+        self.copy_backend = copy_backend or default_backend() # Moves a previous mirror across disks, as BackupJob does
+        # dest -> Throttle for the writes there, e.g. the job runner's shared destination throttle
+        self.throttles = {os.path.abspath(dest): throttle for dest, throttle in (throttles or {}).items()}
+        self.report = report
+        self.report_dir = report_dir
+        self.report_path = None
+        self.results = [] # TargetResult per destination, from the last run
+        self.errors = [] # [(path, error), ...]: source read errors, then every destination's write errors
+        self.stats = RunStats()
+        self.timestamp = datetime.now().strftime("%Y-%m-%d")
+        self.log = self._build_logger_proxy(log_callback)
+        self._cancelled = threading.Event()
+
+    def __repr__(self):
+        return f"FanOutJob(src='{self.src}', targets={self.targets})"
+
+    @property
+    def dest(self):
+        """Every destination, in order."""
+        return [dest for dest, _ in self.targets]
+
+    # --- Public methods ---
+    def run(self, progress_callback=None):
+        """
+        Returns True if every destination got every file. Raises BackupCancelled if cancel()
+        is called while it runs; raises RuntimeError only if no destination could be written.
+        """
+        self.errors = []
+        self.stats = RunStats()
+        if self.file_filter:
+            self.file_filter.reset()
+        self.copy_backend.reset()
+        self._cancelled.clear()
+        folder_name = os.path.basename(os.path.normpath(self.src))
+        writers = [
+            (_MirrorWriter if mode == "mirror" else _ZipWriter)(self, dest, mode, folder_name)
+            for dest, mode in self.targets
+        ]
+        self.results = [writer.result for writer in writers]
+        status, error = "failed", None
+        try:
+            self.log(f"Scanning source: {self.src}")
+            started = time.monotonic()
+            with self.stats.phase("scan"):
+                index = scan(self.src, on_listed=self.stats.dir_listed, file_filter=self.file_filter)
+            self.log(f"Scanned {len(index)} files ({index.total_bytes / (1024 * 1024):.1f} MiB) "
+                     f"in {time.monotonic() - started:.1f}s.")
+            self.errors.extend(index.errors)
+            for writer in writers:
+                writer.start(index)
+            active = [writer for writer in writers if writer.result.status == "pending"]
+            if not active:
+                status = "ok" if all(w.result.status == "skipped" for w in writers) else "failed"
+                if status == "failed":
+                    raise RuntimeError("Backup failed: no destination could be written")
+                if self.verify_after:
+                    self.verify(progress_callback)
+                status = "errors" if self.errors else "ok"
+                return not self.errors
+            self.log(f"Reading {len(index)} files once for {len(active)} destination(s): "
+                     + ", ".join(f"{w.result.mode} {w.result.path}" for w in active))
+            completed = False
+            try:
+                with self.stats.phase("copy", files=len(index), bytes=index.total_bytes):
+                    self._read_all(index, active, progress_callback)
+                completed = True
+            finally:
+                for writer in active:
+                    writer.finish(cancelled=not completed)
+            for writer in writers:
+                result = writer.result
+                self.errors.extend(writer.write_errors)
+                self.log(f"{result.mode} {result.path or result.dest}: {result.status}, {result.copied} files, "
+                         f"{result.bytes / (1024 * 1024):.1f} MiB, {len(result.errors)} error(s), "
+                         f"reader held up {result.waited:.1f}s" + (f" ({result.error})" if result.error else ""),
+                         level="info" if result.status in ("ok", "skipped") else "warning")
+                if result.compression:
+                    self.log(f"  compressed {result.compression['bytes_in'] / (1024 * 1024):.1f} MiB -> "
+                             f"{result.compression['bytes_out'] / (1024 * 1024):.1f} MiB, policy stored "
+                             f"{result.compression['policy_stored_bytes'] / (1024 * 1024):.1f} MiB "
+                             f"(~{result.compression['estimated_cpu_saved_seconds']:.1f}s CPU saved)")
+            if all(w.result.status == "failed" for w in active):
+                raise RuntimeError("Backup failed: every destination failed")
+            if self.verify_after:
+                self.verify(progress_callback)
+            ok = all(w.result.status in ("ok", "skipped") for w in writers) and not self.errors
+            status = "ok" if ok else "errors"
+            return ok
+        except BackupCancelled:
+            status = "cancelled"
+            self.log("Backup cancelled. Mirrors resume where they stopped; ZIPs start over.", level="warning")
+            raise
+        except Exception as e:
+            error = str(e)
+            self.log(f"Backup failed: {e}", level="error")
+            raise
+        finally:
+            self.stats.finished = time.time()
+            if self.report:
+                self._write_report(status, error)
+
+    def verify(self, progress_callback=None):
+        """
+        Rehash what the last run left at each destination (not failed ones) against the hashes
+        recorded when it was written: a mirror against its manifest, a ZIP against its members'.
+        Sets each TargetResult's `verified`; failures are added to its errors and to `errors`.
+        Returns the combined VerifyResult.
+        """
+        verifier = Verifier()
+        combined = VerifyResult()
+        with self.stats.phase("verify", files=0, counted=False):
+            for target in self.results:
+                if target.status in ("failed", "cancelled") or target.path is None:
+                    continue
+                self.log(f"Verifying {target.mode}: {target.path}")
+                if target.mode == "mirror":
+                    manifest = Manifest.load(os.path.join(target.dest, f".{os.path.basename(target.path)}.manifest.json"))
+                    result = verifier.verify_tree(target.path, manifest, progress_callback)
+                else:
+                    manifest = Manifest.load(_zip_manifest_path(target.path))
+                    hashes = {arcname: entry['hash'] for arcname, entry in manifest.entries.items()}
+                    result = verifier.verify_zip(target.path, hashes, progress_callback)
+                problems = result.problems()
+                target.verified = result.ok
+                target.errors.extend(problems)
+                self.errors.extend(problems)
+                if problems and target.status in ("ok", "skipped"):
+                    target.status = "errors"
+                for path, error in problems[:BackupJob.MAX_REPORTED_ERRORS]:
+                    self.log(f"Verification failed for {path}: {error}", level="error")
+                self.log(
+                    f"Verification of {target.path} {'passed' if result.ok else 'FAILED'}: {result.checked} files "
+                    f"checked, {len(result.mismatches)} mismatched, {len(result.missing)} missing, "
+                    f"{result.unhashed} without a recorded hash."
+                )
+                combined.extend(result)
+        return combined
+
+    def cancel(self):
+        """Stop at the next file boundary; safe from any thread."""
+        self._cancelled.set()
+
+    # --- Internal ---
+    def _read_all(self, index, writers, progress_callback):
+        """Read every file once on this thread and hand its blocks to each writer that wants it."""
+        total = len(index)
+        for done, (rel_path, size, mtime, mode) in enumerate(index, 1):
+            if self._cancelled.is_set():
+                raise BackupCancelled("Backup cancelled")
+            wanted = [writer for writer in writers if not writer.failed and writer.wants(rel_path, size, mtime)]
+            if wanted:
+                self._read_file(index.abspath(rel_path), rel_path, size, mtime, mode, wanted)
+            self.stats.files_progress(done, total)
+            if progress_callback:
+                progress_callback(done, total)
+
+    def _read_file(self, src_file, rel_path, size, mtime, mode, writers):
+        hasher = hashlib.new(Manifest.HASH_ALGORITHM) if self.checksums else None
+        started = False
+        try:
+            with open(src_file, "rb") as f:
+                for writer in writers:
+                    writer.put(("file", src_file, rel_path, size, mtime, mode))
+                started = True
+                remaining = size # A file that grew since the scan is captured at its scanned size
+                while remaining:
+                    block = f.read(min(FanOutJob.BLOCK_SIZE, remaining))
+                    if not block:
+                        raise OSError(f"File changed size during backup: {src_file}")
+                    remaining -= len(block)
+                    if hasher:
+                        hasher.update(block)
+                    self.stats.add_bytes(len(block))
+                    for writer in writers:
+                        writer.put(("data", block))
+        except OSError as e:
+            self.errors.append((src_file, e))
+            for writer in writers:
+                writer.put(("abort" if started else "missing", src_file, e))
+            return
+        for writer in writers:
+            writer.put(("end", hasher.hexdigest() if hasher else None))
+
+    def _mode_name(self):
+        return "fan-out"
+
+    def _report_details(self):
+        return {
+            "targets": [result.to_dict() for result in self.results],
+            "copy_methods": dict(self.copy_backend.stats),
+        }
+
+class _Writer:
+    """
+    One destination of a fan-out run: a thread taking messages from a bounded queue.
+        ("file", src_file, rel_path, size, mtime, mode)   a file begins
+        ("data", block)                                   its next block
+        ("end", file_hash) / ("abort", src_file, error)   it is complete / failed to read
+        ("missing", src_file, error)                      a file that could not be opened
+        ("done", cancelled)                               no more files
+    Subclasses write: prepare(index), begin(...), write(block), commit(file_hash), discard(),
+    close(cancelled), and abandon() to let go of a destination that failed.
+    """
+    def __init__(self, job, dest, mode, folder_name):
+        self.job = job
+        self.dest = dest
+        self.folder_name = folder_name
+        self.throttle = job.throttles.get(dest)
+        self.result = TargetResult(dest, mode)
+        self.failed = False # Set once the destination is given up on; the reader stops feeding it
+        self._queue = queue.Queue(maxsize=max(1, FanOutJob.BUFFER_SIZE // FanOutJob.BLOCK_SIZE))
+        self._thread = None
+        self.write_errors = [] # The part of result.errors that happened here rather than at the source
+        self._current = None # (src_file, rel_path, size, mtime) being written, None after a failure
+        self._errors_in_a_row = 0
+
+    def start(self, index):
+        """Prepare the destination on the calling thread, then start writing."""
+        try:
+            if self.prepare(index) is False:
+                self.result.status = "skipped"
+                return
+        except Exception as e:
+            self._fail(e)
+            return
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f"fan-out-{self.result.mode}", daemon=True)
+        self._thread.start()
+
+    def wants(self, rel_path, size, mtime):
+        return True
+
+    def put(self, message):
+        """Queue a message (reader thread); blocks while the buffer is full, which is timed."""
+        if self.failed:
+            return
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            started = time.perf_counter()
+            self._queue.put(message)
+            self.result.waited += time.perf_counter() - started
+
+    def finish(self, cancelled=False):
+        if self._thread is None:
+            return
+        self._queue.put(("done", cancelled))
+        self._thread.join()
+
+    # --- Internal ---
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            kind = message[0]
+            if kind == "done":
+                self.result.seconds = time.monotonic() - self._started # When this destination caught up
+                if self._current and not self.failed: # Cancelled mid-file: drop the partial copy
+                    try:
+                        self.discard()
+                    except Exception:
+                        pass
+                    self._current = None
+                break
+            if self.failed:
+                continue # Drain, so the reader never blocks on a destination that gave up
+            try:
+                if kind == "file":
+                    self._current = message[1:5]
+                    self._file_started = time.monotonic()
+                    self.begin(*message[2:])
+                elif kind == "data":
+                    if self._current:
+                        self.write(message[1])
+                elif kind == "end":
+                    if self._current:
+                        self.commit(message[1])
+                        self.result.copied += 1
+                        self.result.bytes += self._current[2]
+                        # Per destination, so a slow one shows up under its own paths
+                        self.job.stats.file_done(os.path.join(self.result.path, self._current[1]), self._current[2],
+                                                 time.monotonic() - self._file_started)
+                        self._errors_in_a_row = 0
+                    self._current = None
+                elif kind == "abort":
+                    if self._current:
+                        self.discard()
+                    self._current = None
+                    self.result.errors.append((message[1], message[2]))
+                elif kind == "missing":
+                    self.result.errors.append((message[1], message[2]))
+            except Exception as e:
+                if self._current:
+                    error = (os.path.join(self.result.path or self.dest, self._current[1]), e)
+                    self.result.errors.append(error)
+                    self.write_errors.append(error)
+                    try:
+                        self.discard()
+                    except Exception:
+                        pass
+                    self._current = None
+                self._errors_in_a_row += 1
+                if self._errors_in_a_row >= FanOutJob.MAX_ERRORS_IN_A_ROW:
+                    self._fail(f"stopped after {self._errors_in_a_row} failed files in a row, last: {e}")
+        cancelled = message[1]
+        try:
+            if not self.failed:
+                self.close(cancelled)
+                self.result.status = "cancelled" if cancelled else ("errors" if self.result.errors else "ok")
+                return
+        except Exception as e:
+            self._fail(e)
+        try:
+            self.abandon()
+        except Exception:
+            pass
+
+    def _fail(self, error):
+        self.failed = True
+        self.result.status = "failed"
+        self.result.error = str(error)
+
+class _MirrorWriter(_Writer):
+    """A mirror of the source, as BackupJob's mirror mode writes it, with the same journal and manifest."""
+    def prepare(self, index):
+        target_path = self.result.path = os.path.join(self.dest, self.folder_name)
+        self.journal = RunJournal(os.path.join(self.dest, f".{self.folder_name}.journal"), key=f"mirror:{self.job.timestamp}")
+        self.committed = self.journal.open()
+        self.manifest = Manifest(os.path.join(self.dest, f".{self.folder_name}.manifest.json"))
+        if self.journal.resumed:
+            for rel_path, entry in self.committed.items():
+                if 'b' not in entry:
+                    self.manifest.set(rel_path, entry['s'], entry['m'], entry.get('h'))
+        elif os.path.exists(target_path):
+            archived_path = os.path.join(self.dest, "backups", f"{self.folder_name}_{self.job.timestamp}")
+            if os.path.exists(archived_path):
+                self.journal.close()
+                self.result.error = f"An archive for today already exists: {archived_path}"
+                return False
+            self.job.log(f"Archiving existing backup to: {archived_path}")
+            with self.job.stats.phase("archive"):
+                BackupJob._move_to_archive(target_path, archived_path, self.job.copy_backend)
+        os.makedirs(target_path, exist_ok=True)
+        for rel_dir in index.subdirs:
+            os.makedirs(os.path.join(target_path, rel_dir), exist_ok=True)
+
+    def wants(self, rel_path, size, mtime):
+        return not BackupJob._is_committed(self.committed, rel_path, size, mtime)
+
+    def begin(self, rel_path, size, mtime, mode):
+        if self.throttle:
+            self.throttle.consume_file()
+        self._dst_file = os.path.join(self.result.path, rel_path)
+        self._file = open(f"{self._dst_file}.part", "wb")
+
+    def write(self, block):
+        if self.throttle:
+            self.throttle.consume_bytes(len(block))
+        self._file.write(block)
+
+    def commit(self, file_hash):
+        src_file, rel_path, size, mtime = self._current
+        self._file.close()
+        shutil.copystat(src_file, f"{self._dst_file}.part")
+        os.replace(f"{self._dst_file}.part", self._dst_file)
+        self.manifest.set(rel_path, size, mtime, file_hash)
+        self.journal.record(rel_path, s=size, m=mtime, h=file_hash)
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(f"{self._dst_file}.part"):
+            os.remove(f"{self._dst_file}.part")
+
+    def close(self, cancelled):
+        if cancelled:
+            self.journal.close(complete=False)
+            return
+        self.manifest.save()
+        self.journal.close()
+
+    def abandon(self):
+        self.journal.close(complete=False) # A later run resumes from it
+
+class _ZipWriter(_Writer):
+    """A dated ZIP of the source, as BackupJob's ZIP mode names it, compressed on this writer's thread."""
+    def prepare(self, index):
+        zip_name = f"{self.folder_name}_{self.job.timestamp}.zip"
+        self.result.path = os.path.join(self.dest, zip_name)
+        if os.path.exists(self.result.path):
+            self.result.error = f"ZIP archive already exists: {self.result.path}"
+            return False
+        self.policy = self.job.compression_policy
+        self.compressed = ZipWriteResult() # Per method: files, bytes in and out, CPU time
+        self.manifest = Manifest(_zip_manifest_path(self.result.path))
+        self.zipf = zipfile.ZipFile(f"{self.result.path}.part", "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+
+    def begin(self, rel_path, size, mtime, mode):
+        if self.throttle:
+            self.throttle.consume_file()
+        self.zinfo = zip_info(ZipChain.arcname(rel_path), size, mtime, mode)
+        self.zinfo.compress_size = self.zinfo.CRC = 0
+        self.method = self.policy.by_name(self.zinfo.filename)
+        self.compressor = None
+        self.zip64 = None # Set once the member's header is written
+        self.cpu = 0.0
+
+    def write(self, block):
+        if self.zip64 is None:
+            self._begin(block)
+        self.zinfo.CRC = zlib.crc32(block, self.zinfo.CRC)
+        if self.compressor:
+            started = time.thread_time()
+            block = self.compressor.compress(block)
+            self.cpu += time.thread_time() - started
+        self._out(block)
+
+    def commit(self, file_hash):
+        if self.zip64 is None:
+            self._begin(b"")
+        if self.compressor:
+            started = time.thread_time()
+            tail = self.compressor.flush()
+            self.cpu += time.thread_time() - started
+            self._out(tail)
+        end_member(self.zipf, self.zinfo, self.zip64)
+        self.compressed.record(self.method, self.zinfo.file_size, self.zinfo.compress_size, self.cpu)
+        if self.method[0] == zipfile.ZIP_STORED and self.policy.default[0] != zipfile.ZIP_STORED:
+            self.compressed.policy_stored_bytes += self.zinfo.file_size
+        self.manifest.set(self.zinfo.filename, self.zinfo.file_size, self._current[3], file_hash)
+
+    def discard(self):
+        if self.zip64 is not None:
+            # Roll the partial member back out of the archive
+            self.zipf.fp.seek(self.zinfo.header_offset)
+            self.zipf.fp.truncate()
+        self.compressor = None
+        self.zip64 = None
+
+    def close(self, cancelled):
+        self.zipf.close()
+        if cancelled:
+            os.remove(f"{self.result.path}.part")
+            return
+        os.replace(f"{self.result.path}.part", self.result.path)
+        self.manifest.save()
+        self.result.compression = self.compressed.to_dict(self.policy.default[1])
+
+    def abandon(self):
+        self.zipf.fp.close()
+        os.remove(f"{self.result.path}.part")
+
+    def _begin(self, first_block):
+        self.method = self.method or self.policy.by_sample(first_block)
+        self.compressor = CompressionPolicy.compressor(self.method)
+        self.zip64 = begin_member(self.zipf, self.zinfo, self.method)
+
+    def _out(self, data):
+        if self.throttle:
+            self.throttle.consume_bytes(len(data))
+        self.zipf.fp.write(data)
+        self.zinfo.compress_size += len(data)
+
+def _zip_manifest_path(zip_path):
+    """The hashes of a ZIP's members, next to it as BackupJob names it."""
+    return os.path.join(os.path.dirname(zip_path), f".{os.path.basename(zip_path)}.manifest.json")
@@ -0,0 +1,265 @@
+import os
+import sys
+import errno
+import shutil
+import threading
+from collections import Counter
+
+COPY_BUFFER_SIZE = 1024 * 1024 # 1 MiB
+FICLONE = 0x40049409 # ioctl(dest_fd, FICLONE, src_fd): share the source's extents (btrfs, XFS, bcachefs)
+# errno values meaning "this filesystem pair can't do that", as opposed to a real I/O error
+_UNSUPPORTED = {
+    errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EBADF, errno.EPERM, errno.ENOSYS,
+    getattr(errno, "EOPNOTSUPP", errno.ENOTSUP), errno.ENOTSUP,
+}
+
+class CopyBackend:
+    """
+    Copies one file's content and metadata (like shutil.copy2), optionally feeding a hasher,
+    paying a Throttle for the bytes written and reporting them to progress(amount) as they go. This base backend works everywhere:
+    a buffered copy with a tunable `buffer_size` that skips the holes of sparse files
+    (where the OS can report them), so a mostly empty VM image stays mostly empty.
+    `stats` counts files and bytes per method used, for the run summary.
+    """
+    def __init__(self, buffer_size=COPY_BUFFER_SIZE, sparse=True):
+        self.buffer_size = max(64 * 1024, int(buffer_size))
+        self.sparse = sparse
+        self.stats = Counter() # "<method>_files", "<method>_bytes", "holes_bytes"
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(buffer_size={self.buffer_size}, sparse={self.sparse})"
+
+    # --- Public methods ---
+    PROGRESS_SIZE = 64 * 1024 * 1024 # Files this big report progress block by block
+
+    def copy(self, src_file, dst_file, hasher=None, throttle=None, progress=None):
+        """Copy `src_file` to `dst_file`, then its metadata. Returns the method used."""
+        if hasher is None and not (throttle and throttle.active) and self._plain(os.stat(src_file), progress):
+            # Nothing to see on the way through: the standard library's own fast path will do
+            shutil.copyfile(src_file, dst_file)
+            method, size = "copyfile", os.path.getsize(dst_file)
+            if progress:
+                progress(size)
+        else:
+            with open(src_file, "rb") as fsrc, open(dst_file, "wb") as fdst:
+                method, size = self._copy_open(fsrc, fdst, hasher, throttle, progress)
+        shutil.copystat(src_file, dst_file)
+        self._count(method, size)
+        return method
+
+    def summary(self):
+        """One line for the log, e.g. "reflink 120 files (3.2 GiB), buffered 4 files (1.0 MiB)"."""
+        with self._lock:
+            stats = dict(self.stats)
+        parts = [
+            f"{key[:-6]} {count} files ({stats.get(key[:-6] + '_bytes', 0) / (1024 * 1024):.1f} MiB)"
+            for key, count in sorted(stats.items()) if key.endswith("_files")
+        ]
+        if stats.get("holes_bytes"):
+            parts.append(f"{stats['holes_bytes'] / (1024 * 1024):.1f} MiB of holes kept sparse")
+        return ", ".join(parts)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+    # --- Internal ---
+    def _copy_open(self, fsrc, fdst, hasher, throttle, progress):
+        """Copy between open files. Returns (method, size)."""
+        size = os.fstat(fsrc.fileno()).st_size
+        extents = self._data_extents(fsrc, size)
+        self._copy_buffered(fsrc, fdst, extents, size, hasher, throttle, progress)
+        return ("buffered" if extents is None else "sparse"), size
+
+    def _copy_buffered(self, fsrc, fdst, extents, size, hasher, throttle, progress):
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        position = 0
+        for start, end in extents or [(0, None)]:
+            if hasher and start > position:
+                self._hash_zeros(hasher, start - position) # Holes read back as zeros
+            fsrc.seek(start)
+            fdst.seek(start)
+            position = start
+            while end is None or position < end:
+                length = fsrc.readinto(view[:self.buffer_size if end is None else min(self.buffer_size, end - position)])
+                if not length:
+                    break
+                if hasher:
+                    hasher.update(view[:length])
+                if throttle:
+                    throttle.consume_bytes(length)
+                fdst.write(view[:length])
+                position += length
+                if progress:
+                    progress(length)
+        if extents is not None:
+            self._finish_sparse(fdst, extents, size, position, hasher)
+
+    def _finish_sparse(self, fdst, extents, size, position, hasher):
+        """Give a sparse copy its full length, ending in a hole if the source does."""
+        if hasher and size > position:
+            self._hash_zeros(hasher, size - position)
+        fdst.truncate(size)
+        with self._lock:
+            self.stats["holes_bytes"] += size - sum(end - start for start, end in extents)
+
+    def _data_extents(self, fsrc, size):
+        """
+        [(start, end), ...] data regions of a sparse file, or None to copy the whole file
+        to EOF (so a file growing during the copy is still copied entirely).
+        """
+        if not hasattr(os, "SEEK_DATA") or not self._is_sparse(os.fstat(fsrc.fileno())):
+            return None
+        fd = fsrc.fileno()
+        extents = []
+        position = 0
+        try:
+            while position < size:
+                try:
+                    start = os.lseek(fd, position, os.SEEK_DATA)
+                except OSError as e:
+                    if e.errno == errno.ENXIO: # No data after `position`: the rest is a hole
+                        break
+                    raise
+                end = min(os.lseek(fd, start, os.SEEK_HOLE), size)
+                extents.append((start, end))
+                position = end
+        except OSError:
+            return None # Filesystem can't report holes; copy everything
+        return extents
+
+    def _plain(self, st, progress):
+        """True if nothing needs to see the data of this file on its way through."""
+        return not self._is_sparse(st) and not (progress and st.st_size >= CopyBackend.PROGRESS_SIZE)
+
+    def _is_sparse(self, st):
+        return self.sparse and st.st_size > 0 and getattr(st, "st_blocks", None) is not None \
+            and st.st_blocks * 512 < st.st_size
+
+    def _hash_zeros(self, hasher, length):
+        zeros = memoryview(bytes(min(length, self.buffer_size)))
+        while length > 0:
+            step = min(length, len(zeros))
+            hasher.update(zeros[:step])
+            length -= step
+
+    def _count(self, method, size):
+        with self._lock:
+            self.stats[f"{method}_files"] += 1
+            self.stats[f"{method}_bytes"] += size
+
+class LinuxCopyBackend(CopyBackend):
+    """
+    Tries the cheapest copy the filesystems allow, falling back per device pair:
+        reflink          FICLONE shares the source's extents: no data written at all, so
+                         copies and snapshots on btrfs/XFS are near-instant. When a hash is
+                         wanted the source is still read once, but nothing is written.
+        copy_file_range  the kernel copies (server-side on NFS 4.2 / SMB3 where supported)
+                         without the data passing through this process; sparse files are
+                         copied one data extent at a time so their holes survive.
+        buffered         CopyBackend's copy, when a hash is wanted and cloning isn't possible.
+    A pair of devices that refuses reflink or copy_file_range once isn't asked again.
+    """
+    RANGE_CHUNK = 64 * 1024 * 1024 # Bytes per copy_file_range call when not throttled
+
+    def __init__(self, buffer_size=COPY_BUFFER_SIZE, sparse=True, reflink=True, copy_range=True):
+        super().__init__(buffer_size, sparse)
+        self.reflink = reflink
+        self.copy_range = copy_range and hasattr(os, "copy_file_range")
+        self._no_reflink = set() # (src st_dev, dst st_dev) pairs that can't clone
+        self._no_copy_range = set()
+
+    def __repr__(self):
+        return (f"LinuxCopyBackend(buffer_size={self.buffer_size}, sparse={self.sparse}, "
+                f"reflink={self.reflink}, copy_range={self.copy_range})")
+
+    def copy(self, src_file, dst_file, hasher=None, throttle=None, progress=None):
+        with open(src_file, "rb") as fsrc, open(dst_file, "wb") as fdst:
+            method, size = self._copy_open(fsrc, fdst, hasher, throttle, progress)
+        shutil.copystat(src_file, dst_file)
+        self._count(method, size)
+        return method
+
+    # --- Internal ---
+    def _copy_open(self, fsrc, fdst, hasher, throttle, progress):
+        src_stat = os.fstat(fsrc.fileno())
+        devices = (src_stat.st_dev, os.fstat(fdst.fileno()).st_dev)
+        if self.reflink and devices not in self._no_reflink and self._clone(fsrc, fdst, devices):
+            if hasher:
+                self._hash_file(fsrc, hasher)
+            if progress:
+                progress(src_stat.st_size)
+            return "reflink", src_stat.st_size
+        size = src_stat.st_size
+        extents = self._data_extents(fsrc, size)
+        if hasher is None and self.copy_range and devices not in self._no_copy_range:
+            if self._copy_range(fsrc, fdst, extents, size, devices, throttle, progress):
+                return ("copy_file_range" if extents is None else "sparse"), size
+        self._copy_buffered(fsrc, fdst, extents, size, hasher, throttle, progress)
+        return ("buffered" if extents is None else "sparse"), size
+
+    def _clone(self, fsrc, fdst, devices):
+        import fcntl # Unix only; this backend is only chosen on Linux
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            self._no_reflink.add(devices)
+            return False
+
+    def _copy_range(self, fsrc, fdst, extents, size, devices, throttle, progress):
+        """Copy every extent with copy_file_range. False (nothing written) if the pair can't."""
+        chunk = self.buffer_size if throttle and throttle.active else LinuxCopyBackend.RANGE_CHUNK
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        position = written = 0
+        for start, end in extents or [(0, None)]:
+            position = start
+            while end is None or position < end:
+                count = chunk if end is None else min(chunk, end - position)
+                if throttle:
+                    throttle.consume_bytes(count)
+                try:
+                    copied = os.copy_file_range(src_fd, dst_fd, count, position, position)
+                except OSError as e:
+                    if e.errno not in _UNSUPPORTED or written:
+                        raise
+                    self._no_copy_range.add(devices)
+                    return False
+                if not copied:
+                    break
+                position += copied
+                written += copied
+                if progress:
+                    progress(copied)
+        if extents is not None:
+            self._finish_sparse(fdst, extents, size, position, None)
+        return True
+
+    def _hash_file(self, fsrc, hasher):
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        fsrc.seek(0)
+        while True:
+            length = fsrc.readinto(buffer)
+            if not length:
+                break
+            hasher.update(view[:length])
+
+def default_backend(buffer_size=COPY_BUFFER_SIZE, **options):
+    """The best CopyBackend for this platform."""
+    if sys.platform.startswith("linux"):
+        return LinuxCopyBackend(buffer_size, **options)
+    return CopyBackend(buffer_size, **options)
+
+_shared = None
+
+def shared_backend():
+    """Process-wide default backend, for callers that don't bring their own."""
+    global _shared
+    if _shared is None:
+        _shared = default_backend()
+    return _shared
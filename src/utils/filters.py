@@ -0,0 +1,239 @@
+import os
+import re
+import time
+from src.utils.retention import parse_size
+
+def parse_age(value):
+    """
+    An age from a job file: seconds, or a string with an s/m/h/d/w suffix such as "30d".
+    None, "" and 0 return None.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    match = re.fullmatch(r"([\d.]+)\s*([smhdw]?)", str(value).strip(), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid age: '{value}'. Expected seconds, optionally with s, m, h, d or w.")
+    unit = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}[match.group(2).lower()]
+    return float(match.group(1)) * unit or None
+
+class FileFilter:
+    """
+    Include/exclude rules for a job's source, applied while it is scanned.
+        exclude    gitignore-style patterns, in order, the last match deciding:
+                       Thumbs.db       that name at any depth
+                       *.tmp  ~$*      * and ? stay within one name, [abc] is a set
+                       node_modules/   a trailing / matches folders only
+                       /build          a leading (or inner) / anchors to the source root
+                       **/.git/objects ** spans any number of folders
+                       !keep.tmp       a leading ! re-includes what an earlier rule excluded
+        include    patterns a file must match to be backed up at all (default: every file)
+        max_size   skip larger files (bytes or "2G")
+        max_age    skip files not modified for longer (seconds or "365d")
+        min_age    skip files modified more recently, e.g. still being written ("5m")
+    An excluded folder is pruned: it is never listed, and as in git nothing below it can be
+    re-included. Rules are compiled into one regular expression per kind of check, so a
+    file costs one match however many rules there are. `stats` counts what each rule
+    skipped; files and bytes inside pruned folders are not known, only the folders.
+    """
+    # `filters=True` in a job: clutter that is never worth a backup and is often locked
+    COMMON_EXCLUDES = (
+        "node_modules/", "**/.git/objects/", "__pycache__/", ".tox/", ".pytest_cache/",
+        "~$*", ".~lock.*#", "Thumbs.db", "ehthumbs.db", ".DS_Store", "*.tmp", "*.temp",
+        "$RECYCLE.BIN/", "System Volume Information/", "/Temp/", "/tmp/",
+    )
+    OPTIONS = ("exclude", "include", "max_size", "max_age", "min_age")
+
+    def __init__(self, exclude=(), include=(), max_size=None, max_age=None, min_age=None):
+        self.rules = [] # (pattern, negated, folders_only)
+        for line in _lines(exclude):
+            negated = line.startswith("!")
+            pattern = line[1:] if negated else line
+            self.rules.append((line, negated, pattern.endswith("/")))
+        self.include = _lines(include)
+        self.max_size = parse_size(max_size)
+        self.max_age = parse_age(max_age)
+        self.min_age = parse_age(min_age)
+        flags = re.IGNORECASE if os.name == "nt" else 0
+        try:
+            # Newest rule first, so the first alternative that matches is the one that decides
+            self._dir_regex = _combine([(i, rule[0]) for i, rule in enumerate(self.rules)], flags)
+            self._file_regex = _combine([(i, rule[0]) for i, rule in enumerate(self.rules) if not rule[2]], flags)
+            self._include_regex = _combine(list(enumerate(self.include)), flags)
+        except re.error as e:
+            raise ValueError(f"Invalid filter pattern: {e}")
+        self._dir_cache = {} # rel_dir -> whether it or one of its parents is excluded
+        self.reset()
+
+    def __repr__(self):
+        return (f"FileFilter(rules={len(self.rules)}, include={len(self.include)}, max_size={self.max_size}, "
+                f"max_age={self.max_age}, min_age={self.min_age})")
+
+    @classmethod
+    def from_value(cls, value):
+        """
+        A filter from a job file: True for COMMON_EXCLUDES, a list of exclude patterns, a dict
+        with OPTIONS keys (plus "common": true to add COMMON_EXCLUDES first), or a FileFilter.
+        """
+        if value is None or value is False or isinstance(value, FileFilter):
+            return value or None
+        if value is True:
+            return cls(exclude=FileFilter.COMMON_EXCLUDES)
+        if isinstance(value, (list, tuple, str)):
+            return cls(exclude=value)
+        if not isinstance(value, dict) or set(value) - set(FileFilter.OPTIONS) - {"common"}:
+            raise ValueError(f"Invalid filters: {value}. Expected a list of patterns or keys among {FileFilter.OPTIONS}")
+        options = {key: value[key] for key in FileFilter.OPTIONS if key in value}
+        if value.get("common"):
+            options["exclude"] = list(FileFilter.COMMON_EXCLUDES) + _lines(options.get("exclude", ()))
+        return cls(**options)
+
+    # --- Checks (called by the scanner) ---
+    def reset(self):
+        """Start counting for a new run; ages are measured from now."""
+        self.stats = {} # label -> {"files", "bytes", "dirs"}
+        self.deferred = set() # Folders holding files skipped by min_age, to look at again next run
+        self._now = time.time()
+
+    def skip_dir(self, rel_dir):
+        """Whether the folder `rel_dir` is excluded (counted; the caller prunes it)."""
+        rule = self._match(self._dir_regex, rel_dir)
+        if rule is None:
+            return False
+        self._count(self.rules[rule][0], dirs=1)
+        return True
+
+    def skip_file(self, rel_path, size, mtime):
+        """Whether the file is skipped by a rule, the include list or a size or age limit (counted)."""
+        label = self._file_label(rel_path, size, mtime)
+        if label is None:
+            return False
+        self._count(label, files=1, bytes=size)
+        if label == "min_age":
+            self.deferred.add(os.path.dirname(rel_path))
+        return True
+
+    def excluded(self, rel_path, size, mtime):
+        """
+        Whether a file listed outside a filtered scan (e.g. from a manifest) would have been
+        left out, by a rule on one of its folders or on itself. Not counted.
+        """
+        rel_dir = os.path.dirname(rel_path)
+        return bool(rel_dir and self.dir_excluded(rel_dir)) or self._file_label(rel_path, size, mtime) is not None
+
+    def dir_excluded(self, rel_dir):
+        """Whether `rel_dir` or one of its parents is excluded. Not counted."""
+        if rel_dir not in self._dir_cache:
+            parent = os.path.dirname(rel_dir)
+            self._dir_cache[rel_dir] = bool(parent and self.dir_excluded(parent)) \
+                or self._match(self._dir_regex, rel_dir) is not None
+        return self._dir_cache[rel_dir]
+
+    def config(self):
+        """The rules and limits, e.g. to tell whether they changed between runs."""
+        return {
+            "rules": [rule[0] for rule in self.rules],
+            "include": self.include,
+            "max_size": self.max_size,
+            "max_age": self.max_age,
+            "min_age": self.min_age,
+        }
+
+    def to_dict(self):
+        """For the run report: the configuration and what each rule skipped."""
+        return dict(
+            self.config(),
+            skipped=self.stats,
+            skipped_files=sum(entry["files"] for entry in self.stats.values()),
+            skipped_bytes=sum(entry["bytes"] for entry in self.stats.values()),
+            pruned_dirs=sum(entry["dirs"] for entry in self.stats.values()),
+        )
+
+    # --- Internal ---
+    def _file_label(self, rel_path, size, mtime):
+        """What skips the file: a rule's pattern, "include", "max_size", "max_age", "min_age"; or None."""
+        rule = self._match(self._file_regex, rel_path)
+        if rule is not None:
+            return self.rules[rule][0]
+        if self._include_regex and not self._include_regex.match(_posix(rel_path)):
+            return "include"
+        if self.max_size is not None and size > self.max_size:
+            return "max_size"
+        if self.max_age is not None and self._now - mtime > self.max_age:
+            return "max_age"
+        if self.min_age is not None and self._now - mtime < self.min_age:
+            return "min_age"
+        return None
+
+    def _match(self, regex, rel_path):
+        """Index of the rule deciding `rel_path`, or None if it is not excluded."""
+        if regex is None:
+            return None
+        match = regex.match(_posix(rel_path))
+        if match is None:
+            return None
+        rule = int(match.lastgroup[1:])
+        return None if self.rules[rule][1] else rule
+
+    def _count(self, label, files=0, bytes=0, dirs=0):
+        entry = self.stats.setdefault(label, {"files": 0, "bytes": 0, "dirs": 0})
+        entry["files"] += files
+        entry["bytes"] += bytes
+        entry["dirs"] += dirs
+
+def _lines(value):
+    """Patterns from a list or a newline-separated string, without blanks and # comments."""
+    if isinstance(value, str):
+        value = value.splitlines()
+    return [line.strip() for line in value or () if line.strip() and not line.strip().startswith("#")]
+
+def _posix(rel_path):
+    return rel_path.replace(os.sep, "/") if os.sep != "/" else rel_path
+
+def _combine(numbered, flags):
+    """One regex whose named group r<N> matches when pattern N does, newest pattern first."""
+    if not numbered:
+        return None
+    alternatives = "|".join(f"(?P<r{i}>{_translate(pattern)})" for i, pattern in reversed(numbered))
+    return re.compile(f"(?:{alternatives})\\Z", flags)
+
+def _translate(pattern):
+    """A gitignore pattern as a regex over a /-separated path relative to the source root."""
+    if pattern.startswith("!"):
+        pattern = pattern[1:]
+    if pattern.startswith("\\"):
+        pattern = pattern[1:] # \! and \# escape a leading ! or #
+    pattern = pattern.rstrip("/")
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if pattern.startswith("**/"):
+        anchored, pattern = False, pattern[3:]
+    out = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:[^/]*/)*")
+            i += 3
+            continue
+        if pattern.startswith("/**", i) and i + 3 == len(pattern):
+            out.append("/.*")
+            break
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[" and pattern.find("]", i + 2) != -1:
+            end = pattern.find("]", i + 2) # A ] right after [ (or [!) is part of the set
+            body = pattern[i + 1:end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"(?!/)[{body}]")
+            i = end + 1
+            continue
+        else:
+            out.append(re.escape(char))
+        i += 1
+    body = "".join(out)
+    return body if anchored else f"(?:[^/]*/)*{body}"
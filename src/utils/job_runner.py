@@ -0,0 +1,335 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src.utils.backup_job import BackupJob, BackupCancelled
+from src.utils.compression_policy import CompressionPolicy
+from src.utils.throttle import Throttle
+from src.utils.fast_copy import default_backend
+from src.utils.retention import RetentionPolicy, parse_size
+from src.utils.filters import FileFilter
+from src.utils.fan_out import FanOutJob
+
+MODES = {
+    "mirror": {},
+    "incremental": {"incremental": True},
+    "snapshot": {"snapshot": True},
+    "zip": {"compress": True},
+}
+# Job file keys passed straight through to BackupJob
+JOB_OPTIONS = {
+    "use_hash", "keep_snapshots", "workers", "compress_workers", "zip_mode", "checksums", "verify_after",
+    "bytes_per_second", "files_per_second", "throttle_schedule", "retention", "min_free_space",
+    "pack_small_files", "report", "report_dir", "watch", "watch_dir",
+    "filters",
+}
+# The options a fan-out job ("dest" is a list) takes; it reads the source once for all of them
+FAN_OUT_OPTIONS = {"checksums", "verify_after", "filters", "report", "report_dir", "compression", "copy_buffer_size"}
+DESTINATION_THROTTLE = {"bytes_per_second", "files_per_second", "schedule"}
+DESTINATION_DEFAULTS = {"retention", "min_free_space"} # Applied to jobs writing there that don't set their own
+DESTINATION_OPTIONS = DESTINATION_THROTTLE | DESTINATION_DEFAULTS
+
+def load_jobs(path):
+    """
+    Read a job file. Returns (settings, specs); raises ValueError describing the first bad entry.
+    Format:
+        {
+          "max_jobs": 4,                  (optional) jobs running at once
+          "max_per_destination": 1,       (optional) jobs writing to one server or disk at once
+          "defaults": {"workers": 8},     (optional) options applied to every job
+          "destinations": {               (optional) limits shared by all jobs writing to a server or disk
+            "\\\\\\\\nas01\\\\backups": {"bytes_per_second": "40M", "files_per_second": 200,
+                                   "schedule": [{"from": "08:00", "to": "18:00", "bytes_per_second": "10M"}],
+                                   "retention": {"daily": 7, "weekly": 4, "monthly": 12},
+                                   "min_free_space": "10%"}
+          },
+          "jobs": [
+            {"name": "finance", "src": "\\\\\\\\fs01\\\\finance", "dest": "E:\\\\Backups",
+             "mode": "incremental", "verify_after": true, "watch": true,
+             "filters": {"common": true, "exclude": ["/scratch/", "*.bak"], "max_size": "20G"}},
+            {"name": "hr", "src": "...", "dest": "...", "mode": "zip", "zip_mode": "differential",
+             "compression": {"default": "deflate:6", "rules": {".log": "lzma"}},
+             "bytes_per_second": "5M", "throttle_schedule": [...], "copy_buffer_size": 4194304},
+            {"name": "cad", "src": "...", "dest": "\\\\\\\\nas01\\\\backups", "pack_small_files": "64K"},
+            {"name": "projects", "src": "...", "dest": ["E:\\\\Backups", "\\\\\\\\nas01\\\\backups"],
+             "mode": ["mirror", "zip"]}
+          ]
+        }
+    `mode` is one of mirror (default), incremental, snapshot or zip. Rates take K/M/G suffixes
+    and schedules follow throttle.Throttle. `pack_small_files` (mirror mode) packs files below
+    that size into bundles, see pack.PackWriter. `report` (default true) and `report_dir` control
+    the JSON run report each job writes next to the log. `watch` (incremental mode) lists only
+    the folders a running watcher (watch.py) recorded as changed, see watcher.Watcher.
+    `filters` takes gitignore-style exclude patterns plus include, max_size, max_age and
+    min_age, or true for common clutter (node_modules, Office lock files...), see filters.FileFilter.
+    A list of `dest` makes a fan-out job that reads the source once for all of them, with
+    `mode` mirror or zip for all or a list with one per destination, see fan_out.FanOutJob.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot read job file {path}: {e}")
+    if not isinstance(data, dict) or not isinstance(data.get("jobs"), list):
+        raise ValueError(f"Job file {path} must be an object with a 'jobs' list")
+    defaults = data.get("defaults", {})
+    specs = []
+    names = set()
+    for position, entry in enumerate(data["jobs"], start=1):
+        spec = dict(defaults, **entry)
+        spec.setdefault("name", f"job{position}")
+        spec.setdefault("mode", "mirror")
+        for key in ("src", "dest"):
+            if not spec.get(key):
+                raise ValueError(f"Job '{spec['name']}' has no '{key}'")
+        if isinstance(spec["dest"], list):
+            _check_fan_out(spec, entry)
+        elif not isinstance(spec["mode"], str) or spec["mode"] not in MODES:
+            raise ValueError(f"Job '{spec['name']}' has unknown mode '{spec['mode']}'. Expected one of {tuple(MODES)}")
+        unknown = set(spec) - JOB_OPTIONS - {"name", "src", "dest", "mode", "compression", "copy_buffer_size"}
+        if unknown:
+            raise ValueError(f"Job '{spec['name']}' has unknown option(s): {', '.join(sorted(unknown))}")
+        try:
+            Throttle(spec.get("bytes_per_second"), spec.get("files_per_second"), schedule=spec.get("throttle_schedule"))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Job '{spec['name']}' has an invalid throttle: {e}")
+        _check_storage_options(f"Job '{spec['name']}'", spec)
+        try:
+            if spec.get("pack_small_files") is not True:
+                parse_size(spec.get("pack_small_files"))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Job '{spec['name']}' has an invalid pack_small_files: {e}")
+        try:
+            FileFilter.from_value(spec.get("filters"))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Job '{spec['name']}' has invalid filters: {e}")
+        if spec["name"] in names:
+            raise ValueError(f"Job name '{spec['name']}' is used twice")
+        names.add(spec["name"])
+        specs.append(spec)
+    destinations = data.get("destinations", {})
+    for dest, limits in destinations.items():
+        unknown = set(limits) - DESTINATION_OPTIONS if isinstance(limits, dict) else {"(not an object)"}
+        if unknown:
+            raise ValueError(f"Destination '{dest}' has unknown option(s): {', '.join(sorted(unknown))}")
+        try:
+            Throttle(**{key: limits[key] for key in DESTINATION_THROTTLE if key in limits})
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Destination '{dest}' has an invalid throttle: {e}")
+        _check_storage_options(f"Destination '{dest}'", limits)
+    settings = {
+        "max_jobs": data.get("max_jobs", JobRunner.DEFAULT_MAX_JOBS),
+        "max_per_destination": data.get("max_per_destination", JobRunner.DEFAULT_MAX_PER_DESTINATION),
+        "destinations": destinations,
+    }
+    return settings, specs
+
+def _check_fan_out(spec, entry):
+    """A fan-out job: every dest a path, one mode or one per dest, no options it would ignore."""
+    if not all(isinstance(dest, str) and dest for dest in spec["dest"]):
+        raise ValueError(f"Job '{spec['name']}' has an empty or invalid destination in 'dest'")
+    modes = spec["mode"] if isinstance(spec["mode"], list) else [spec["mode"]] * len(spec["dest"])
+    if len(modes) != len(spec["dest"]):
+        raise ValueError(f"Job '{spec['name']}' has {len(modes)} modes for {len(spec['dest'])} destinations")
+    for mode in modes:
+        if mode not in FanOutJob.MODES:
+            raise ValueError(f"Job '{spec['name']}' has unknown fan-out mode '{mode}'. Expected one of {FanOutJob.MODES}")
+    # Only the job's own keys: defaults meant for the other jobs don't make it invalid
+    unsupported = set(entry) & (JOB_OPTIONS | {"copy_buffer_size"}) - FAN_OUT_OPTIONS
+    if unsupported:
+        raise ValueError(f"Job '{spec['name']}' writes to several destinations and does not take: "
+                         f"{', '.join(sorted(unsupported))}")
+
+def _check_storage_options(owner, options):
+    try:
+        RetentionPolicy.from_value(options.get("retention"))
+        parse_size(options.get("min_free_space"), total=100)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"{owner} has an invalid retention setting: {e}")
+
+def build_job(spec, log_callback=None, throttle=None):
+    """
+    BackupJob for one job file entry, or FanOutJob if it has a list of `dest`. `throttle` is
+    the shared destination throttle, if any; for a fan-out job a dict of dest -> Throttle.
+    """
+    if isinstance(spec["dest"], list):
+        modes = spec["mode"] if isinstance(spec["mode"], list) else [spec["mode"]] * len(spec["dest"])
+        kwargs = {key: spec[key] for key in FAN_OUT_OPTIONS - {"compression", "copy_buffer_size"} if key in spec}
+        if "compression" in spec:
+            kwargs["compression_policy"] = CompressionPolicy(**spec["compression"])
+        if "copy_buffer_size" in spec:
+            kwargs["copy_backend"] = default_backend(spec["copy_buffer_size"])
+        return FanOutJob(spec["src"], list(zip(spec["dest"], modes)), log_callback=log_callback, name=spec["name"],
+                         throttles=throttle, **kwargs)
+    kwargs = {key: spec[key] for key in JOB_OPTIONS if key in spec}
+    kwargs.update(MODES[spec["mode"]])
+    if "compression" in spec:
+        kwargs["compression_policy"] = CompressionPolicy(**spec["compression"])
+    if "copy_buffer_size" in spec:
+        kwargs["copy_backend"] = default_backend(spec["copy_buffer_size"])
+    return BackupJob(spec["src"], spec["dest"], log_callback=log_callback, name=spec["name"], throttle=throttle, **kwargs)
+
+class JobResult:
+    def __init__(self, name, dest):
+        self.name = name
+        self.dest = dest
+        self.status = "pending" # pending, running, ok, errors (some files failed), failed, cancelled, skipped
+        self.file_errors = 0
+        self.error = None
+        self.started = None
+        self.duration = 0.0
+        self.report = None # Path of the job's JSON run report
+        self.targets = [] # fan_out.TargetResult per destination of a fan-out job
+
+    def __repr__(self):
+        return f"JobResult(name='{self.name}', status='{self.status}', file_errors={self.file_errors})"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "dest": self.dest,
+            "status": self.status,
+            "file_errors": self.file_errors,
+            "error": self.error,
+            "started": self.started,
+            "duration_seconds": round(self.duration, 3),
+            "report": self.report,
+            "targets": [target.to_dict() for target in self.targets],
+        }
+
+class JobRunner:
+    """
+    Runs independent backup jobs concurrently. At most `max_jobs` run at once, and at most
+    `max_per_destination` of them write to the same destination server (UNC paths) or disk,
+    so jobs sharing a NAS queue behind each other instead of fighting over it. Waiting jobs
+    don't hold a thread; the next job started is the first one in file order that has room.
+    Jobs writing to the same destination also share one Throttle (see destination_throttle()),
+    limited by `destinations` ({path: Throttle keyword arguments}) and adjustable while running.
+    """
+    DEFAULT_MAX_JOBS = 4
+    DEFAULT_MAX_PER_DESTINATION = 1
+
+    def __init__(self, specs, max_jobs=DEFAULT_MAX_JOBS, max_per_destination=DEFAULT_MAX_PER_DESTINATION,
+                 log_callback=None, destinations=None):
+        self.specs = specs
+        self.max_jobs = max(1, int(max_jobs))
+        self.max_per_destination = max(1, int(max_per_destination))
+        self.log_callback = log_callback
+        self.results = [JobResult(spec["name"], spec["dest"]) for spec in specs]
+        self._jobs = {} # name -> BackupJob while running
+        self._throttles = {} # destination key -> Throttle shared by the jobs writing there
+        self._destination_defaults = {} # destination key -> retention options for jobs writing there
+        for dest, limits in (destinations or {}).items():
+            key = self.destination_key(dest)
+            self._throttles[key] = Throttle(**{name: limits[name] for name in DESTINATION_THROTTLE if name in limits})
+            self._destination_defaults[key] = {name: limits[name] for name in DESTINATION_DEFAULTS if name in limits}
+        self._stopping = False
+
+    def __repr__(self):
+        return f"JobRunner(jobs={len(self.specs)}, max_jobs={self.max_jobs}, max_per_destination={self.max_per_destination})"
+
+    # --- Public methods ---
+    def run(self):
+        """
+        Run every job; returns the list of JobResult in job file order.
+        Ctrl+C cancels the running jobs (they resume next time) and skips the rest.
+        """
+        waiting = list(zip(self.specs, self.results))
+        busy = {} # destination key -> running jobs
+        running = {} # future -> (destination keys, result)
+        with ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="job") as pool:
+            while waiting or running:
+                if self._stopping:
+                    for _, result in waiting:
+                        result.status = "skipped"
+                    waiting = []
+                for spec, result in list(waiting):
+                    if len(running) >= self.max_jobs:
+                        break
+                    keys = self._destination_keys(spec["dest"])
+                    if any(busy.get(key, 0) >= self.max_per_destination for key in keys):
+                        continue
+                    waiting.remove((spec, result))
+                    for key in keys:
+                        busy[key] = busy.get(key, 0) + 1
+                    result.status = "running"
+                    running[pool.submit(self._run_job, spec, result)] = (keys, result)
+                if not running:
+                    continue
+                try:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                except KeyboardInterrupt:
+                    self.cancel()
+                    continue
+                for future in done:
+                    keys, result = running.pop(future)
+                    for key in keys:
+                        busy[key] -= 1
+        return self.results
+
+    def cancel(self):
+        """Stop running jobs at their next file boundary and start no more. Safe from any thread."""
+        self._stopping = True
+        for job in list(self._jobs.values()):
+            job.cancel()
+
+    def destination_throttle(self, dest):
+        """The Throttle shared by every job writing where `dest` is; set_limits() on it applies at once."""
+        key = self.destination_key(dest)
+        if key not in self._throttles:
+            self._throttles[key] = Throttle()
+        return self._throttles[key]
+
+    @property
+    def exit_code(self):
+        """0 = every job succeeded, 1 = some files failed, 2 = a job failed or was cancelled."""
+        statuses = {result.status for result in self.results}
+        if statuses & {"failed", "cancelled", "skipped"}:
+            return 2
+        if "errors" in statuses:
+            return 1
+        return 0
+
+    @staticmethod
+    def destination_key(path):
+        """Jobs with the same key share a destination: the server of a UNC path, else the disk."""
+        normalized = path.replace("/", "\\") if path.startswith(("\\\\", "//")) else path
+        if normalized.startswith("\\\\"):
+            return "unc:" + normalized.lstrip("\\").split("\\", 1)[0].lower()
+        try:
+            return f"dev:{os.stat(path).st_dev}"
+        except OSError:
+            return "path:" + os.path.normcase(os.path.abspath(path))
+
+    # --- Internal ---
+    def _destination_keys(self, dest):
+        """Every destination a job writes to (a fan-out job counts against each of them)."""
+        return {self.destination_key(path) for path in dest} if isinstance(dest, list) else {self.destination_key(dest)}
+
+    def _run_job(self, spec, result):
+        result.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        started = time.monotonic()
+        try:
+            if isinstance(spec["dest"], list): # Retention and free space checks are not done by fan-out jobs
+                throttle = {dest: self.destination_throttle(dest) for dest in spec["dest"]}
+            else:
+                spec = dict(self._destination_defaults.get(self.destination_key(spec["dest"]), {}), **spec)
+                throttle = self.destination_throttle(spec["dest"])
+            job = build_job(spec, self.log_callback, throttle)
+            self._jobs[spec["name"]] = job
+            if self._stopping: # Cancelled while this job was being set up
+                raise BackupCancelled("Backup cancelled")
+            ok = job.run()
+            result.file_errors = len(job.errors)
+            result.status = "ok" if ok else "errors"
+        except BackupCancelled:
+            result.status = "cancelled"
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e)
+        finally:
+            job = self._jobs.pop(spec["name"], None)
+            if job is not None:
+                result.report = job.report_path
+                result.targets = getattr(job, "results", [])
+            result.duration = time.monotonic() - started
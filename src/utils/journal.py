@@ -0,0 +1,92 @@
+import os
+import json
+import time
+
+class RunJournal:
+    """
+    Append-only checkpoint log kept in the destination while a run is in progress.
+    The first line identifies the run; every further line is one committed entry:
+        {"key": "mirror:2024-05-01", ...}
+        {"p": "docs/a.txt", "s": 1024, "m": 1700000000.0}
+    A run that finds a journal with its own key resumes from it; a completed run deletes it.
+    Entries are buffered and written in batches; losing the newest batch in a crash only
+    means those entries are redone.
+    """
+    FLUSH_EVERY = 200 # Entries
+    FLUSH_INTERVAL = 2.0 # Seconds
+
+    def __init__(self, path, key, before_flush=None):
+        self.path = path
+        self.key = key
+        self.before_flush = before_flush # Called before each batch is written, e.g. to sync data first
+        self.header = {}
+        self.resumed = False
+        self._file = None
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def __repr__(self):
+        return f"RunJournal(path='{self.path}', key='{self.key}', resumed={self.resumed})"
+
+    # --- Lifecycle ---
+    def open(self, **header):
+        """
+        Start journaling. Returns {rel_path: entry} committed by an interrupted run with the
+        same key, or {} when starting fresh (a journal from a different run is discarded).
+        """
+        entries = {}
+        previous = self._read()
+        if previous and previous[0].get("key") == self.key:
+            self.resumed = True
+            self.header = previous[0]
+            entries = {entry["p"]: entry for entry in previous[1:] if "p" in entry}
+            self._file = open(self.path, "a", encoding="utf-8")
+        else:
+            self.header = dict(header, key=self.key)
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._file.write(json.dumps(self.header) + "\n")
+            self._file.flush()
+        return entries
+
+    def record(self, rel_path, **info):
+        info["p"] = rel_path
+        self._buffer.append(info)
+        if len(self._buffer) >= RunJournal.FLUSH_EVERY or \
+                time.monotonic() - self._last_flush >= RunJournal.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self._file or not self._buffer:
+            return
+        if self.before_flush:
+            self.before_flush()
+        self._file.write("".join(json.dumps(entry) + "\n" for entry in self._buffer))
+        self._file.flush()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self, complete=True):
+        """Flush and close. A completed run removes the journal so the next run starts fresh."""
+        if not self._file:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        if complete:
+            os.remove(self.path)
+
+    # --- Internal ---
+    def _read(self):
+        if not os.path.exists(self.path):
+            return []
+        lines = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        lines.append(json.loads(line))
+                    except ValueError:
+                        break # Torn write at the end of an interrupted run
+        except OSError:
+            return []
+        return lines
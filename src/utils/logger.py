@@ -1,21 +1,30 @@
 import os
 import sys
 import glob
-import socket
+import queue
+import atexit
 import logging
 import tempfile
+import threading
 from datetime import datetime
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
 
 def clean_old_logs(directory, keep_last=90):
-    """Clean old log files, keeping most recent `keep_last`."""
-    files = sorted(glob.glob(os.path.join(directory, "*_backup_*.log")), reverse=True)
-    for f in files[keep_last:]:
-        try:
-            os.remove(f)
-        except Exception:
-            pass
+    """Clean old log files and run reports, keeping the most recent `keep_last` of each."""
+    for pattern in ("*_backup_*.log", "*_report_*.json"):
+        files = sorted(glob.glob(os.path.join(directory, pattern)), reverse=True)
+        for f in files[keep_last:]:
+            try:
+                os.remove(f)
+            except Exception:
+                pass
 
-def get_default_log_dir():
+def get_default_log_dir(create=True):
+    """
+    logs/ next to the executable (or the project root). With create=False no disk is
+    touched, which matters when the executable lives on a slow NAS share.
+    """
     if getattr(sys, 'frozen', False):
         # Running as bundled executable
         base_dir =  os.path.dirname(sys.executable)
@@ -23,44 +32,190 @@ def get_default_log_dir():
         # Running as script
         base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
     log_dir = os.path.join(base_dir, "logs")
-    os.makedirs(log_dir, exist_ok=True)
+    if create:
+        os.makedirs(log_dir, exist_ok=True)
     return log_dir
 
-LOG_DIR = get_default_log_dir() # Default log directory
-HOSTNAME = socket.gethostname() # Get the system hostname
+def get_local_cache_dir(name):
+    """
+    Per-user local folder for caches (`name` is a subfolder), never next to the executable,
+    which may live on the share being backed up.
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "backup_dir_util", name)
+
+@lru_cache(maxsize=None)
+def get_hostname():
+    import socket # Only needed for the log file name
+    return socket.gethostname()
+
+def __getattr__(name):
+    # LOG_DIR and HOSTNAME used to be computed at import; keep them available, but lazily
+    if name == "LOG_DIR":
+        return get_default_log_dir()
+    if name == "HOSTNAME":
+        return get_hostname()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_listeners = {} # Logger name -> BatchingQueueListener
+_listeners_lock = threading.Lock()
 
 def setup_logger(name:str, log_callback=None, log_dir=None):
-    log_dir = log_dir or LOG_DIR
+    """
+    Return the named logger. Callers only put records on a queue; a listener thread
+    does the formatting, the (batched) file writes and the GUI callbacks.
+    """
+    log_dir = log_dir or get_default_log_dir(create=False) # Created by the listener on first write
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG)
     logger.propagate = False # Prevent propagation to root logger
-
-    # Add file handler only if not present
-    file_handler_exists = any(
-        isinstance(h, logging.FileHandler) and h.baseFilename.startswith(log_dir)
-        for h in logger.handlers
-    )
-    if not file_handler_exists:
-        timestamp = datetime.now().strftime("%Y%m%d")
-        file_path = os.path.join(log_dir, f"{HOSTNAME}_backup_{timestamp}.log")
-        file_handler = logging.FileHandler(file_path, encoding="utf-8")
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s - %(levelname)s - %(message)s', "%Y-%m-%d %H:%M:%S"
-        ))
-        logger.addHandler(file_handler)
-    # Add GUI handler only if not present for this callback
-    if log_callback and not any(
-        isinstance(h, LogCallbackHandler) and getattr(h, "callback", None) == log_callback
-        for h in logger.handlers
-    ):
-        gui_handler = LogCallbackHandler(log_callback)
-        gui_handler.setLevel(logging.INFO)
-        gui_handler.setFormatter(logging.Formatter('%(message)s'))
-        logger.addHandler(gui_handler)
+    with _listeners_lock:
+        listener = _listeners.get(name)
+        if listener is None:
+            listener = BatchingQueueListener(queue.SimpleQueue())
+            logger.addHandler(InProcessQueueHandler(listener.queue))
+            listener.start()
+            _listeners[name] = listener
+        # Add file handler only if not present
+        file_handler_exists = any(
+            isinstance(h, logging.FileHandler) and h.baseFilename.startswith(log_dir)
+            for h in listener.handlers
+        )
+        if not file_handler_exists:
+            timestamp = datetime.now().strftime("%Y%m%d")
+            file_path = os.path.join(log_dir, f"{get_hostname()}_backup_{timestamp}.log")
+            file_handler = BatchedFileHandler(file_path, encoding="utf-8")
+            file_handler.setLevel(logging.DEBUG)
+            file_handler.setFormatter(logging.Formatter(
+                '%(asctime)s - %(levelname)s - %(message)s', "%Y-%m-%d %H:%M:%S"
+            ))
+            listener.add_handler(file_handler)
+        # Add GUI handler only if not present for this callback
+        if log_callback and not any(
+            isinstance(h, LogCallbackHandler) and getattr(h, "callback", None) == log_callback
+            for h in listener.handlers
+        ):
+            gui_handler = LogCallbackHandler(log_callback)
+            gui_handler.setLevel(logging.INFO)
+            gui_handler.setFormatter(logging.Formatter('%(message)s'))
+            listener.add_handler(gui_handler)
 
     return logger
 
+def flush_logs():
+    """Block until every record logged so far has been written. Returns immediately if nothing is queued."""
+    with _listeners_lock:
+        listeners = list(_listeners.values())
+    for listener in listeners:
+        listener.drain()
+
+@atexit.register
+def stop_logging():
+    """Write out everything still queued and stop the listener threads."""
+    with _listeners_lock:
+        listeners = list(_listeners.values())
+    for listener in listeners:
+        if listener._thread is not None:
+            listener.stop()
+            listener.flush_handlers()
+
+class InProcessQueueHandler(QueueHandler):
+    """
+    QueueHandler for a listener in the same process. The stock handler formats and copies
+    every record so it can be pickled; here the record is handed over untouched and all
+    formatting happens on the listener thread.
+    """
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+class BatchingQueueListener(QueueListener):
+    """
+    QueueListener that also flushes its handlers whenever the queue has been idle for
+    FLUSH_INTERVAL, so batched output is never held back for long.
+    """
+    FLUSH_INTERVAL = 1.0 # Seconds
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue, respect_handler_level=True)
+
+    def add_handler(self, handler):
+        # Swapped as a whole tuple, so the listener thread never sees a half-updated list
+        self.handlers = self.handlers + (handler,)
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, BatchingQueueListener.FLUSH_INTERVAL if block else None)
+            except queue.Empty:
+                if not block:
+                    raise
+                self.flush_handlers()
+
+    def flush_handlers(self):
+        for handler in self.handlers:
+            handler.flush()
+
+    def drain(self):
+        done = threading.Event()
+        self.queue.put(_FlushMarker(done))
+        done.wait(5)
+
+    def handle(self, record):
+        if isinstance(record, _FlushMarker):
+            self.flush_handlers()
+            record.done.set()
+            return
+        super().handle(record)
+
+class _FlushMarker:
+    """Queue item asking the listener to flush; `done` is set once it has."""
+    def __init__(self, done):
+        self.done = done
+
+class BatchedFileHandler(logging.FileHandler):
+    """
+    FileHandler that collects formatted lines and writes them in one call per batch.
+    A batch goes out when it is full, when the listener goes idle, or straight away for
+    warnings and errors. The file (and its folder) is only created on the first write,
+    on the listener thread.
+    """
+    BATCH_SIZE = 500 # Lines
+
+    def __init__(self, filename, mode="a", encoding=None):
+        super().__init__(filename, mode, encoding, delay=True)
+        self._lines = []
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+    def emit(self, record):
+        try:
+            self._lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+            return
+        if len(self._lines) >= BatchedFileHandler.BATCH_SIZE or record.levelno >= logging.WARNING:
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._lines:
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write("\n".join(self._lines) + "\n")
+                self._lines = []
+            super().flush()
+        finally:
+            self.release()
+
 class LogCallbackHandler(logging.Handler):
     def __init__(self, callback):
         super().__init__()
@@ -0,0 +1,70 @@
+import os
+import json
+import hashlib
+
+class Manifest:
+    """
+    Per-destination record of what the last backup run wrote.
+    Entries are keyed by path relative to the source root:
+        {'docs/a.txt': {'size': 1024, 'mtime': 1700000000.0, 'hash': None}, ...}
+    """
+    VERSION = 1
+    HASH_ALGORITHM = "sha256"
+    CHUNK_SIZE = 1024 * 1024 # 1 MiB
+
+    def __init__(self, path, entries=None):
+        self.path = path
+        self.entries = entries or {}
+
+    # --- Magic methods ---
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, rel_path):
+        return rel_path in self.entries
+
+    def __repr__(self):
+        return f"Manifest(path='{self.path}', entries={len(self.entries)})"
+
+    # --- Persistence ---
+    @classmethod
+    def load(cls, path):
+        """Load a manifest from disk. Returns an empty manifest if missing or unreadable."""
+        if not os.path.exists(path):
+            return cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(path, data.get("entries", {}))
+        except (OSError, ValueError):
+            return cls(path)
+
+    def save(self):
+        """Write atomically so an interrupted run never leaves a truncated manifest."""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": Manifest.VERSION, "entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
+
+    # --- Entries ---
+    def get(self, rel_path):
+        return self.entries.get(rel_path)
+
+    def set(self, rel_path, size, mtime, file_hash=None):
+        self.entries[rel_path] = {'size': size, 'mtime': mtime, 'hash': file_hash}
+
+    def remove(self, rel_path):
+        return self.entries.pop(rel_path, None)
+
+    def is_changed(self, rel_path, size, mtime):
+        entry = self.entries.get(rel_path)
+        return entry is None or entry['size'] != size or entry['mtime'] != mtime
+
+    # --- Utility ---
+    @staticmethod
+    def file_hash(path, algorithm=None):
+        hasher = hashlib.new(algorithm or Manifest.HASH_ALGORITHM)
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(Manifest.CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
@@ -0,0 +1,80 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.manifest import Manifest
+
+class MoveDetector:
+    """
+    Finds files that were moved or renamed in the source since a manifest was written, so the
+    backup can rename what it already has instead of transferring it again. A candidate is a
+    new path whose size and mtime match a path that has vanished; it counts as moved only if
+    the source file's hash equals the hash recorded for the vanished one. Only candidates are
+    hashed (on a pool of threads), so a run with no renames reads nothing extra.
+    Files without a recorded hash, and empty files, are never matched.
+    """
+    DEFAULT_WORKERS = 4
+
+    def __init__(self, workers=DEFAULT_WORKERS, algorithm=None):
+        self.workers = max(1, int(workers))
+        self.algorithm = algorithm or Manifest.HASH_ALGORITHM
+
+    def __repr__(self):
+        return f"MoveDetector(workers={self.workers}, algorithm='{self.algorithm}')"
+
+    def detect(self, index, manifest):
+        """{new_rel_path: (old_rel_path, file_hash)} for files of `index` that moved since `manifest`."""
+        current = {rel_path for rel_path, _, _, _ in index}
+        gone = {} # (size, mtime) -> [old rel_path, ...]
+        for rel_path, entry in manifest.entries.items():
+            if rel_path not in current and entry.get('hash') and entry['size'] > 0:
+                gone.setdefault((entry['size'], entry['mtime']), []).append(rel_path)
+        if not gone:
+            return {}
+        candidates = [
+            (rel_path, size, mtime) for rel_path, size, mtime, _ in index
+            if rel_path not in manifest and (size, mtime) in gone
+        ]
+        moves = {}
+        used = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="move-hash") as pool:
+            digests = pool.map(lambda candidate: self._hash(index.abspath(candidate[0])), candidates)
+            for (rel_path, size, mtime), digest in zip(candidates, digests):
+                for old_path in gone[(size, mtime)]:
+                    if old_path not in used and manifest.get(old_path)['hash'] == digest:
+                        used.add(old_path)
+                        moves[rel_path] = (old_path, digest)
+                        break
+        return moves
+
+    @staticmethod
+    def directory_moves(moves, manifest, source_dirs):
+        """
+        [(old_dir, new_dir), ...] for directories that moved as a whole: every file the manifest
+        has under old_dir moved to the same place under new_dir, and old_dir is gone from the
+        source. Renaming such a directory is one operation instead of one per file.
+        """
+        pairs = Counter()
+        for new_path, (old_path, _) in moves.items():
+            old_parts, new_parts = old_path.split(os.sep), new_path.split(os.sep)
+            # Strip the common tail; what is left is the directory that was renamed or moved
+            common = 0
+            while (common < min(len(old_parts), len(new_parts)) - 1
+                   and old_parts[-1 - common] == new_parts[-1 - common]):
+                common += 1
+            if common:
+                pairs[(os.path.join(*old_parts[:-common]), os.path.join(*new_parts[:-common]))] += 1
+        existing = set(source_dirs)
+        whole = []
+        for (old_dir, new_dir), count in sorted(pairs.items()):
+            prefix = old_dir + os.sep
+            if old_dir in existing or new_dir.startswith(prefix) or old_dir.startswith(new_dir + os.sep):
+                continue
+            if count == sum(1 for rel_path in manifest.entries if rel_path.startswith(prefix)):
+                whole.append((old_dir, new_dir))
+        return whole
+
+    def _hash(self, path):
+        try:
+            return Manifest.file_hash(path, self.algorithm)
+        except OSError:
+            return None # Unreadable now; the copy will report it
@@ -2,12 +2,17 @@ import re
 import subprocess
 from src.utils.logger import setup_logger
 
+def run_command(cmd, timeout):
+    """Default command runner: returns a CompletedProcess with text stdout/stderr."""
+    return subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+
 # Network Drive class
 class NetworkDrive:
     NET_TIMEOUT = 10 # Seconds
-    def __init__(self, drive_letter, unc_path=None):
+    def __init__(self, drive_letter, unc_path=None, runner=None):
         self.drive_letter = drive_letter
         self.unc_path = unc_path 
+        self.runner = runner or run_command # Swappable, e.g. for a stand-in `net` script in tests
         self.logger = setup_logger('backup_app')
 
     # --- Magic methods ---
@@ -57,7 +62,7 @@ class NetworkDrive:
         cmd.append("/persistent:no")
         self.logger.info(f"Mapping {self.drive_letter}: to {self.unc_path}")
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=NetworkDrive.NET_TIMEOUT)
+            result = self.runner(cmd, NetworkDrive.NET_TIMEOUT)
             if result.returncode==0:
                 self.logger.info(f"Mapped successfully.")
                 return True
@@ -72,7 +77,7 @@ class NetworkDrive:
         cmd = ["net", "use", f"{self.drive_letter}:", "/delete", "/y"]
         self.logger.info(f"Unmapping {self.drive_letter}:")
         try:
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=NetworkDrive.NET_TIMEOUT)
+            result = self.runner(cmd, NetworkDrive.NET_TIMEOUT)
             if result.returncode == 0:
                 self.logger.info(f"Unmapped successfully.")
                 return True
@@ -97,12 +102,18 @@ class NetworkDrive:
     def is_network_path(path):
         return path.replace("/", "\\").startswith("\\\\")
     
+    @staticmethod
+    def host_of(unc_path):
+        """Server name of a UNC path (\\\\server\\share -> server), or None."""
+        match = re.match(r"^\\\\([^\\]+)", unc_path.replace("/", "\\")) if unc_path else None
+        return match.group(1) if match else None
+
     @classmethod
-    def from_mapping(cls, mapping:dict):
-        return cls(drive_letter=mapping['drive'][0], unc_path=mapping['remote'])
+    def from_mapping(cls, mapping:dict, runner=None):
+        return cls(drive_letter=mapping['drive'][0], unc_path=mapping['remote'], runner=runner)
     
     @staticmethod
-    def list_mapped():
+    def list_mapped(runner=None):
         """
         Returns a list of currently mapped drives.
         Format: 
@@ -111,38 +122,47 @@ class NetworkDrive:
                 ... 
             ]
         Filters out IPC and printer connections (no drive letter).
+        `runner(cmd, timeout)` runs the command (default: subprocess).
         """
         logger = setup_logger("backup_app")
         try:
-            result = subprocess.run(["net", "use"], capture_output=True, text=True, timeout=NetworkDrive.NET_TIMEOUT)
-            lines = result.stdout.strip().splitlines()
-            mappings = []
-            seen = set()
-            for line in lines:
-                # Match both OK and Disconnected entries
-                if re.match(r"^(OK|Disconnected|DISCONNECTED)\s+", line):
-                    parts = re.split(r"\s{2,}", line.strip())
-                    if len(parts) >= 3:
-                        status = parts[0].strip()
-                        drive = parts[1].strip().upper()
-                        remote = parts[2].strip()
-                        # Filter out entries without drive letters (e.g., IPC$, printers)
-                        if not re.fullmatch(r"[A-Z]:", drive):
-                            logger.debug(f"Skipping non-drive mapping: {line}")
-                            continue
-                        if drive in seen:
-                            logger.warning(f"Duplicate drive entry found: {drive}")
-                            continue
-                        seen.add(drive)
-                        mappings.append({
-                            'drive': drive,
-                            'remote': remote,
-                            'status': status
-                        })
-                    else:
-                        logger.debug(f"Skipping malformed net use line: {line}")
-            return mappings
+            result = (runner or run_command)(["net", "use"], NetworkDrive.NET_TIMEOUT)
+            return NetworkDrive.parse_net_use(result.stdout)
         except Exception as e:
             logger = setup_logger("backup_app")
             logger.error(f"Failed to list map drives: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    @staticmethod
+    def parse_net_use(output):
+        """Mappings listed in the output of `net use`, as returned by list_mapped()."""
+        logger = setup_logger("backup_app")
+        lines = output.strip().splitlines()
+        mappings = []
+        seen = set()
+        for line in lines:
+            # Match OK, Disconnected and Unavailable entries. "Disconnected" fills its column,
+            # so only one space may follow it
+            match = re.match(r"^(OK|Disconnected|Unavailable|Reconnecting)\s+(.*)$", line.strip(), re.IGNORECASE)
+            if match:
+                parts = [match.group(1)] + re.split(r"\s{2,}", match.group(2))
+                if len(parts) >= 3:
+                    status = parts[0].strip()
+                    drive = parts[1].strip().upper()
+                    remote = parts[2].strip()
+                    # Filter out entries without drive letters (e.g., IPC$, printers)
+                    if not re.fullmatch(r"[A-Z]:", drive):
+                        logger.debug(f"Skipping non-drive mapping: {line}")
+                        continue
+                    if drive in seen:
+                        logger.warning(f"Duplicate drive entry found: {drive}")
+                        continue
+                    seen.add(drive)
+                    mappings.append({
+                        'drive': drive,
+                        'remote': remote,
+                        'status': status
+                    })
+                else:
+                    logger.debug(f"Skipping malformed net use line: {line}")
+        return mappings
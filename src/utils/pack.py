@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import stat
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src.utils.copy_engine import CopyResult
+
+PACK_DIR = ".packs" # Inside the mirror, so an archived mirror keeps its packs
+_BUNDLE = re.compile(r"^pack-(\d+)\.json$")
+
+class PackWriter:
+    """
+    Packs small files into a few large bundle files instead of creating each one on the
+    destination. Over SMB every file costs several round trips (create, write, set times,
+    close), so thousands of 2 KB files are bound by latency, not bandwidth; a bundle is one
+    file, written in large sequential blocks. Each bundle pack-000001.bin has an index
+    pack-000001.json next to it:
+        {"files": {"src/a.c": {"o": 0, "n": 2048, "m": 1700000000.0, "x": 420, "h": "..."}}}
+    (offset, length, mtime, permission bits, hash). Both are written under a `.part` name and
+    renamed when complete, the index last, so a bundle without an index doesn't count.
+    Bundles are written in parallel, one per worker; callbacks run on the calling thread,
+    except `progress(amount)`, which is told the bytes of each file as it is packed.
+    """
+    DEFAULT_THRESHOLD = 64 * 1024 # Files smaller than this are packed
+    BUNDLE_SIZE = 32 * 1024 * 1024
+    BUNDLE_FILES = 4096 # Files per bundle at most, so progress and cancel stay responsive
+    WRITE_SIZE = 4 * 1024 * 1024 # Bytes gathered before each write to the bundle
+    QUEUE_DEPTH = 2 # Bundles in flight per worker
+
+    def __init__(self, pack_dir, workers=4, algorithm=None, throttle=None, bundle_size=BUNDLE_SIZE,
+                 progress=None):
+        self.pack_dir = pack_dir
+        self.workers = max(1, int(workers))
+        self.algorithm = algorithm # None: no hashes recorded
+        self.throttle = throttle
+        self.bundle_size = bundle_size
+        self.progress = progress
+
+    def __repr__(self):
+        return f"PackWriter(pack_dir='{self.pack_dir}', workers={self.workers}, bundle_size={self.bundle_size})"
+
+    # --- Public methods ---
+    def write_index(self, index, progress_callback=None, on_packed=None):
+        """
+        Pack every file of a FileIndex. on_packed(bundle, {rel_path: entry}) runs once per
+        finished bundle. Returns a CopyResult counting packed files and per-file errors.
+        """
+        os.makedirs(self.pack_dir, exist_ok=True)
+        self._remove_parts()
+        result = CopyResult()
+        total = len(index)
+        processed = 0
+        pending = {}
+        groups = self._groups(index, self._next_number())
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pack") as pool:
+            while True:
+                for number, files in groups:
+                    pending[pool.submit(self._write_bundle, number, files, index)] = files
+                    if len(pending) >= self.workers * PackWriter.QUEUE_DEPTH:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files = pending.pop(future)
+                    try:
+                        bundle, entries, errors = future.result()
+                    except Exception as e:
+                        # The bundle as a whole failed (e.g. the destination went away)
+                        result.errors.extend((index.abspath(rel_path), e) for rel_path, _, _, _ in files)
+                    else:
+                        result.copied += len(entries)
+                        result.errors.extend(errors)
+                        if on_packed:
+                            on_packed(bundle, entries)
+                    processed += len(files)
+                    if progress_callback:
+                        progress_callback(processed, total)
+        return result
+
+    # --- Internal ---
+    def _groups(self, index, first_number):
+        """(bundle number, files) groups in scan order, so each folder's files stay together."""
+        number = first_number
+        files, size = [], 0
+        for entry in index:
+            files.append(entry)
+            size += entry[1]
+            if size >= self.bundle_size or len(files) >= PackWriter.BUNDLE_FILES:
+                yield number, files
+                number += 1
+                files, size = [], 0
+        if files:
+            yield number, files
+
+    def _write_bundle(self, number, files, index):
+        bundle = f"pack-{number:06d}"
+        bin_path = os.path.join(self.pack_dir, f"{bundle}.bin")
+        entries = {}
+        errors = []
+        buffer = bytearray()
+        offset = 0
+        if self.throttle:
+            self.throttle.consume_file() # One file on the destination, however many it holds
+        with open(f"{bin_path}.part", "wb") as out:
+            for rel_path, _, mtime, mode in files:
+                try:
+                    with open(index.abspath(rel_path), "rb") as f:
+                        data = f.read()
+                except OSError as e:
+                    errors.append((index.abspath(rel_path), e))
+                    continue
+                entry = {"o": offset, "n": len(data), "m": mtime, "x": stat.S_IMODE(mode)}
+                if self.algorithm:
+                    entry["h"] = hashlib.new(self.algorithm, data).hexdigest()
+                entries[rel_path] = entry
+                buffer += data
+                offset += len(data)
+                if self.progress:
+                    self.progress(len(data))
+                if len(buffer) >= PackWriter.WRITE_SIZE:
+                    self._write(out, buffer)
+            self._write(out, buffer)
+        os.replace(f"{bin_path}.part", bin_path)
+        index_path = os.path.join(self.pack_dir, f"{bundle}.json")
+        with open(f"{index_path}.part", "w", encoding="utf-8") as f:
+            json.dump({"files": entries}, f)
+        os.replace(f"{index_path}.part", index_path)
+        return bundle, entries, errors
+
+    def _write(self, out, buffer):
+        if self.throttle and buffer:
+            self.throttle.consume_bytes(len(buffer))
+        out.write(buffer)
+        buffer.clear()
+
+    def _next_number(self):
+        """Number after the highest bundle already there, so a resumed run adds to it."""
+        numbers = [int(match.group(1)) for match in map(_BUNDLE.match, os.listdir(self.pack_dir)) if match]
+        return max(numbers, default=0) + 1
+
+    def _remove_parts(self):
+        for name in os.listdir(self.pack_dir):
+            if name.endswith(".part"):
+                os.remove(os.path.join(self.pack_dir, name))
+
+class PackReader:
+    """
+    Reads files back out of the bundles a PackWriter wrote. Single files are one seek and
+    one read; extract() reads each bundle front to back, merging neighbouring files into
+    large reads, so restoring a whole folder is as fast as copying one big file.
+    """
+    READ_SIZE = 8 * 1024 * 1024 # Largest single read when extracting
+    MAX_GAP = 256 * 1024 # Unwanted bytes read through rather than seeking past them
+
+    def __init__(self, pack_dir):
+        self.pack_dir = pack_dir
+        self.entries = {} # rel_path -> (bundle, {"o", "n", "m", "x", "h"})
+        if os.path.isdir(pack_dir):
+            for name in sorted(os.listdir(pack_dir)):
+                if _BUNDLE.match(name):
+                    with open(os.path.join(pack_dir, name), "r", encoding="utf-8") as f:
+                        files = json.load(f)["files"]
+                    bundle = name[:-len(".json")]
+                    self.entries.update((rel_path, (bundle, entry)) for rel_path, entry in files.items())
+
+    # --- Magic methods ---
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, rel_path):
+        return rel_path in self.entries
+
+    def __repr__(self):
+        return f"PackReader(pack_dir='{self.pack_dir}', files={len(self.entries)})"
+
+    # --- Public methods ---
+    def read(self, rel_path):
+        """Content of one packed file."""
+        bundle, entry = self.entries[rel_path]
+        with open(self._bundle_path(bundle), "rb") as f:
+            f.seek(entry["o"])
+            data = f.read(entry["n"])
+        if len(data) != entry["n"]:
+            raise ValueError(f"Bundle {bundle} is truncated at {rel_path}")
+        return data
+
+    def hash(self, rel_path):
+        """Recorded hash of a packed file, or None."""
+        return self.entries[rel_path][1].get("h")
+
+    def extract(self, target_dir, rel_paths=None, workers=4, progress_callback=None):
+        """
+        Restore `rel_paths` (every packed file if None; a folder name selects what's under it)
+        into `target_dir` with their mtimes and permissions. Bundles are read in parallel.
+        Returns a CopyResult; files that fail are collected per file.
+        """
+        selected = self.select(rel_paths)
+        by_bundle = {}
+        for rel_path in selected:
+            bundle, entry = self.entries[rel_path]
+            by_bundle.setdefault(bundle, []).append((rel_path, entry))
+        result = CopyResult()
+        processed = 0
+        with ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="unpack") as pool:
+            futures = {
+                pool.submit(self._extract_bundle, bundle, files, target_dir): files
+                for bundle, files in by_bundle.items()
+            }
+            for future in futures:
+                files = futures[future]
+                try:
+                    errors = future.result()
+                except Exception as e:
+                    errors = [(rel_path, e) for rel_path, _ in files]
+                result.copied += len(files) - len(errors)
+                result.errors.extend(errors)
+                processed += len(files)
+                if progress_callback:
+                    progress_callback(processed, len(selected))
+        return result
+
+    def select(self, rel_paths=None):
+        """Packed paths matching `rel_paths` (files or folders), all of them if None."""
+        if rel_paths is None:
+            return list(self.entries)
+        wanted = [os.path.normpath(rel_path) for rel_path in rel_paths]
+        prefixes = tuple(rel_path + os.sep for rel_path in wanted)
+        names = set(wanted)
+        return [rel_path for rel_path in self.entries if rel_path in names or rel_path.startswith(prefixes)]
+
+    # --- Internal ---
+    def _extract_bundle(self, bundle, files, target_dir):
+        errors = []
+        files.sort(key=lambda item: item[1]["o"])
+        with open(self._bundle_path(bundle), "rb") as f:
+            for run in self._runs(files):
+                start = run[0][1]["o"]
+                f.seek(start)
+                data = f.read(run[-1][1]["o"] + run[-1][1]["n"] - start)
+                for rel_path, entry in run:
+                    piece = data[entry["o"] - start:entry["o"] - start + entry["n"]]
+                    try:
+                        if len(piece) != entry["n"]:
+                            raise ValueError(f"Bundle {bundle} is truncated at {rel_path}")
+                        self._write_file(os.path.join(target_dir, rel_path), piece, entry)
+                    except (OSError, ValueError) as e:
+                        errors.append((rel_path, e))
+        return errors
+
+    @staticmethod
+    def _runs(files):
+        """Group offset-sorted files into reads of at most READ_SIZE with small gaps."""
+        run = []
+        for item in files:
+            entry = item[1]
+            if run:
+                first, last = run[0][1], run[-1][1]
+                if (entry["o"] - (last["o"] + last["n"]) > PackReader.MAX_GAP
+                        or entry["o"] + entry["n"] - first["o"] > PackReader.READ_SIZE):
+                    yield run
+                    run = []
+            run.append(item)
+        if run:
+            yield run
+
+    @staticmethod
+    def _write_file(path, data, entry):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        if "x" in entry:
+            os.chmod(path, entry["x"])
+        os.utime(path, (entry["m"], entry["m"]))
+
+    def _bundle_path(self, bundle):
+        return os.path.join(self.pack_dir, f"{bundle}.bin")
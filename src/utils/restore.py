@@ -0,0 +1,609 @@
+import os
+import io
+import re
+import json
+import lzma
+import math
+import time
+import struct
+import shutil
+import sqlite3
+import hashlib
+import zlib
+import zipfile
+from datetime import datetime, date, time as day_time
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.logger import get_local_cache_dir
+from src.utils.manifest import Manifest
+from src.utils.scanner import scan
+from src.utils.zip_chain import ZipChain
+from src.utils.pack import PackReader, PACK_DIR
+from src.utils.copy_engine import CopyEngine, CopyResult
+from src.utils.fast_copy import shared_backend
+
+TREE_KINDS = ("mirror", "snapshot", "archive")
+STATE_KINDS = ("mirror", "snapshot", "zip") # Hold the whole source as it was when they were written
+# A damaged or changed archive fails the member being read, not the restore
+MEMBER_ERRORS = (OSError, ValueError, EOFError, zipfile.BadZipFile, zlib.error, lzma.LZMAError)
+
+def get_default_cache_dir():
+    """Local folder for restore index caches."""
+    return get_local_cache_dir("restore")
+
+def parse_as_of(value):
+    """
+    Timestamp for an `as_of` given as a datetime, a date or an ISO string; a date alone means
+    the end of that day. None (the newest backup) stays None.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            value = date.fromisoformat(text) if len(text) == 10 else datetime.fromisoformat(text)
+        except ValueError:
+            raise ValueError(f"Invalid date: '{text}'. Expected YYYY-MM-DD or YYYY-MM-DDTHH:MM[:SS].")
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, day_time.max)
+    return value.timestamp()
+
+class FileVersion:
+    """One backed-up copy of a file and where it is stored."""
+    def __init__(self, rel_path, size, mtime, file_hash, source, kind, created, mode=None,
+                 bundle=None, position=None, compressed=None, record_end=None, method=None, crc=None):
+        self.rel_path = rel_path # "/"-separated, relative to the source root
+        self.size = size
+        self.mtime = mtime
+        self.hash = file_hash
+        self.source = source # Backup holding it, relative to the destination
+        self.kind = kind # mirror, snapshot, archive, zip or chain
+        self.created = created # When that backup was written (for archives: when this version was replaced)
+        self.mode = mode
+        self.bundle = bundle # Packed files: bundle name and offset in it
+        self.position = position # ZIP members: local header offset, compressed size and end of the record
+        self.compressed = compressed
+        self.record_end = record_end
+        self.method = method
+        self.crc = crc
+
+    def __repr__(self):
+        return f"FileVersion(rel_path='{self.rel_path}', source='{self.source}', kind='{self.kind}')"
+
+    @property
+    def location(self):
+        """Human-readable place of this copy, relative to the destination."""
+        if self.kind in ("zip", "chain"):
+            return f"{self.source}:{self.rel_path}"
+        if self.bundle:
+            return f"{os.path.join(self.source, PACK_DIR, self.bundle)}.bin@{self.position}"
+        return os.path.join(self.source, *self.rel_path.split("/"))
+
+    def to_dict(self):
+        return {
+            "path": self.rel_path,
+            "size": self.size,
+            "mtime": datetime.fromtimestamp(self.mtime).isoformat(timespec="seconds"),
+            "hash": self.hash,
+            "backup": self.source,
+            "kind": self.kind,
+            "backup_time": datetime.fromtimestamp(self.created).isoformat(timespec="seconds"),
+            "location": self.location,
+        }
+
+class RestoreIndex:
+    """
+    Local cache of what every backup of one source folder (`name`) in `dest` holds:
+        <name>/                             the live mirror (and its .packs bundles)
+        backups/<name>_<date>/              snapshots (they have a manifest) and trees archived
+                                            by mirror or incremental runs
+        <name>_<date>.zip                   daily ZIP archives
+        <name>_<date>_<time>_<type>.zip     ZIP chain archives
+    so "where is this file as of that date" is a query, not a walk of the share. The cache is
+    a SQLite file in a local folder (see get_default_cache_dir()); refresh() only re-reads
+    backups that are new or changed since they were cached. A ZIP's central directory is read
+    once and its members are cached with their offsets, so extracting one later never reads
+    the central directory again.
+    """
+    SCHEMA_VERSION = 1
+    FILE_COLUMNS = "rel_path, size, mtime, hash, mode, bundle, position, compressed, record_end, method, crc"
+
+    def __init__(self, dest, name, cache_dir=None, log=None):
+        self.dest = dest
+        self.name = name
+        self.log = log or (lambda msg, level="info": None)
+        cache_dir = cache_dir or get_default_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        key = hashlib.sha1(f"{os.path.abspath(dest)}\0{name}".encode("utf-8")).hexdigest()[:16]
+        label = re.sub(r"[^\w.-]+", "_", name)
+        self.cache_path = os.path.join(cache_dir, f"{label}-{key}.sqlite")
+        self._tree_pattern = re.compile(rf"^{re.escape(name)}_(\d{{4}}-\d{{2}}-\d{{2}})$")
+        self._zip_pattern = re.compile(rf"^{re.escape(name)}_(\d{{4}}-\d{{2}}-\d{{2}})\.zip$")
+        self._db = self._connect()
+
+    def __repr__(self):
+        return f"RestoreIndex(dest='{self.dest}', name='{self.name}', cache='{self.cache_path}')"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self._db.close()
+
+    # --- Cache ---
+    def refresh(self):
+        """Bring the cache up to date with the destination. Returns (indexed, forgotten) backup counts."""
+        found = self._discover()
+        cached = {path: (source_id, signature) for source_id, path, signature
+                  in self._db.execute("SELECT id, path, signature FROM sources")}
+        forgotten = 0
+        for path, (source_id, signature) in cached.items():
+            if path not in found or not signature or signature != found[path][2]:
+                self._forget(source_id)
+                forgotten += path not in found
+        indexed = 0
+        for path, (kind, created, signature, parent) in found.items():
+            if path in cached and signature and signature == cached[path][1]:
+                continue
+            try:
+                self._index(path, kind, created, signature, parent)
+                indexed += 1
+            except (OSError, ValueError, zipfile.BadZipFile) as e:
+                self.log(f"Restore index: could not read {path}: {e}", level="warning")
+        if indexed or forgotten:
+            self.log(f"Restore index: {indexed} backup(s) indexed, {forgotten} gone ({self.cache_path}).", level="debug")
+        return indexed, forgotten
+
+    # --- Queries ---
+    def backups(self):
+        """[(path, kind, created timestamp, files), ...] of every cached backup, oldest first."""
+        return list(self._db.execute(
+            "SELECT s.path, s.kind, s.created, COUNT(f.source) FROM sources s "
+            "LEFT JOIN files f ON f.source = s.id GROUP BY s.id ORDER BY s.created"
+        ))
+
+    def versions(self, rel_path):
+        """Every cached copy of one file, oldest backup first."""
+        rows = self._db.execute(
+            f"SELECT {self._columns('f')}, s.path, s.kind, s.created FROM files f JOIN sources s ON s.id = f.source "
+            "WHERE f.rel_path = ? ORDER BY s.created", (self._key(rel_path),)
+        )
+        return [self._version(row) for row in rows]
+
+    def locate(self, rel_path, as_of=None):
+        """The FileVersion of `rel_path` that was current at `as_of` (default: newest), or None."""
+        key = self._key(rel_path)
+        if not key:
+            return None
+        return self.select([key], as_of).get(key)
+
+    def select(self, paths=None, as_of=None):
+        """
+        {rel_path: FileVersion} of the files in `paths` (files or folders relative to the source;
+        everything if None) as they were at `as_of` (datetime, date or ISO string; default newest).
+        The newest backup written at or before `as_of` that holds the whole source (mirror,
+        snapshot, ZIP or ZIP chain) decides which files existed. A file a later mirror or
+        incremental run replaced or removed is taken from the tree it was archived to, if its
+        mtime shows it was already there at `as_of`. Before the first full backup, unchanged
+        files of an incremental mirror count as well.
+        """
+        limit = parse_as_of(as_of)
+        limit = math.inf if limit is None else limit
+        sources = {row[0]: row[1:] for row in self._db.execute("SELECT id, path, kind, created, parent FROM sources")}
+        state, state_created, chain = self._state(sources, limit)
+        by_path = {}
+        for row in self._rows(paths):
+            by_path.setdefault(row[0], []).append(row)
+        deleted = set()
+        if chain:
+            deleted = {(source_id, rel_path) for source_id, rel_path in self._deleted(paths, chain)}
+        selected = {}
+        for rel_path, rows in by_path.items():
+            row = self._pick(rel_path, rows, sources, limit, state, state_created, chain, deleted)
+            if row is not None:
+                selected[rel_path] = self._version(row)
+        return selected
+
+    # --- Discovery ---
+    def _discover(self):
+        """{path relative to dest: (kind, created, signature, parent)} of every backup in the destination."""
+        found = {}
+        today = date.today().isoformat()
+        mirror = os.path.join(self.dest, self.name)
+        if os.path.isdir(mirror):
+            found[self.name] = ("mirror", *self._tree_state(mirror, os.path.join(self.dest, f".{self.name}.manifest.json")), None)
+        backups_dir = os.path.join(self.dest, "backups")
+        if os.path.isdir(backups_dir):
+            with os.scandir(backups_dir) as entries:
+                for entry in entries:
+                    match = self._tree_pattern.match(entry.name)
+                    if not match or not entry.is_dir():
+                        continue
+                    manifest_path = os.path.join(backups_dir, f".{entry.name}.manifest.json")
+                    path = os.path.join("backups", entry.name)
+                    if os.path.exists(manifest_path):
+                        found[path] = ("snapshot", *self._tree_state(entry.path, manifest_path), None)
+                        continue
+                    # Holds what the run of that day replaced: those versions were current until then
+                    created = datetime.fromisoformat(match.group(1)).timestamp()
+                    signature = "" if match.group(1) == today else self._signature(entry.path)
+                    found[path] = ("archive", created, signature, None)
+        with os.scandir(self.dest) as entries:
+            for entry in entries:
+                if self._zip_pattern.match(entry.name):
+                    st = entry.stat()
+                    found[entry.name] = ("zip", st.st_mtime, f"{st.st_size}:{st.st_mtime_ns}", None)
+        for archive in ZipChain(self.dest, self.name).archives:
+            try:
+                st = os.stat(os.path.join(self.dest, archive["file"]))
+            except OSError:
+                continue
+            created = datetime.fromisoformat(archive["created"]).timestamp()
+            found[archive["file"]] = ("chain", created, f"{st.st_size}:{st.st_mtime_ns}", archive["parent"])
+        return found
+
+    def _tree_state(self, root, manifest_path):
+        """(created, signature) of a mirror or snapshot: when its manifest was written, or the folder's mtime."""
+        try:
+            st = os.stat(manifest_path)
+            return st.st_mtime, f"manifest:{st.st_size}:{st.st_mtime_ns}:{self._signature(os.path.join(root, PACK_DIR))}"
+        except OSError:
+            st = os.stat(root)
+            return st.st_mtime, self._signature(root)
+
+    @staticmethod
+    def _signature(root):
+        try:
+            signature = f"dir:{os.stat(root).st_mtime_ns}"
+        except OSError:
+            return "none"
+        packs = os.path.join(root, PACK_DIR)
+        if os.path.isdir(packs):
+            signature += f":{os.stat(packs).st_mtime_ns}"
+        return signature
+
+    # --- Indexing ---
+    def _index(self, path, kind, created, signature, parent):
+        full_path = os.path.join(self.dest, path)
+        deleted = []
+        if kind in TREE_KINDS:
+            rows = self._tree_rows(full_path, path)
+        else:
+            rows, deleted = self._zip_rows(full_path, path, kind)
+        with self._db:
+            cursor = self._db.execute(
+                "INSERT INTO sources (path, kind, created, signature, parent) VALUES (?, ?, ?, ?, ?)",
+                (path, kind, created, signature, parent),
+            )
+            source_id = cursor.lastrowid
+            self._db.executemany(
+                f"INSERT INTO files (source, {RestoreIndex.FILE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                ((source_id, *row) for row in rows),
+            )
+            self._db.executemany("INSERT INTO deleted (source, rel_path) VALUES (?, ?)",
+                                 ((source_id, rel_path) for rel_path in deleted))
+
+    def _tree_rows(self, root, path):
+        if path == self.name:
+            manifest = Manifest.load(os.path.join(self.dest, f".{self.name}.manifest.json"))
+        else:
+            manifest = Manifest.load(os.path.join(os.path.dirname(root), f".{os.path.basename(root)}.manifest.json"))
+        if len(manifest):
+            files = ((rel_path, entry["size"], entry["mtime"], entry.get("hash")) for rel_path, entry in manifest.entries.items())
+        else:
+            files = ((rel_path, size, mtime, None) for rel_path, size, mtime, _ in scan(root))
+        for rel_path, size, mtime, file_hash in files:
+            if rel_path.split(os.sep, 1)[0] != PACK_DIR:
+                yield (ZipChain.arcname(rel_path), size, mtime, file_hash, None, None, None, None, None, None, None)
+        reader = PackReader(os.path.join(root, PACK_DIR))
+        for rel_path, (bundle, entry) in reader.entries.items():
+            yield (ZipChain.arcname(rel_path), entry["n"], entry["m"], entry.get("h"), entry.get("x"),
+                   bundle, entry["o"], None, None, None, None)
+
+    def _zip_rows(self, zip_path, path, kind):
+        with zipfile.ZipFile(zip_path) as zipf:
+            infos = sorted(zipf.infolist(), key=lambda info: info.header_offset)
+            end_of_members = zipf.start_dir
+            deleted = []
+            if kind == "chain":
+                manifest = json.loads(zipf.read(ZipChain.MANIFEST_MEMBER))
+                known = {arcname: (entry[1], entry[2] if len(entry) > 2 else None) for arcname, entry in manifest["files"].items()}
+                deleted = manifest["deleted"]
+            else:
+                sidecar = Manifest.load(os.path.join(os.path.dirname(zip_path), f".{path}.manifest.json"))
+                known = {arcname: (entry["mtime"], entry.get("hash")) for arcname, entry in sidecar.entries.items()}
+        rows = []
+        for position, info in enumerate(infos):
+            if info.is_dir() or info.filename == ZipChain.MANIFEST_MEMBER:
+                continue
+            record_end = infos[position + 1].header_offset if position + 1 < len(infos) else end_of_members
+            mtime, file_hash = known.get(info.filename, (None, None))
+            if mtime is None:
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+            rows.append((info.filename, info.file_size, mtime, file_hash, (info.external_attr >> 16) & 0o7777 or None,
+                         None, info.header_offset, info.compress_size, record_end, info.compress_type, info.CRC))
+        return rows, deleted
+
+    def _forget(self, source_id):
+        with self._db:
+            self._db.execute("DELETE FROM files WHERE source = ?", (source_id,))
+            self._db.execute("DELETE FROM deleted WHERE source = ?", (source_id,))
+            self._db.execute("DELETE FROM sources WHERE id = ?", (source_id,))
+
+    # --- Selection ---
+    @staticmethod
+    def _state(sources, limit):
+        """
+        (source id, created, chain) of the newest backup of the whole source at or before `limit`.
+        For a ZIP chain, `chain` lists the archives to replay, newest first.
+        """
+        state, state_created, chain = None, -math.inf, None
+        for source_id, (_, kind, created, _) in sources.items():
+            if kind in STATE_KINDS and state_created < created <= limit:
+                state, state_created = source_id, created
+        archives = [(created, source_id) for source_id, (_, kind, created, _) in sources.items()
+                    if kind == "chain" and created <= limit]
+        if archives:
+            created, newest = max(archives)
+            if created > state_created:
+                by_file = {path: source_id for source_id, (path, kind, _, _) in sources.items() if kind == "chain"}
+                chain = [newest]
+                while sources[chain[-1]][3]:
+                    parent = by_file.get(sources[chain[-1]][3])
+                    if parent is None:
+                        chain = None # Broken chain; fall back to the other backups
+                        break
+                    chain.append(parent)
+                if chain:
+                    state, state_created = newest, created
+        return state, state_created, chain
+
+    @staticmethod
+    def _pick(rel_path, rows, sources, limit, state, state_created, chain, deleted):
+        """The row of `rel_path` current at `limit`, or None if it didn't exist then."""
+        # A version archived after `limit` (and after the state backup) was the current one at `limit`
+        archived = [row for row in rows if row[-2] == "archive" and state_created < row[-1]
+                    and row[-1] > limit and row[2] <= limit]
+        if archived:
+            return min(archived, key=lambda row: row[-1])
+        by_source = {row[-4]: row for row in rows}
+        if chain:
+            for source_id in chain:
+                if source_id in by_source:
+                    return by_source[source_id]
+                if (source_id, rel_path) in deleted:
+                    return None
+            return None
+        if state is not None:
+            return by_source.get(state)
+        # Older than any full backup: an incremental mirror still holds files it never replaced
+        for row in rows:
+            if row[-2] == "mirror" and row[2] <= limit:
+                return row
+        return None
+
+    def _rows(self, paths):
+        """Rows (file columns..., source id, path, kind, created) of the files under `paths`."""
+        query = (f"SELECT {self._columns('f')}, f.source, s.path, s.kind, s.created "
+                 "FROM files f JOIN sources s ON s.id = f.source")
+        for clause, params in self._path_clauses(paths, "f"):
+            yield from self._db.execute(f"{query} {clause}", params)
+
+    def _deleted(self, paths, chain):
+        marks = ", ".join("?" * len(chain))
+        for clause, params in self._path_clauses(paths, "d"):
+            clause = f"{clause} AND d.source IN ({marks})" if clause else f"WHERE d.source IN ({marks})"
+            yield from self._db.execute(f"SELECT d.source, d.rel_path FROM deleted d {clause}", (*params, *chain))
+
+    def _path_clauses(self, paths, table):
+        """WHERE clauses matching each path itself or anything under it; one empty clause for everything."""
+        keys = None if paths is None else [self._key(path) for path in paths]
+        if keys is None or "" in keys:
+            yield "", ()
+            return
+        for key in dict.fromkeys(keys):
+            # "0" sorts right after "/", so the range is exactly what lies under key/
+            yield (f"WHERE {table}.rel_path = ? OR ({table}.rel_path >= ? AND {table}.rel_path < ?)",
+                   (key, key + "/", key + "0"))
+
+    @staticmethod
+    def _key(rel_path):
+        key = os.path.normpath(rel_path).replace(os.sep, "/").strip("/")
+        return "" if key == "." else key
+
+    @staticmethod
+    def _columns(table):
+        return ", ".join(f"{table}.{column.strip()}" for column in RestoreIndex.FILE_COLUMNS.split(","))
+
+    @staticmethod
+    def _version(row):
+        (rel_path, size, mtime, file_hash, mode, bundle, position, compressed, record_end, method, crc) = row[:11]
+        source, kind, created = row[-3:]
+        return FileVersion(rel_path, size, mtime, file_hash, source, kind, created, mode, bundle, position,
+                           compressed, record_end, method, crc)
+
+    # --- Internal ---
+    def _connect(self):
+        try:
+            db = sqlite3.connect(self.cache_path)
+            if db.execute("PRAGMA user_version").fetchone()[0] != RestoreIndex.SCHEMA_VERSION:
+                db.executescript("DROP TABLE IF EXISTS sources; DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS deleted;")
+        except sqlite3.DatabaseError:
+            # A damaged cache is only a cache: start over
+            db.close()
+            os.remove(self.cache_path)
+            db = sqlite3.connect(self.cache_path)
+        db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS sources (
+                id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, kind TEXT NOT NULL,
+                created REAL NOT NULL, signature TEXT NOT NULL, parent TEXT);
+            CREATE TABLE IF NOT EXISTS files (
+                source INTEGER NOT NULL, rel_path TEXT NOT NULL, size INTEGER, mtime REAL, hash TEXT,
+                mode INTEGER, bundle TEXT, position INTEGER, compressed INTEGER, record_end INTEGER,
+                method INTEGER, crc INTEGER);
+            CREATE INDEX IF NOT EXISTS files_by_path ON files (rel_path);
+            CREATE INDEX IF NOT EXISTS files_by_source ON files (source);
+            CREATE TABLE IF NOT EXISTS deleted (source INTEGER NOT NULL, rel_path TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS deleted_by_source ON deleted (source);
+            PRAGMA user_version = {RestoreIndex.SCHEMA_VERSION};
+        """)
+        return db
+
+class Restorer:
+    """
+    Writes FileVersions (see RestoreIndex.select()) back out under a target folder, on a pool
+    of threads: tree files are copied by a CopyEngine, packed files read from their bundles,
+    and ZIP members read straight from their cached offsets. Members next to each other are
+    fetched in one read of up to READ_SIZE; larger members are streamed on their own.
+    """
+    READ_SIZE = 8 * 1024 * 1024
+    MAX_GAP = 256 * 1024 # Unwanted bytes read through rather than starting a new read
+    CHUNK_SIZE = 1024 * 1024
+    LOCAL_HEADER = struct.Struct("<4s22xHH") # Signature, then file name and extra field lengths
+
+    def __init__(self, dest, workers=CopyEngine.DEFAULT_WORKERS, copy_backend=None):
+        self.dest = dest
+        self.workers = max(1, int(workers))
+        self.copy_backend = copy_backend or shared_backend()
+
+    def __repr__(self):
+        return f"Restorer(dest='{self.dest}', workers={self.workers})"
+
+    def extract(self, versions, target_dir, progress_callback=None):
+        """
+        Restore `versions` under `target_dir` at their relative paths, with their mtimes.
+        Returns a CopyResult; failures are collected per file.
+        """
+        files, packed, zipped = [], {}, {}
+        for version in versions:
+            if version.kind in ("zip", "chain"):
+                zipped.setdefault(version.source, []).append(version)
+            elif version.bundle:
+                packed.setdefault(version.source, []).append(version)
+            else:
+                files.append(version)
+        total = len(versions)
+        result = CopyResult()
+        done = 0
+
+        def counted(processed, _):
+            if progress_callback:
+                progress_callback(done + processed, total)
+        if files:
+            part = self._copy_files(files, target_dir, counted)
+            result.copied += part.copied
+            result.errors.extend(part.errors)
+            done += len(files)
+        for source, members in packed.items():
+            reader = PackReader(os.path.join(self.dest, source, PACK_DIR))
+            part = reader.extract(target_dir, [os.path.join(*v.rel_path.split("/")) for v in members], self.workers, counted)
+            result.copied += part.copied
+            result.errors.extend(part.errors)
+            done += len(members)
+        if zipped:
+            part = self._extract_zipped(zipped, target_dir, counted)
+            result.copied += part.copied
+            result.errors.extend(part.errors)
+        return result
+
+    # --- Trees ---
+    def _copy_files(self, versions, target_dir, progress_callback):
+        pairs = []
+        for version in versions:
+            rel_path = os.path.join(*version.rel_path.split("/"))
+            dst_file = os.path.join(target_dir, rel_path)
+            os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+            pairs.append((os.path.join(self.dest, version.source, rel_path), dst_file, rel_path, version.size, version.mtime))
+        engine = CopyEngine(self.workers, copy_function=self.copy_backend.copy)
+        return engine.copy_files(pairs, progress_callback)
+
+    # --- ZIP members ---
+    def _extract_zipped(self, zipped, target_dir, progress_callback):
+        result = CopyResult()
+        runs = []
+        for source, members in zipped.items():
+            members.sort(key=lambda version: version.position)
+            runs.extend((os.path.join(self.dest, source), run) for run in self._runs(members))
+        processed = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="restore") as pool:
+            futures = {pool.submit(self._extract_run, zip_path, run, target_dir): run for zip_path, run in runs}
+            for future, run in futures.items():
+                try:
+                    errors = future.result()
+                except Exception as e:
+                    errors = [(version.rel_path, e) for version in run]
+                result.copied += len(run) - len(errors)
+                result.errors.extend(errors)
+                processed += len(run)
+                progress_callback(processed, None)
+        return result
+
+    @staticmethod
+    def _runs(members):
+        """Group offset-sorted members into reads of at most READ_SIZE with small gaps."""
+        run = []
+        for version in members:
+            if run and (version.position - run[-1].record_end > Restorer.MAX_GAP
+                        or version.record_end - run[0].position > Restorer.READ_SIZE):
+                yield run
+                run = []
+            run.append(version)
+        if run:
+            yield run
+
+    def _extract_run(self, zip_path, run, target_dir):
+        errors = []
+        with open(zip_path, "rb") as f:
+            if len(run) == 1 and run[0].record_end - run[0].position > Restorer.READ_SIZE:
+                version = run[0]
+                try:
+                    f.seek(version.position)
+                    f.seek(version.position + self._header_size(f.read(Restorer.LOCAL_HEADER.size), version))
+                    self._write_member(f, version, target_dir)
+                except MEMBER_ERRORS as e:
+                    errors.append((version.rel_path, e))
+                return errors
+            start = run[0].position
+            f.seek(start)
+            data = f.read(run[-1].record_end - start)
+        for version in run:
+            offset = version.position - start
+            try:
+                offset += self._header_size(data[offset:offset + Restorer.LOCAL_HEADER.size], version)
+                self._write_member(io.BytesIO(data[offset:offset + version.compressed]), version, target_dir)
+            except MEMBER_ERRORS as e:
+                errors.append((version.rel_path, e))
+        return errors
+
+    @staticmethod
+    def _header_size(header, version):
+        if len(header) < Restorer.LOCAL_HEADER.size:
+            raise zipfile.BadZipFile(f"Archive {version.source} is truncated at {version.rel_path}")
+        signature, name_length, extra_length = Restorer.LOCAL_HEADER.unpack(header)
+        if signature != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"No member header for {version.rel_path} in {version.source}; the archive changed")
+        return Restorer.LOCAL_HEADER.size + name_length + extra_length
+
+    @staticmethod
+    def _write_member(fileobj, version, target_dir):
+        """Decompress one member from `fileobj` (positioned at its data), checking its CRC-32."""
+        zinfo = zipfile.ZipInfo(version.rel_path)
+        zinfo.compress_type = version.method
+        zinfo.compress_size = version.compressed
+        zinfo.file_size = version.size
+        zinfo.CRC = version.crc
+        path = os.path.join(target_dir, *version.rel_path.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with zipfile.ZipExtFile(fileobj, "r", zinfo) as src, open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst, Restorer.CHUNK_SIZE)
+        except MEMBER_ERRORS:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        if version.mode:
+            os.chmod(path, version.mode)
+        os.utime(path, (version.mtime, version.mtime))
@@ -0,0 +1,339 @@
+import os
+import re
+import json
+import shutil
+import threading
+from datetime import datetime, date
+from src.utils.zip_chain import ZipChain
+
+def parse_size(value, total=None):
+    """
+    A size from a job file: bytes, a string with a K/M/G/T suffix (powers of 1024), or a
+    percentage of `total` such as "10%". None, "" and 0 return None.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if value > 0 else None
+    text = str(value).strip()
+    if text.endswith("%"):
+        if total is None:
+            raise ValueError(f"A percentage ('{value}') needs the size of the disk")
+        return int(total * float(text[:-1]) / 100) or None
+    match = re.fullmatch(r"([\d.]+)\s*([kmgt]?)i?b?", text, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size: '{value}'. Expected bytes, optionally with K, M, G or T, or a percentage.")
+    return int(float(match.group(1)) * 1024 ** " kmgt".index(match.group(2).lower() or " ")) or None
+
+class RetentionPolicy:
+    """
+    Grandfather-father-son retention: keep the newest backup of each of the last `daily`
+    days that have one, of the last `weekly` ISO weeks, `monthly` months and `yearly`
+    years. A backup kept by any rule stays; the newest backup is always kept.
+    """
+    RULES = ("daily", "weekly", "monthly", "yearly")
+
+    def __init__(self, daily=7, weekly=4, monthly=12, yearly=0):
+        self.daily = int(daily)
+        self.weekly = int(weekly)
+        self.monthly = int(monthly)
+        self.yearly = int(yearly)
+        if min(self.daily, self.weekly, self.monthly, self.yearly) < 0 or not any(self.counts().values()):
+            raise ValueError("A retention policy needs at least one positive daily/weekly/monthly/yearly count")
+
+    def __repr__(self):
+        return f"RetentionPolicy(daily={self.daily}, weekly={self.weekly}, monthly={self.monthly}, yearly={self.yearly})"
+
+    @classmethod
+    def from_value(cls, value):
+        """A policy from a job file dict like {"daily": 7, "weekly": 4}, or an existing policy."""
+        if value is None or isinstance(value, RetentionPolicy):
+            return value
+        if not isinstance(value, dict) or set(value) - set(RetentionPolicy.RULES):
+            raise ValueError(f"Invalid retention policy: {value}. Expected keys among {RetentionPolicy.RULES}")
+        return cls(**{rule: value.get(rule, 0) for rule in RetentionPolicy.RULES})
+
+    def counts(self):
+        return {rule: getattr(self, rule) for rule in RetentionPolicy.RULES}
+
+    def select(self, dated):
+        """
+        `dated` is [(key, datetime), ...]; returns {key: reason} for the ones to keep,
+        e.g. {"x_2024-05-31": "daily, monthly"}.
+        """
+        newest_first = sorted(dated, key=lambda item: item[1], reverse=True)
+        periods = {
+            "daily": lambda moment: moment.date(),
+            "weekly": lambda moment: moment.isocalendar()[:2],
+            "monthly": lambda moment: (moment.year, moment.month),
+            "yearly": lambda moment: moment.year,
+        }
+        kept = {}
+        for rule, count in self.counts().items():
+            seen = set()
+            for key, moment in newest_first:
+                if len(seen) >= count:
+                    break
+                period = periods[rule](moment)
+                if period not in seen:
+                    seen.add(period)
+                    kept.setdefault(key, []).append(rule)
+        if newest_first:
+            kept.setdefault(newest_first[0][0], []).append("newest")
+        return {key: ", ".join(reasons) for key, reasons in kept.items()}
+
+class PruneResult:
+    def __init__(self):
+        self.removed = [] # Item paths, relative to the destination
+        self.kept = 0
+        self.reclaimed_bytes = 0
+        self.errors = [] # [(path, error), ...]
+
+    def __repr__(self):
+        return f"PruneResult(removed={len(self.removed)}, kept={self.kept}, reclaimed_bytes={self.reclaimed_bytes})"
+
+class RetentionManager:
+    """
+    Applies a RetentionPolicy to the backups one job (source folder `name`) keeps in `dest`:
+        backups/<name>_<date>/              archived mirrors, incremental archives, snapshots
+        <name>_<date>.zip                   daily ZIP archives
+        <name>_<date>_<time>_<type>.zip     ZIP chain archives; an archive a kept one is
+                                            built on (its parent chain) is kept as well
+    Each of the three kinds is retained on its own. Sidecar manifests go with their backup.
+    Sizes come from a cached index,
+    .<name>.retention.json, so planning and free-space checks don't re-walk archived trees:
+    a tree is walked once, after the day it belongs to, and again only if its folder changes.
+    The index also remembers how much space the last run took (see record_run()).
+    """
+    def __init__(self, dest, name, policy, log=None, cancelled=None):
+        self.dest = dest
+        self.name = name
+        self.policy = policy
+        self.log = log or (lambda msg, level="info": None)
+        self.cancelled = cancelled # threading.Event; stops a prune between items
+        self.index_path = os.path.join(dest, f".{name}.retention.json")
+        self.result = None # PruneResult of the last prune
+        self._thread = None
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+        self._tree_pattern = re.compile(rf"^{re.escape(name)}_(\d{{4}}-\d{{2}}-\d{{2}})$")
+        self._zip_pattern = re.compile(rf"^{re.escape(name)}_(\d{{4}}-\d{{2}}-\d{{2}})\.zip$")
+
+    def __repr__(self):
+        return f"RetentionManager(dest='{self.dest}', name='{self.name}', policy={self.policy!r})"
+
+    # --- Queries ---
+    def items(self):
+        """{relative path: (datetime, [sidecar relative paths], chain archive or None, kind)} of every backup found."""
+        found = {}
+        backups_dir = os.path.join(self.dest, "backups")
+        if os.path.isdir(backups_dir):
+            for entry in os.listdir(backups_dir):
+                match = self._tree_pattern.match(entry)
+                if match and os.path.isdir(os.path.join(backups_dir, entry)):
+                    sidecars = [os.path.join("backups", f".{entry}.manifest.json")]
+                    found[os.path.join("backups", entry)] = (datetime.fromisoformat(match.group(1)), sidecars, None, "tree")
+        for entry in os.listdir(self.dest):
+            match = self._zip_pattern.match(entry)
+            if match:
+                found[entry] = (datetime.fromisoformat(match.group(1)), [f".{entry}.manifest.json"], None, "zip")
+        for archive in ZipChain(self.dest, self.name).archives:
+            if os.path.exists(os.path.join(self.dest, archive["file"])):
+                found[archive["file"]] = (datetime.fromisoformat(archive["created"]), [], archive, "chain")
+        return found
+
+    def plan(self, items=None):
+        """(keep, doomed): {path: reason} of backups to keep, sorted list of paths to remove."""
+        items = self.items() if items is None else items
+        # Each kind of backup (trees, daily ZIPs, ZIP chain) gets the full policy of its own
+        keep = {}
+        for kind in ("tree", "zip", "chain"):
+            keep.update(self.policy.select([(path, item[0]) for path, item in items.items() if item[3] == kind]))
+        # Chain archives are only restorable together with the archives they build on
+        by_file = {item[2]["file"]: item[2] for item in items.values() if item[2]}
+        for path in list(keep):
+            archive = items[path][2]
+            while archive and archive.get("parent") in by_file:
+                archive = by_file[archive["parent"]]
+                keep.setdefault(archive["file"], f"needed by {path}")
+        doomed = sorted((path for path in items if path not in keep), key=lambda path: items[path][0])
+        return keep, doomed
+
+    def size_of(self, path):
+        """Bytes held by one backup (each hard-linked file once), from the index when possible."""
+        full_path = os.path.join(self.dest, path)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            return 0
+        if not os.path.isdir(full_path):
+            return st.st_size
+        with self._lock:
+            cached = self._index["items"].get(path)
+        if cached and cached["mtime_ns"] == st.st_mtime_ns:
+            return cached["bytes"]
+        size = self._walk_size(full_path)
+        # Today's tree may still be written to; only finished days are worth caching
+        if path[-10:] != date.today().isoformat():
+            with self._lock:
+                self._index["items"][path] = {"bytes": size, "mtime_ns": st.st_mtime_ns}
+        return size
+
+    def estimated_reclaim(self):
+        """Upper bound of what pruning would free now (hard links shared with kept snapshots free less)."""
+        _, doomed = self.plan()
+        return sum(self.size_of(path) for path in doomed)
+
+    @property
+    def last_run_bytes(self):
+        """Space the last recorded run took in the destination, or None."""
+        return self._index.get("last_run_bytes")
+
+    # --- Actions ---
+    def prune(self, dry_run=False):
+        """Remove every backup the policy doesn't keep. Returns a PruneResult."""
+        result = PruneResult()
+        items = self.items()
+        keep, doomed = self.plan(items)
+        result.kept = len(keep)
+        chain = None
+        for path in doomed:
+            if self.cancelled is not None and self.cancelled.is_set():
+                self.log("Retention: prune stopped by cancel.", level="warning")
+                break
+            full_path = os.path.join(self.dest, path)
+            if dry_run:
+                self.log(f"Retention: would remove {path} ({self.size_of(path) / (1024 * 1024):.1f} MiB)")
+                result.removed.append(path)
+                result.reclaimed_bytes += self.size_of(path)
+                continue
+            self.log(f"Retention: removing {path}", level="debug")
+            try:
+                if os.path.isdir(full_path):
+                    result.reclaimed_bytes += self._remove_tree(full_path, result.errors)
+                else:
+                    result.reclaimed_bytes += os.path.getsize(full_path)
+                    os.remove(full_path)
+                for sidecar in items[path][1]:
+                    sidecar_path = os.path.join(self.dest, sidecar)
+                    if os.path.exists(sidecar_path):
+                        os.remove(sidecar_path)
+            except OSError as e:
+                result.errors.append((full_path, e))
+                continue
+            if items[path][2] is not None:
+                chain = chain or ZipChain(self.dest, self.name)
+                chain.forget([path])
+            result.removed.append(path)
+            with self._lock:
+                self._index["items"].pop(path, None)
+        if not dry_run:
+            self.save_index()
+        self.result = result
+        verb = "would reclaim" if dry_run else "reclaimed"
+        self.log(
+            f"Retention ({self._describe_policy()}): {len(result.removed)} removed, {result.kept} kept, "
+            f"{result.reclaimed_bytes / (1024 * 1024):.1f} MiB {verb}."
+        )
+        for path, error in result.errors[:20]:
+            self.log(f"Retention: could not remove {path}: {error}", level="warning")
+        return result
+
+    def start(self, dry_run=False):
+        """Prune on a background thread; wait() returns the PruneResult."""
+        self._thread = threading.Thread(target=self._prune_safely, args=(dry_run,), name="retention", daemon=True)
+        self._thread.start()
+
+    def wait(self):
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.result
+
+    def record_run(self, used_bytes):
+        """Remember how much space a run took, as the estimate for the next free-space check."""
+        with self._lock:
+            self._index["last_run_bytes"] = max(0, int(used_bytes))
+        self.save_index()
+
+    def save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with self._lock:
+            data = json.dumps(self._index, indent=2)
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            self.log(f"Could not save retention index: {e}", level="warning")
+
+    # --- Internal ---
+    def _prune_safely(self, dry_run):
+        try:
+            self.prune(dry_run)
+        except Exception as e:
+            self.log(f"Retention prune failed: {e}", level="error")
+            self.result = PruneResult()
+            self.result.errors.append((self.dest, e))
+
+    def _describe_policy(self):
+        return ", ".join(f"{count} {rule}" for rule, count in self.policy.counts().items() if count)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("items", {})
+        return index
+
+    @staticmethod
+    def _walk_size(root):
+        seen = set()
+        total = 0
+        for current, _, files in os.walk(root):
+            for file in files:
+                try:
+                    st = os.lstat(os.path.join(current, file))
+                except OSError:
+                    continue
+                if (st.st_dev, st.st_ino) not in seen:
+                    seen.add((st.st_dev, st.st_ino))
+                    total += st.st_size
+        return total
+
+    @staticmethod
+    def _remove_tree(root, errors):
+        """Delete a tree bottom-up; returns the bytes actually freed (files whose last link went)."""
+        freed = 0
+        for current, dirs, files in os.walk(root, topdown=False):
+            for file in files:
+                path = os.path.join(current, file)
+                try:
+                    st = os.lstat(path)
+                    os.remove(path)
+                    if st.st_nlink <= 1:
+                        freed += st.st_size
+                except OSError as e:
+                    errors.append((path, e))
+            try:
+                os.rmdir(current)
+            except OSError as e:
+                errors.append((current, e))
+        return freed
+
+def check_free_space(path, min_free, needed=0):
+    """
+    Raise RuntimeError unless `path`'s disk would keep `min_free` (bytes, "50G" or "10%")
+    free after writing `needed` more bytes. Returns the current shutil.disk_usage().
+    """
+    usage = shutil.disk_usage(path)
+    threshold = parse_size(min_free, usage.total) or 0
+    if usage.free - needed < threshold:
+        mib = 1024 * 1024
+        raise RuntimeError(
+            f"Not enough free space in {path}: {usage.free / mib:.0f} MiB free, this run needs about "
+            f"{needed / mib:.0f} MiB and {threshold / mib:.0f} MiB must stay free"
+        )
+    return usage
@@ -0,0 +1,288 @@
+import os
+import re
+import json
+import time
+import heapq
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from src.utils.logger import get_default_log_dir, get_hostname
+
+class RunStats:
+    """
+    Instrumentation for one backup run, cheap enough to leave on:
+        phases     wall time, files and bytes per phase (scan, archive, copy, compress, verify...)
+        progress   byte-weighted progress of the running phase with a throughput and ETA, so
+                   one 40 GB file moves the bar as it is copied instead of all at once
+        latency    histograms of per-file copy times and per-directory listing times, plus
+                   the slowest files and directories, to spot a NAS slowing down
+    Bytes are reported by the data path as they are written (add_bytes, from any thread),
+    per-file latencies by whichever thread wrote the file (file_done); files by the progress
+    callback. Everything else runs on the backup's own thread.
+    """
+    LATENCY_BOUNDS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0) # Seconds; histogram bucket upper bounds
+    SLOWEST = 10 # Slowest files and directories kept for the report
+    RATE_WINDOW = 10.0 # Seconds of recent throughput the ETA is based on
+    SAMPLE_INTERVAL = 0.5
+
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.phases = {} # name -> {"seconds", "files", "bytes"}
+        self.bytes_done = 0 # Every phase, every byte written
+        self.files_done = 0
+        self.file_latency = [0] * (len(RunStats.LATENCY_BOUNDS) + 1)
+        self.listing_latency = [0] * (len(RunStats.LATENCY_BOUNDS) + 1)
+        self._lock = threading.Lock()
+        self._task = None # Progress of the running phase
+        self._samples = deque() # (time.monotonic(), task bytes done) for the throughput
+        self._slowest_files = [] # Min-heap of (seconds, path, size)
+        self._slowest_listings = [] # Min-heap of (seconds, rel_dir, entries)
+        self._dir_seconds = {} # Parent directory -> [copy seconds, files, bytes]
+
+    def __repr__(self):
+        return f"RunStats(phases={list(self.phases)}, files_done={self.files_done}, bytes_done={self.bytes_done})"
+
+    # --- Phases ---
+    @contextmanager
+    def phase(self, name, files=None, bytes=None, files_offset=0, counted=True):
+        """
+        Time a phase. With `files` and/or `bytes` totals it also becomes the phase that
+        progress() describes. Phases that run more than once (e.g. archiving file by file)
+        add up. `files_offset` is how many files the progress callback has already counted
+        before this phase starts (e.g. packed files ahead of the copy). A phase that is not
+        `counted` (verify reads back what was written) keeps its files to itself instead of
+        adding them to the run's totals.
+        """
+        started = time.monotonic()
+        task = None
+        if files is not None or bytes is not None:
+            task = self._begin(name, files, bytes, files_offset, counted)
+        try:
+            yield
+        finally:
+            with self._lock:
+                totals = self.phases.setdefault(name, {"seconds": 0.0, "files": 0, "bytes": 0})
+                totals["seconds"] += time.monotonic() - started
+                if task is not None:
+                    totals["files"] += task["files_done"]
+                    totals["bytes"] += task["bytes_done"]
+                    self._task = None
+
+    def set_totals(self, files=None, bytes=None):
+        """Totals of the running phase, once known (e.g. what a snapshot copies after linking)."""
+        with self._lock:
+            if self._task is None:
+                return
+            if files is not None:
+                self._task["files"] = files
+            if bytes is not None:
+                self._task["bytes"] = bytes
+
+    # --- Recording ---
+    def add_bytes(self, amount):
+        """Bytes written by the data path; safe from any thread."""
+        now = time.monotonic()
+        with self._lock:
+            task = self._task
+            if task is None or task["counted"]:
+                self.bytes_done += amount
+            if task is None:
+                return
+            task["bytes_done"] += amount
+            if not self._samples or now - self._samples[-1][0] >= RunStats.SAMPLE_INTERVAL:
+                self._sample(now)
+
+    def files_progress(self, done, total):
+        """The progress callback's (done, total) for the running phase."""
+        with self._lock:
+            task = self._task
+            if task is None:
+                return
+            done, total = done - task["offset"], total - task["offset"]
+            if task["counted"]:
+                self.files_done += max(done - task["files_done"], 0)
+            task["files_done"] = done
+            task["files"] = total
+            now = time.monotonic()
+            if not task["bytes"] and (not self._samples or now - self._samples[-1][0] >= RunStats.SAMPLE_INTERVAL):
+                self._sample(now)
+
+    def file_done(self, path, size, seconds):
+        """One copied (or archived) file and how long it took; safe from any thread."""
+        with self._lock:
+            self.file_latency[bisect.bisect_left(RunStats.LATENCY_BOUNDS, seconds)] += 1
+            self._keep_slowest(self._slowest_files, (seconds, path, size))
+            totals = self._dir_seconds.setdefault(os.path.dirname(path), [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+            totals[2] += size or 0
+
+    def dir_listed(self, rel_dir, seconds, entries):
+        """One directory listed by the scanner and how long it took."""
+        self.listing_latency[bisect.bisect_left(RunStats.LATENCY_BOUNDS, seconds)] += 1
+        self._keep_slowest(self._slowest_listings, (seconds, rel_dir, entries))
+
+    # --- Queries ---
+    def progress(self):
+        """
+        Progress of the running phase, or None between phases:
+            {"phase", "files_done", "files", "bytes_done", "bytes", "by", "fraction", "rate", "eta"}
+        `by` is "bytes" when the phase knows its byte total, "files" otherwise, and `fraction` follows it;
+        `rate` is bytes (or files) per second over the last RATE_WINDOW, `eta` seconds or None.
+        """
+        with self._lock:
+            task = self._task
+            if task is None:
+                return None
+            by_bytes = bool(task["bytes"])
+            done, total = (task["bytes_done"], task["bytes"]) if by_bytes else (task["files_done"], task["files"])
+            self._sample(time.monotonic())
+            rate = self._rate()
+            info = dict(task)
+        info.pop("started")
+        info.pop("offset")
+        info.pop("counted")
+        info["fraction"] = min(done / total, 1.0) if total else None
+        info["rate"] = rate
+        info["eta"] = max(total - done, 0) / rate if total and rate else None
+        info["by"] = "bytes" if by_bytes else "files"
+        return info
+
+    def to_dict(self):
+        """Everything recorded, for the JSON run report."""
+        finished = self.finished or time.time()
+        seconds = max(finished - self.started, 1e-9)
+        labels = [f"<{self._label(bound)}" for bound in RunStats.LATENCY_BOUNDS] \
+            + [f">={self._label(RunStats.LATENCY_BOUNDS[-1])}"]
+        slowest_dirs = heapq.nlargest(RunStats.SLOWEST, self._dir_seconds.items(), key=lambda item: item[1][0])
+        report = {
+            "seconds": round(seconds, 3),
+            "files": self.files_done,
+            "bytes": self.bytes_done,
+            "files_per_second": round(self.files_done / seconds, 1),
+            "bytes_per_second": round(self.bytes_done / seconds),
+            "phases": {
+                name: dict(
+                    totals, seconds=round(totals["seconds"], 3),
+                    bytes_per_second=round(totals["bytes"] / totals["seconds"]) if totals["seconds"] else None,
+                    files_per_second=round(totals["files"] / totals["seconds"], 1) if totals["seconds"] else None,
+                )
+                for name, totals in self.phases.items()
+            },
+            "file_latency": dict(zip(labels, self.file_latency)),
+            "slowest_files": [
+                {"path": path, "size": size, "seconds": round(seconds, 4)}
+                for seconds, path, size in sorted(self._slowest_files, reverse=True)
+            ],
+            "slowest_copy_directories": [
+                {"path": path, "seconds": round(totals[0], 3), "files": totals[1], "bytes": totals[2]}
+                for path, totals in slowest_dirs
+            ],
+            "listing_latency": dict(zip(labels, self.listing_latency)),
+            "slowest_listings": [
+                {"path": rel_dir or ".", "entries": entries, "seconds": round(seconds, 4)}
+                for seconds, rel_dir, entries in sorted(self._slowest_listings, reverse=True)
+            ],
+        }
+        if not any(self.file_latency): # Nothing timed: leave it out rather than claim no slow files
+            for key in ("file_latency", "slowest_files", "slowest_copy_directories"):
+                del report[key]
+        return report
+
+    # --- Internal ---
+    def _begin(self, name, files, bytes, offset, counted):
+        with self._lock:
+            self._task = {"phase": name, "files_done": 0, "files": files, "bytes_done": 0, "bytes": bytes,
+                          "offset": offset, "counted": counted, "started": time.monotonic()}
+            self._samples.clear()
+            return self._task
+
+    def _sample(self, now):
+        """Record progress now (lock held) and drop samples older than the rate window."""
+        task = self._task
+        self._samples.append((now, task["bytes_done"] if task["bytes"] else task["files_done"]))
+        while len(self._samples) > 2 and now - self._samples[0][0] > RunStats.RATE_WINDOW:
+            self._samples.popleft()
+
+    def _rate(self):
+        if len(self._samples) < 2:
+            return None
+        (first, done_first), (last, done_last) = self._samples[0], self._samples[-1]
+        if last - first < RunStats.SAMPLE_INTERVAL:
+            return None
+        return (done_last - done_first) / (last - first)
+
+    @staticmethod
+    def _keep_slowest(heap, item):
+        if len(heap) < RunStats.SLOWEST:
+            heapq.heappush(heap, item)
+        elif item[0] > heap[0][0]:
+            heapq.heapreplace(heap, item)
+
+    @staticmethod
+    def _label(seconds):
+        return f"{seconds * 1000:g}ms" if seconds < 1 else f"{seconds:g}s"
+
+class RunReporting:
+    """
+    Logging and the JSON run report, shared by BackupJob and FanOutJob. The job sets `name`,
+    `src`, `dest`, `logger`, `errors`, `stats`, `file_filter`, `report_dir` and `report_path`,
+    has a _mode_name(), and adds its own entries through _report_details().
+    """
+    def _report_target(self):
+        """Where the run wrote and how, for the report."""
+        return {"dest": self.dest, "mode": self._mode_name()}
+
+    def _report_details(self):
+        """The job's own report entries, after the common ones."""
+        return {}
+
+    def _write_report(self, status, error=None):
+        """Write the run's JSON report next to the log file. A report that can't be written never fails the run."""
+        label = re.sub(r"[^\w.-]+", "_", self.name or os.path.basename(os.path.normpath(self.src)))
+        report = {"job": self.name, "src": self.src}
+        report.update(self._report_target())
+        report.update({
+            "status": status, # ok, errors (some files failed), failed or cancelled
+            "error": error,
+            "file_errors": len(self.errors),
+            "started": datetime.fromtimestamp(self.stats.started).isoformat(timespec="seconds"),
+            "finished": datetime.fromtimestamp(self.stats.finished).isoformat(timespec="seconds"),
+        })
+        report.update(self._report_details())
+        report["filters"] = self.file_filter.to_dict() if self.file_filter else None
+        report.update(self.stats.to_dict())
+        try:
+            report_dir = self.report_dir or get_default_log_dir()
+            os.makedirs(report_dir, exist_ok=True)
+            path = os.path.join(report_dir, f"{get_hostname()}_report_{label}_{datetime.now():%Y%m%d-%H%M%S}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            self.log(f"Could not write the run report: {e}", level="warning")
+            return
+        self.report_path = path
+        self.log(f"Run report written to: {path}", level="debug")
+
+    def _build_logger_proxy(self, log_callback):
+        def log(msg, level="info"):
+            if self.name:
+                msg = f"[{self.name}] {msg}"
+            getattr(self.logger, level)(msg)
+            if log_callback and level != "debug": # Per-file detail stays in the log file
+                log_callback(msg)
+        return log
+
+def format_eta(seconds):
+    """"1h02m", "4m05s", "12s", or "--" when unknown."""
+    if seconds is None:
+        return "--"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
@@ -0,0 +1,237 @@
+import os
+import time
+from array import array
+
+class FileIndex:
+    """
+    Compact, column-oriented listing of a source tree built by a single scan.
+    Each file is a directory id, a name and three packed numbers, so trees with
+    millions of entries don't pay for a Python object (or an os.stat_result) per file.
+    """
+    __slots__ = ("root", "dirs", "names", "dir_ids", "sizes", "mtimes", "modes", "errors", "total_bytes")
+
+    def __init__(self, root):
+        self.root = root
+        self.dirs = [""] # Relative directory paths, "" is the root itself
+        self.names = []
+        self.dir_ids = array("L")
+        self.sizes = array("q")
+        self.mtimes = array("d")
+        self.modes = array("L")
+        self.errors = [] # [(path, error), ...] for entries that could not be listed or stat'ed
+        self.total_bytes = 0
+
+    # --- Magic methods ---
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        """Yields (rel_path, size, mtime, mode) in scan order."""
+        dirs = self.dirs
+        for i, name in enumerate(self.names):
+            rel_dir = dirs[self.dir_ids[i]]
+            rel_path = os.path.join(rel_dir, name) if rel_dir else name
+            yield rel_path, self.sizes[i], self.mtimes[i], self.modes[i]
+
+    def __repr__(self):
+        return f"FileIndex(root='{self.root}', files={len(self)}, bytes={self.total_bytes})"
+
+    # --- Building ---
+    def add_dir(self, rel_dir):
+        self.dirs.append(rel_dir)
+        return len(self.dirs) - 1
+
+    def add(self, dir_id, name, size, mtime, mode):
+        self.dir_ids.append(dir_id)
+        self.names.append(name)
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        self.modes.append(mode)
+        self.total_bytes += size
+
+    # --- Queries ---
+    @property
+    def subdirs(self):
+        """Relative paths of every directory below the root, parents before children."""
+        return self.dirs[1:]
+
+    def abspath(self, rel_path):
+        return os.path.join(self.root, rel_path)
+
+    def subset(self, keep):
+        """New index holding only the files for which keep(rel_path, size, mtime, mode) is true."""
+        sub = FileIndex(self.root)
+        sub.dirs = self.dirs
+        for i, entry in enumerate(self):
+            if keep(*entry):
+                sub.add(self.dir_ids[i], self.names[i], self.sizes[i], self.mtimes[i], self.modes[i])
+        return sub
+
+def scan(root, on_listed=None, file_filter=None, rel_root=""):
+    """
+    Walk `root` once with os.scandir and return a FileIndex.
+    Directory entries carry their own stat data on Windows, so a network share is
+    listed without a separate stat round trip per file. Symlinked directories are
+    not followed, matching os.walk. on_listed(rel_dir, seconds, entries) is called
+    after each directory, e.g. to find the slow ones on a share.
+    With a filters.FileFilter, skipped files are left out and excluded directories are
+    never listed. `rel_root` is where `root` lies below the folder its rules apply to.
+    """
+    index = FileIndex(root)
+    stack = [(root, 0)]
+    while stack:
+        path, dir_id = stack.pop()
+        rel_dir = index.dirs[dir_id]
+        started = time.perf_counter() if on_listed else None
+        files_before = len(index)
+        filter_dir = _join(rel_root, rel_dir) # Where the filter's rules see this directory
+        try:
+            with os.scandir(path) as entries:
+                subdirs = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if file_filter and file_filter.skip_dir(_join(filter_dir, entry.name)):
+                                continue
+                            subdirs.append(entry)
+                            continue
+                        if entry.is_symlink() and entry.is_dir():
+                            continue
+                        st = entry.stat()
+                    except OSError as e:
+                        index.errors.append((entry.path, e))
+                        continue
+                    if file_filter and file_filter.skip_file(_join(filter_dir, entry.name), st.st_size, st.st_mtime):
+                        continue
+                    index.add(dir_id, entry.name, st.st_size, st.st_mtime, st.st_mode)
+        except OSError as e:
+            index.errors.append((path, e))
+            continue
+        if on_listed:
+            on_listed(rel_dir, time.perf_counter() - started, len(index) - files_before + len(subdirs))
+        # Reverse so the stack pops directories in listing order
+        for entry in reversed(subdirs):
+            child_id = index.add_dir(os.path.join(rel_dir, entry.name) if rel_dir else entry.name)
+            stack.append((entry.path, child_id))
+    return index
+
+def rescan(root, previous, dirty, on_listed=None, file_filter=None):
+    """
+    FileIndex of `root` built from an earlier listing plus fresh listings of only the folders
+    that changed since, so the cost follows the amount of change rather than the tree size.
+    `previous` is a list of (rel_path, size, mtime) as of the earlier listing (e.g. from a
+    manifest) and `dirty` is {rel_dir: recursive}: each folder is listed again on its own, or
+    scanned with everything below it when recursive. Subfolders a listing finds for the first
+    time are scanned whole; ones it no longer finds drop out with their files. Unchanged
+    files keep the size and mtime from `previous`, and mode 0. `file_filter` applies to the
+    fresh listings only; `previous` is taken to be filtered by the same rules already.
+    Returns (index, pruned): `pruned` lists the folders a listing found gone or scanned
+    whole, the only places where folders can have disappeared since the earlier listing.
+    """
+    index = FileIndex(root)
+    known_dirs = set()
+    for rel_path, _, _ in previous:
+        rel_dir = os.path.dirname(rel_path)
+        while rel_dir not in known_dirs:
+            known_dirs.add(rel_dir)
+            rel_dir = os.path.dirname(rel_dir)
+    known_dirs.add("")
+    children = {} # Known folder -> its known subfolders
+    for rel_dir in known_dirs:
+        if rel_dir:
+            children.setdefault(os.path.dirname(rel_dir), []).append(rel_dir)
+    pending = {"" if os.path.normpath(rel_dir) == "." else os.path.normpath(rel_dir): bool(recursive)
+               for rel_dir, recursive in dirty.items()}
+    queue = sorted(pending.items()) # Parents before their children
+    listed = {} # rel_dir -> [(name, size, mtime, mode), ...] of folders listed on their own
+    whole = {} # rel_dir -> FileIndex of folders scanned with everything below them
+    gone = set()
+    while queue:
+        rel_dir, recursive = queue.pop(0)
+        if _covered(rel_dir, whole, gone) or (file_filter and rel_dir and file_filter.dir_excluded(rel_dir)):
+            continue
+        path = os.path.join(root, rel_dir) if rel_dir else root
+        if recursive:
+            if not os.path.isdir(path):
+                gone.add(rel_dir)
+                continue
+            listed_below = None
+            if on_listed:
+                listed_below = lambda sub, seconds, entries, base=rel_dir: \
+                    on_listed(os.path.join(base, sub) if sub else base, seconds, entries)
+            whole[rel_dir] = scan(path, listed_below, file_filter, rel_dir)
+            index.errors.extend(whole[rel_dir].errors)
+            continue
+        started = time.perf_counter()
+        files = []
+        subdirs = set()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            child = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                            if file_filter and file_filter.skip_dir(child):
+                                continue
+                            subdirs.add(child)
+                            if child not in known_dirs and child not in pending:
+                                queue.append((child, True)) # New since the earlier listing
+                            continue
+                        if entry.is_symlink() and entry.is_dir():
+                            continue
+                        st = entry.stat()
+                    except OSError as e:
+                        index.errors.append((entry.path, e))
+                        continue
+                    if file_filter and file_filter.skip_file(_join(rel_dir, entry.name), st.st_size, st.st_mtime):
+                        continue
+                    files.append((entry.name, st.st_size, st.st_mtime, st.st_mode))
+        except (FileNotFoundError, NotADirectoryError):
+            gone.add(rel_dir)
+            continue
+        except OSError as e:
+            index.errors.append((path, e))
+            continue
+        listed[rel_dir] = (files, subdirs)
+        gone.update(child for child in children.get(rel_dir, ()) if child not in subdirs)
+        if on_listed:
+            on_listed(rel_dir, time.perf_counter() - started, len(files) + len(subdirs))
+    # Earlier entries outside the re-listed folders, then the fresh listings
+    by_dir = {}
+    for rel_path, size, mtime in previous:
+        rel_dir = os.path.dirname(rel_path)
+        if rel_dir not in listed and not _covered(rel_dir, whole, gone):
+            by_dir.setdefault(rel_dir, []).append((os.path.basename(rel_path), size, mtime, 0))
+    for rel_dir, (files, subdirs) in listed.items():
+        if not _covered(rel_dir, whole, gone):
+            by_dir.setdefault(rel_dir, []).extend(files)
+            for child in subdirs: # Empty ones too, so they are mirrored
+                by_dir.setdefault(child, [])
+    for base, sub in whole.items():
+        by_dir.setdefault(base, [])
+        for rel_dir in sub.subdirs:
+            by_dir.setdefault(os.path.join(base, rel_dir) if base else rel_dir, [])
+        for rel_path, size, mtime, mode in sub:
+            rel_path = os.path.join(base, rel_path) if base else rel_path
+            by_dir.setdefault(os.path.dirname(rel_path), []).append((os.path.basename(rel_path), size, mtime, mode))
+    for rel_dir in list(by_dir):
+        while rel_dir:
+            rel_dir = os.path.dirname(rel_dir)
+            by_dir.setdefault(rel_dir, [])
+    for rel_dir in sorted(by_dir): # Parents sort before their children
+        dir_id = index.add_dir(rel_dir) if rel_dir else 0
+        for name, size, mtime, mode in by_dir[rel_dir]:
+            index.add(dir_id, name, size, mtime, mode)
+    return index, sorted(gone | set(whole))
+
+def _covered(rel_dir, whole, gone):
+    """Whether `rel_dir` is, or lies inside, a folder that was scanned whole or is gone."""
+    while True:
+        if rel_dir in whole or rel_dir in gone:
+            return True
+        if not rel_dir:
+            return False
+        rel_dir = os.path.dirname(rel_dir)
+
+def _join(rel_dir, name):
+    return os.path.join(rel_dir, name) if rel_dir else name
@@ -0,0 +1,164 @@
+import os
+import re
+import shutil
+from src.utils.manifest import Manifest
+from src.utils.copy_engine import CopyEngine, copy_with_hash
+
+class SnapshotStore:
+    """
+    Dated, fully browseable snapshots under backups/ where unchanged files are
+    hard links into the previous snapshot (rsync --link-dest style).
+    Layout:
+        backups/<name>_<YYYY-MM-DD>/...            snapshot tree
+        backups/.<name>_<YYYY-MM-DD>.manifest.json source state captured by that snapshot
+    """
+    def __init__(self, backups_dir, name):
+        self.backups_dir = backups_dir
+        self.name = name
+        self._pattern = re.compile(rf"^{re.escape(name)}_\d{{4}}-\d{{2}}-\d{{2}}$")
+
+    def __repr__(self):
+        return f"SnapshotStore(backups_dir='{self.backups_dir}', name='{self.name}')"
+
+    # --- Queries ---
+    def list(self):
+        """Snapshot folder names, oldest first."""
+        if not os.path.isdir(self.backups_dir):
+            return []
+        return sorted(
+            entry for entry in os.listdir(self.backups_dir)
+            if self._pattern.match(entry) and os.path.isdir(os.path.join(self.backups_dir, entry))
+        )
+
+    def latest(self, before=None):
+        snapshots = [s for s in self.list() if before is None or s < before]
+        return snapshots[-1] if snapshots else None
+
+    def path(self, snapshot):
+        return os.path.join(self.backups_dir, snapshot)
+
+    def manifest_path(self, snapshot):
+        return os.path.join(self.backups_dir, f".{snapshot}.manifest.json")
+
+    # --- Actions ---
+    def create(self, index, timestamp, progress_callback=None, log=None, copy_engine=None,
+               completed=None, on_committed=None, moves=None, on_planned=None):
+        """
+        Snapshot the tree described by `index` (a FileIndex) as <name>_<timestamp>. Files whose size and mtime match the previous
+        snapshot are hard-linked to it; everything else is copied by `copy_engine`.
+        `completed` ({rel_path: {"s": size, "m": mtime}}) lists files an interrupted run already put in
+        place; they are kept as-is. on_committed(rel_path, size, mtime, file_hash) is called as each
+        file lands. Linked files inherit their hash from the previous snapshot; copied files take
+        whatever the copy engine's copy function returned.
+        `moves` ({new_rel_path: (old_rel_path, file_hash)}, see MoveDetector) links files that
+        were renamed since the previous snapshot to their old path in it instead of copying them.
+        on_planned(files, bytes) is told what is left to copy once linking is done.
+        Returns (CopyResult, linked_count).
+        """
+        copy_engine = copy_engine or CopyEngine(copy_function=copy_with_hash)
+        log = log or (lambda msg, level="info": None)
+        snapshot = f"{self.name}_{timestamp}"
+        snapshot_path = self.path(snapshot)
+        previous = self.latest(before=snapshot)
+        previous_path = self.path(previous) if previous else None
+        previous_manifest = Manifest.load(self.manifest_path(previous)) if previous else Manifest(None)
+        manifest = Manifest(self.manifest_path(snapshot))
+        if previous:
+            log(f"Linking unchanged files against snapshot: {previous}")
+        completed = completed or {}
+        to_copy = []
+        linked = 0
+        kept = 0
+        can_link = True
+        os.makedirs(snapshot_path, exist_ok=True)
+        for rel_dir in index.subdirs:
+            os.makedirs(os.path.join(snapshot_path, rel_dir), exist_ok=True)
+        for rel_path, size, mtime, _ in index:
+            src_file = index.abspath(rel_path)
+            dst_file = os.path.join(snapshot_path, rel_path)
+            moved = (moves or {}).get(rel_path)
+            base_rel = moved[0] if moved else rel_path
+            base_file = os.path.join(previous_path, base_rel) if previous_path else None
+            done = completed.get(rel_path)
+            if done and done['s'] == size and done['m'] == mtime and os.path.exists(dst_file):
+                manifest.set(rel_path, size, mtime, done.get('h'))
+                kept += 1
+                continue
+            manifest.set(rel_path, size, mtime)
+            if can_link and base_file and self._unchanged(previous_manifest, base_rel, size, mtime, base_file):
+                try:
+                    if os.path.lexists(dst_file): # Left behind by an interrupted run
+                        os.remove(dst_file)
+                    os.link(base_file, dst_file)
+                    linked += 1
+                    file_hash = (previous_manifest.get(base_rel) or {}).get('hash')
+                    manifest.set(rel_path, size, mtime, file_hash)
+                    if on_committed:
+                        on_committed(rel_path, size, mtime, file_hash)
+                    continue
+                except OSError as e:
+                    # Filesystems without hard link support (FAT, some SMB servers)
+                    log(f"Hard links unavailable, falling back to full copies: {e}", level="warning")
+                    can_link = False
+            to_copy.append((src_file, dst_file, rel_path, size, mtime))
+        total_files = kept + linked + len(to_copy)
+        if on_planned:
+            on_planned(len(to_copy), sum(item[3] for item in to_copy))
+
+        def copy_progress(done, _):
+            progress_callback(kept + linked + done, total_files)
+
+        def on_copied(src_file, dst_file, rel_path, size, mtime, file_hash):
+            manifest.set(rel_path, size, mtime, file_hash)
+            if on_committed:
+                on_committed(rel_path, size, mtime, file_hash)
+
+        result = copy_engine.copy_files(to_copy, copy_progress if progress_callback else None, on_copied)
+        # Failed copies must not be used as link bases by the next snapshot
+        for src_file, _ in result.errors:
+            manifest.remove(os.path.relpath(src_file, index.root))
+        manifest.save()
+        return result, linked
+
+    def prune(self, keep_last, dry_run=False, log=None):
+        """
+        Remove all but the newest `keep_last` snapshots.
+        Only files whose last hard link lives in a pruned snapshot count as reclaimed space.
+        Returns (removed_snapshots, reclaimed_bytes).
+        """
+        log = log or (lambda msg, level="info": None)
+        snapshots = self.list()
+        doomed = snapshots[:max(len(snapshots) - keep_last, 0)]
+        # Links shared between pruned snapshots only free space once the last of them goes
+        pending = {}
+        reclaimed = 0
+        for snapshot in doomed:
+            for root, _, files in os.walk(self.path(snapshot)):
+                for file in files:
+                    st = os.lstat(os.path.join(root, file))
+                    key = (st.st_dev, st.st_ino)
+                    seen = pending.get(key, 0) + 1
+                    pending[key] = seen
+                    if seen == st.st_nlink:
+                        reclaimed += st.st_size
+        for snapshot in doomed:
+            log(f"{'Would prune' if dry_run else 'Pruning'} snapshot: {snapshot}")
+            if not dry_run:
+                shutil.rmtree(self.path(snapshot))
+                manifest_path = self.manifest_path(snapshot)
+                if os.path.exists(manifest_path):
+                    os.remove(manifest_path)
+        return doomed, reclaimed
+
+    # --- Internal ---
+    @staticmethod
+    def _unchanged(previous_manifest, rel_path, size, mtime, base_file):
+        entry = previous_manifest.get(rel_path)
+        if entry is not None:
+            return entry['size'] == size and entry['mtime'] == mtime and os.path.exists(base_file)
+        # Older archives have no manifest; copy2 preserved mtimes, so compare against the file itself
+        try:
+            base = os.stat(base_file)
+        except OSError:
+            return False
+        return base.st_size == size and int(base.st_mtime) == int(mtime)
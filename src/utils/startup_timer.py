@@ -0,0 +1,33 @@
+import time
+
+class StartupTimer:
+    """
+    Records how long each startup phase took, so a slow launch shows up in the log:
+        Startup: first window after 412 ms (imports 180 ms, tk 95 ms, landing page 12 ms, idle 125 ms)
+    """
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = [] # [(name, seconds), ...] in order
+        self._last = self.started
+
+    def __repr__(self):
+        return f"StartupTimer(phases={len(self.phases)}, total={self.total():.3f}s)"
+
+    def mark(self, phase):
+        """End `phase` now; it lasted since the previous mark (or the start)."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def total(self):
+        return self._last - self.started
+
+    def report(self, label="first window"):
+        phases = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.phases)
+        return f"Startup: {label} after {self.total() * 1000:.0f} ms ({phases})"
+
+    def to_dict(self):
+        return {
+            "total_ms": round(self.total() * 1000, 1),
+            "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in self.phases},
+        }
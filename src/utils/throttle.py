@@ -0,0 +1,211 @@
+import re
+import time
+import threading
+from datetime import datetime
+
+_KEEP = object() # set_limits() default: leave that limit as it is
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+def parse_rate(value):
+    """
+    A rate from a job file or the GUI: a number, or a string with an optional K/M/G suffix
+    (powers of 1024, optional trailing "B" or "/s"), e.g. "20M" or "512 KB/s".
+    None, "" and 0 mean unlimited and return None.
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value > 0 else None
+    match = re.fullmatch(r"\s*([\d.]+)\s*([kmg]?)i?b?(?:/s)?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid rate: '{value}'. Expected a number, optionally with K, M or G.")
+    rate = float(match.group(1)) * 1024 ** " kmg".index(match.group(2).lower() or " ")
+    return rate if rate > 0 else None
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second accrue up to `burst`. consume() takes
+    what it needs and sleeps off any shortfall, so a request larger than the bucket is
+    still admitted, just paid for afterwards. A rate of None lets everything through.
+    The rate can be changed at any time; waiting threads pick it up within WAIT_SLICE.
+    """
+    WAIT_SLICE = 0.25 # Longest single sleep, so rate changes and cancels apply quickly
+
+    def __init__(self, rate=None, burst=None):
+        self._lock = threading.Lock()
+        self.rate = None
+        self.burst = None
+        self.tokens = 0.0
+        self._updated = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self.rate}, burst={self.burst})"
+
+    def set_rate(self, rate, burst=None):
+        """Change the rate; `burst` defaults to one second's worth."""
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            self.burst = burst or rate
+            # Lifting a limit forgives the debt; a new limit starts with a full bucket
+            self.tokens = self.burst if rate else 0.0
+
+    def consume(self, amount, cancelled=None):
+        """Take `amount` tokens, blocking until they are paid for. False if `cancelled` was set meanwhile."""
+        with self._lock:
+            if not self.rate:
+                return True
+            self._refill()
+            self.tokens -= amount
+        while True:
+            with self._lock:
+                if not self.rate:
+                    return True
+                self._refill()
+                if self.tokens >= 0:
+                    return True
+                delay = min(-self.tokens / self.rate, TokenBucket.WAIT_SLICE)
+            if cancelled is None:
+                time.sleep(delay)
+            elif cancelled.wait(delay):
+                return False
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+class Throttle:
+    """
+    Limits how fast a backup writes: bytes per second and files per second, each a
+    TokenBucket. A throttle may have a `parent` that is charged as well, e.g. a job's own
+    throttle whose parent is shared by every job writing to the same NAS, so each job and
+    the destination as a whole stay under their limits.
+
+    Limits can be changed while a run is in progress with set_limits(), or follow a
+    `schedule` of daily windows that override the base limits while they are open:
+        [{"from": "08:00", "to": "18:00", "days": ["mon", "tue", "wed", "thu", "fri"],
+          "bytes_per_second": "10M", "files_per_second": 50}]
+    Windows may wrap midnight; the first open window wins, `days` defaults to every day.
+    If `cancelled` (a threading.Event) is set while waiting, the write in progress fails
+    with InterruptedError rather than finishing at the throttled pace.
+    """
+    SCHEDULE_CHECK = 30.0 # Seconds between checks of the schedule
+
+    def __init__(self, bytes_per_second=None, files_per_second=None, parent=None, schedule=None,
+                 cancelled=None):
+        self.parent = parent
+        self.cancelled = cancelled
+        self.schedule = [self._parse_window(window) for window in schedule or ()]
+        self.base_limits = {"bytes_per_second": None, "files_per_second": None}
+        self._bytes = TokenBucket()
+        self._files = TokenBucket()
+        self._window = _KEEP # Schedule window currently applied (None = base limits)
+        self._checked = None # time.monotonic() of the last schedule check
+        self.set_limits(bytes_per_second, files_per_second)
+
+    def __repr__(self):
+        return (f"Throttle(bytes_per_second={self._bytes.rate}, files_per_second={self._files.rate}, "
+                f"parent={self.parent!r})")
+
+    # --- Public methods ---
+    def set_limits(self, bytes_per_second=_KEEP, files_per_second=_KEEP):
+        """Change the base limits (None = unlimited); safe from any thread, applies immediately."""
+        if bytes_per_second is not _KEEP:
+            self.base_limits["bytes_per_second"] = parse_rate(bytes_per_second)
+        if files_per_second is not _KEEP:
+            self.base_limits["files_per_second"] = parse_rate(files_per_second)
+        self._window = _KEEP # Re-apply whichever of base limits or schedule is in force
+        self._checked = None
+        self._check_schedule()
+
+    @property
+    def limits(self):
+        """Limits in force right now (schedule included), e.g. for display."""
+        self._check_schedule()
+        return {"bytes_per_second": self._bytes.rate, "files_per_second": self._files.rate}
+
+    @property
+    def active(self):
+        """True if this throttle or a parent limits anything (or may, by schedule)."""
+        return bool(
+            self.schedule or self._bytes.rate or self._files.rate
+            or (self.parent is not None and self.parent.active)
+        )
+
+    def describe(self):
+        """Limits in force for logs, e.g. "20.0 MiB/s, 50 files/s (destination: 40.0 MiB/s)"."""
+        limits = self.limits
+        parts = []
+        if limits["bytes_per_second"]:
+            parts.append(f"{limits['bytes_per_second'] / (1024 * 1024):.1f} MiB/s")
+        if limits["files_per_second"]:
+            parts.append(f"{limits['files_per_second']:g} files/s")
+        text = ", ".join(parts) or "unlimited"
+        if self.schedule:
+            text += f" ({len(self.schedule)} schedule window(s))"
+        if self.parent is not None and self.parent.active:
+            text += f" (destination: {self.parent.describe()})"
+        return text
+
+    def consume_bytes(self, amount):
+        self._consume("_bytes", amount, self.cancelled)
+
+    def consume_file(self):
+        self._consume("_files", 1, self.cancelled)
+
+    # --- Internal ---
+    def _consume(self, bucket, amount, cancelled):
+        self._check_schedule()
+        if not getattr(self, bucket).consume(amount, cancelled):
+            raise InterruptedError("Cancelled while throttled")
+        if self.parent is not None:
+            self.parent._consume(bucket, amount, cancelled)
+
+    def _check_schedule(self):
+        now = time.monotonic()
+        if self._checked is not None and now - self._checked < Throttle.SCHEDULE_CHECK:
+            return
+        self._checked = now
+        window = self._open_window(datetime.now())
+        if window is self._window:
+            return
+        self._window = window
+        limits = window or self.base_limits
+        self._bytes.set_rate(limits["bytes_per_second"])
+        self._files.set_rate(limits["files_per_second"])
+
+    def _open_window(self, moment):
+        minute = moment.hour * 60 + moment.minute
+        for window in self.schedule:
+            start, end = window["from"], window["to"]
+            # A window wrapping midnight belongs to the day it started on
+            day = moment.weekday() if start <= end or minute >= start else (moment.weekday() - 1) % 7
+            if day not in window["days"]:
+                continue
+            if start <= minute < end if start <= end else (minute >= start or minute < end):
+                return window
+        return None
+
+    @staticmethod
+    def _parse_window(window):
+        def minutes(text):
+            match = re.fullmatch(r"(\d{1,2}):(\d{2})", str(text).strip())
+            if not match or int(match.group(2)) > 59 or int(match.group(1)) * 60 + int(match.group(2)) > 24 * 60:
+                raise ValueError(f"Invalid time in throttle schedule: '{text}'. Expected HH:MM.")
+            return int(match.group(1)) * 60 + int(match.group(2))
+        unknown = set(window) - {"from", "to", "days", "bytes_per_second", "files_per_second"}
+        if unknown:
+            raise ValueError(f"Unknown key(s) in throttle schedule: {', '.join(sorted(unknown))}")
+        days = [str(day).lower()[:3] for day in window.get("days", WEEKDAYS)]
+        if set(days) - set(WEEKDAYS):
+            raise ValueError(f"Invalid day(s) in throttle schedule: {window['days']}")
+        return {
+            "from": minutes(window.get("from", "00:00")),
+            "to": minutes(window.get("to", "24:00")),
+            "days": {WEEKDAYS.index(day) for day in days},
+            "bytes_per_second": parse_rate(window.get("bytes_per_second")),
+            "files_per_second": parse_rate(window.get("files_per_second")),
+        }
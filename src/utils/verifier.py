@@ -0,0 +1,142 @@
+import os
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src.utils.manifest import Manifest
+
+class VerifyResult:
+    def __init__(self):
+        self.checked = 0
+        self.unhashed = 0 # Entries recorded without a hash, nothing to compare against
+        self.mismatches = [] # [(path, expected, actual), ...]
+        self.missing = [] # [path, ...]
+        self.errors = [] # [(path, error), ...]
+
+    def __repr__(self):
+        return (
+            f"VerifyResult(checked={self.checked}, mismatches={len(self.mismatches)}, "
+            f"missing={len(self.missing)}, errors={len(self.errors)})"
+        )
+
+    @property
+    def ok(self):
+        return not (self.mismatches or self.missing or self.errors)
+
+    def extend(self, other):
+        """Fold in the result of another verification, e.g. the next archive of a chain."""
+        self.checked += other.checked
+        self.unhashed += other.unhashed
+        self.mismatches.extend(other.mismatches)
+        self.missing.extend(other.missing)
+        self.errors.extend(other.errors)
+
+    def problems(self):
+        """Every failure as (path, error) pairs, in the shape BackupJob.errors uses."""
+        return (
+            [(path, ValueError(f"Hash mismatch: expected {expected}, got {actual}"))
+             for path, expected, actual in self.mismatches]
+            + [(path, FileNotFoundError("Missing from backup")) for path in self.missing]
+            + self.errors
+        )
+
+class Verifier:
+    """
+    Rehashes a finished backup against the hashes recorded when it was written.
+    Only the destination is read; the source is not touched. Hashing runs on a pool of
+    threads (hashlib releases the GIL on large buffers), so both disk and CPU stay busy.
+    """
+    DEFAULT_WORKERS = 4
+    QUEUE_DEPTH = 4 # In-flight files per worker
+    CHUNK_SIZE = 1024 * 1024 # 1 MiB
+
+    def __init__(self, workers=DEFAULT_WORKERS, algorithm=None):
+        self.workers = max(1, int(workers))
+        self.algorithm = algorithm or Manifest.HASH_ALGORITHM
+
+    def __repr__(self):
+        return f"Verifier(workers={self.workers}, algorithm='{self.algorithm}')"
+
+    # --- Public methods ---
+    def verify_tree(self, root, manifest, progress_callback=None):
+        """Check every hashed entry of `manifest` (a Manifest) against the files under `root`."""
+        expected = {}
+        result = VerifyResult()
+        for rel_path, entry in manifest.entries.items():
+            if entry.get('hash'):
+                expected[os.path.join(root, rel_path)] = entry['hash']
+            else:
+                result.unhashed += 1
+        return self._verify(expected, self._hash_file, progress_callback, result)
+
+    def verify_zip(self, zip_path, hashes, progress_callback=None):
+        """Check the members of `zip_path` against `hashes` ({arcname: hex digest or None})."""
+        result = VerifyResult()
+        expected = {}
+        for arcname, file_hash in hashes.items():
+            if file_hash:
+                expected[arcname] = file_hash
+            else:
+                result.unhashed += 1
+        # Members share one ZipFile; its file handle serialises reads, decompression runs in parallel
+        with zipfile.ZipFile(zip_path) as zipf:
+            names = set(zipf.namelist())
+            for arcname in [a for a in expected if a not in names]:
+                result.missing.append(arcname)
+                del expected[arcname]
+            return self._verify(expected, lambda arcname: self._hash_member(zipf, arcname), progress_callback, result)
+
+    def verify_pack(self, reader, progress_callback=None):
+        """Check the files packed in bundles (a pack.PackReader) against their recorded hashes."""
+        result = VerifyResult()
+        expected = {}
+        for rel_path in reader.entries:
+            if reader.hash(rel_path):
+                expected[rel_path] = reader.hash(rel_path)
+            else:
+                result.unhashed += 1
+        return self._verify(
+            expected, lambda rel_path: hashlib.new(self.algorithm, reader.read(rel_path)).hexdigest(),
+            progress_callback, result,
+        )
+
+    # --- Internal ---
+    def _verify(self, expected, hash_function, progress_callback, result):
+        total = len(expected)
+        processed = 0
+        items = iter(expected.items())
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="verify") as pool:
+            while True:
+                for path, file_hash in items:
+                    pending[pool.submit(hash_function, path)] = (path, file_hash)
+                    if len(pending) >= self.workers * Verifier.QUEUE_DEPTH:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, file_hash = pending.pop(future)
+                    try:
+                        actual = future.result()
+                    except FileNotFoundError:
+                        result.missing.append(path)
+                    except Exception as e:
+                        result.errors.append((path, e))
+                    else:
+                        result.checked += 1
+                        if actual != file_hash:
+                            result.mismatches.append((path, file_hash, actual))
+                    processed += 1
+                    if progress_callback:
+                        progress_callback(processed, total)
+        return result
+
+    def _hash_file(self, path):
+        return Manifest.file_hash(path, self.algorithm)
+
+    def _hash_member(self, zipf, arcname):
+        hasher = hashlib.new(self.algorithm)
+        with zipf.open(arcname) as f: # Also checks the member's CRC-32
+            for chunk in iter(lambda: f.read(Verifier.CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        return hasher.hexdigest()
@@ -0,0 +1,397 @@
+import os
+import sys
+import json
+import time
+import uuid
+import errno
+import select
+import struct
+import hashlib
+import threading
+from src.utils.logger import get_local_cache_dir
+from src.utils.scanner import scan
+
+def journal_path(root, journal_dir=None):
+    """Change journal of the source folder `root`, in the local cache unless `journal_dir` is given."""
+    root = os.path.abspath(root)
+    label = os.path.basename(os.path.normpath(root)) or "root"
+    digest = hashlib.sha1(os.path.normcase(root).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(journal_dir or get_local_cache_dir("watch"), f"{label}-{digest}.watch")
+
+class ChangeJournal:
+    """
+    Folders of one source tree that changed, recorded by a Watcher for the next backup run.
+    A JSON-lines file; the first line starts a session, every further line is one record:
+        {"root": "/data", "session": "3f2a...", "started": 1700000000.0}
+        {"d": "docs/2024"}              listing of that folder changed
+        {"d": "docs/new", "r": 1}       new folder: scan it with everything below it
+        {"overflow": "..."}             changes were lost; the next run must scan everything
+        {"stopped": 1700000000.0}       the watcher stopped; later changes are not recorded
+    The watcher touches the file every HEARTBEAT seconds, so a reader can tell it is alive.
+    A backup run takes a mark() before it scans and keeps it; the next run asks changes()
+    for everything recorded since that mark, or learns why it must do a full scan instead.
+    """
+    HEARTBEAT = 10.0 # Seconds between touches of the file
+    STALE_AFTER = 3 * HEARTBEAT # Older than this, the watcher is presumed dead
+    FLUSH_INTERVAL = 1.0 # Seconds changes are gathered before they are written
+    MAX_BYTES = 64 * 1024 * 1024 # Past this the journal starts a new session
+    MAX_DIRTY = 100000 # More changed folders than this and a full scan is as quick
+
+    def __init__(self, path):
+        self.path = path
+        self.session = None
+        self._root = None
+        self._file = None
+        self._pending = {} # rel_dir -> recursive, not yet written
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_heartbeat = 0.0
+
+    def __repr__(self):
+        return f"ChangeJournal(path='{self.path}', session={self.session})"
+
+    # --- Writing (the watcher) ---
+    def start_session(self, root):
+        """Start a new session, discarding the old one; runs that marked it will scan everything."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._lock:
+            if self._file:
+                self._file.close()
+            self.session = uuid.uuid4().hex
+            self._root = root
+            self._pending = {}
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._write({"root": root, "session": self.session, "started": time.time()})
+
+    def record(self, rel_dir, recursive=False):
+        """The listing of `rel_dir` changed ("" is the root); recursive when everything below it is new."""
+        with self._lock:
+            self._pending[rel_dir] = self._pending.get(rel_dir, False) or recursive
+        if time.monotonic() - self._last_flush >= ChangeJournal.FLUSH_INTERVAL:
+            self.flush()
+
+    def overflow(self, reason):
+        """Changes were lost (e.g. the event queue overflowed); the next run scans everything."""
+        self.flush()
+        with self._lock:
+            self._write({"overflow": reason})
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            if self._file and pending:
+                self._write(*({"d": rel_dir, "r": 1} if recursive else {"d": rel_dir}
+                              for rel_dir, recursive in pending.items()))
+        if self._file and self._file.tell() > ChangeJournal.MAX_BYTES:
+            self.start_session(self._root)
+
+    def heartbeat(self):
+        """Flush, and touch the file every HEARTBEAT seconds to show the watcher is alive."""
+        self.flush()
+        now = time.monotonic()
+        if self._file and now - self._last_heartbeat >= ChangeJournal.HEARTBEAT:
+            os.utime(self.path)
+            self._last_heartbeat = now
+
+    def stop(self):
+        self.flush()
+        with self._lock:
+            if self._file:
+                self._write({"stopped": time.time()})
+                self._file.close()
+                self._file = None
+
+    # --- Reading (the backup run) ---
+    def mark(self):
+        """
+        {"session", "offset"} of the journal's current end, for the next run's changes(), or
+        None when no watcher is keeping it (missing, stopped, or not touched for STALE_AFTER).
+        """
+        try:
+            with open(self.path, "rb") as f:
+                header = json.loads(f.readline())
+                size = os.fstat(f.fileno()).st_size
+                if time.time() - os.fstat(f.fileno()).st_mtime > ChangeJournal.STALE_AFTER:
+                    return None
+                f.seek(max(size - 4096, 0))
+                tail = f.read()
+        except (OSError, ValueError):
+            return None
+        lines = tail.split(b"\n")
+        complete = [line for line in lines[:-1] if line.strip()]
+        if complete and b'"stopped"' in complete[-1]:
+            return None
+        return {"session": header.get("session"), "offset": size - len(lines[-1])} # Up to the last whole line
+
+    def changes(self, since):
+        """
+        (dirty, reason): the folders recorded since the mark `since`, as {rel_dir: recursive},
+        or (None, why a full scan is needed).
+        """
+        if not since:
+            return None, "no watched run before this one"
+        try:
+            with open(self.path, "rb") as f: # Offsets are in bytes
+                header = json.loads(f.readline())
+                if header.get("session") != since.get("session"):
+                    return None, "the watcher was restarted since the last run"
+                if time.time() - os.fstat(f.fileno()).st_mtime > ChangeJournal.STALE_AFTER:
+                    return None, "the watcher is not running"
+                f.seek(since["offset"])
+                dirty = {}
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break # A record still being written
+                    if "d" in entry:
+                        dirty[entry["d"]] = dirty.get(entry["d"], False) or bool(entry.get("r"))
+                    elif "overflow" in entry:
+                        return None, f"changes were lost: {entry['overflow']}"
+                    elif "stopped" in entry:
+                        return None, "the watcher was stopped"
+        except FileNotFoundError:
+            return None, "no change journal"
+        except (OSError, ValueError) as e:
+            return None, f"change journal unreadable: {e}"
+        if len(dirty) > ChangeJournal.MAX_DIRTY:
+            return None, f"{len(dirty)} folders changed"
+        return dirty, None
+
+    # --- Internal ---
+    def _write(self, *records):
+        """Write whole lines at once (lock held), so a reader never sees half a record."""
+        self._file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._file.flush()
+
+class _Stopped(Exception):
+    """Raised inside a long scan to abandon it once the watcher is stopped."""
+
+class Watcher:
+    """
+    Records which folders of a source tree change, into a ChangeJournal, so an incremental
+    run lists only those instead of walking the whole tree (BackupJob(watch=True)).
+    Runs on its own thread. On Linux it uses inotify: one watch per folder, set up by a
+    single walk at start (raise fs.inotify.max_user_watches for very large trees). Elsewhere,
+    or where inotify is unavailable, it lists the tree every `poll_interval` seconds and
+    records the folders whose listing changed; the walk then happens in the background
+    instead of during the backup, and a run sees changes up to one poll old (newer ones are
+    picked up by the run after). Anything it cannot keep track of is recorded as an overflow.
+    """
+    def __init__(self, root, journal_dir=None, poll_interval=60.0, use_inotify=True, log=None):
+        self.root = os.path.abspath(root)
+        self.journal = ChangeJournal(journal_path(self.root, journal_dir))
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and sys.platform.startswith("linux")
+        self.log = log or (lambda msg, level="info": None)
+        self.backend = None # "inotify" or "poll" once running
+        self._stop = threading.Event()
+        self._thread = None
+        self._polled = 0.0 # time.monotonic() of the last listing
+
+    def __repr__(self):
+        return f"Watcher(root='{self.root}', backend={self.backend}, journal='{self.journal.path}')"
+
+    # --- Lifecycle ---
+    def start(self):
+        self.journal.start_session(self.root)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"watch-{os.path.basename(self.root)}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.journal.stop()
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    # --- Internal ---
+    def _run(self):
+        try:
+            if self.use_inotify:
+                try:
+                    inotify = _Inotify(self.root, self.journal, self._tick)
+                except OSError as e:
+                    self.log(f"inotify unavailable for {self.root} ({e}); polling every {self.poll_interval:g}s instead.",
+                             level="warning")
+                else:
+                    self.backend = "inotify"
+                    self.log(f"Watching {self.root} with inotify ({len(inotify.paths)} folders).")
+                    with inotify:
+                        inotify.run(self._stop)
+                    return
+            self.backend = "poll"
+            self.log(f"Watching {self.root} by listing it every {self.poll_interval:g}s.")
+            self._poll()
+        except _Stopped:
+            pass
+        except Exception as e:
+            self.journal.overflow(f"watcher failed: {e}")
+            self.log(f"Watcher for {self.root} failed: {e}", level="error")
+
+    def _tick(self, *_):
+        """Keep the heartbeat going through long walks, and abandon them once stopped."""
+        if self._stop.is_set():
+            raise _Stopped()
+        self.journal.heartbeat()
+
+    def _poll(self):
+        signatures = self._signatures()
+        while not self._stop.wait(min(self.poll_interval, ChangeJournal.HEARTBEAT)):
+            self.journal.heartbeat()
+            if time.monotonic() - self._polled < self.poll_interval:
+                continue
+            current = self._signatures()
+            for rel_dir, signature in current.items():
+                if rel_dir not in signatures:
+                    self.journal.record(rel_dir, recursive=True)
+                elif signature != signatures[rel_dir]:
+                    self.journal.record(rel_dir)
+            signatures = current
+
+    def _signatures(self):
+        """{rel_dir: hash of its files' names, sizes and mtimes and its subfolders' names}."""
+        index = scan(self.root, on_listed=self._tick)
+        listing = {rel_dir: [] for rel_dir in index.dirs}
+        for rel_dir in index.subdirs:
+            listing[os.path.dirname(rel_dir)].append(os.path.basename(rel_dir))
+        skip = os.path.relpath(self.journal.path, self.root)
+        for rel_path, size, mtime, _ in index:
+            if rel_path != skip:
+                listing[os.path.dirname(rel_path)].append((os.path.basename(rel_path), size, mtime))
+        self._polled = time.monotonic()
+        return {rel_dir: hash(tuple(sorted(map(str, entries)))) for rel_dir, entries in listing.items()}
+
+class _Inotify:
+    """A recursive inotify watch on Linux, through libc with ctypes."""
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_DONT_FOLLOW = 0x2000000
+    IN_EXCL_UNLINK = 0x4000000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE \
+        | IN_DELETE_SELF | IN_MOVE_SELF | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+    EVENT = struct.Struct("iIII") # wd, mask, cookie, name length
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, root, journal, tick):
+        import ctypes # Only needed for this backend
+        self.root = root
+        self.journal = journal
+        self.tick = tick
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.ctypes = ctypes
+        self.paths = {} # wd -> rel_dir
+        self.fd = self._check(self.libc.inotify_init1(_Inotify.IN_NONBLOCK | _Inotify.IN_CLOEXEC))
+        try:
+            self._add_tree("")
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        os.close(self.fd)
+        return False
+
+    def run(self, stop):
+        journal_file = os.path.relpath(self.journal.path, self.root)
+        while not stop.is_set():
+            ready, _, _ = select.select([self.fd], [], [], ChangeJournal.FLUSH_INTERVAL)
+            self.journal.heartbeat()
+            if not ready:
+                continue
+            try:
+                data = os.read(self.fd, _Inotify.READ_SIZE)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _Inotify.EVENT.unpack_from(data, offset)
+                offset += _Inotify.EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                self._handle(wd, mask, name, journal_file)
+
+    # --- Internal ---
+    def _handle(self, wd, mask, name, journal_file):
+        if mask & _Inotify.IN_Q_OVERFLOW:
+            self.journal.overflow("inotify event queue overflowed")
+            return
+        rel_dir = self.paths.get(wd)
+        if mask & _Inotify.IN_IGNORED:
+            self.paths.pop(wd, None)
+            return
+        if rel_dir is None:
+            return
+        if mask & (_Inotify.IN_DELETE_SELF | _Inotify.IN_MOVE_SELF):
+            if not rel_dir:
+                self.journal.overflow("the source folder was removed or moved")
+            return # Otherwise the parent's event records it
+        rel_path = os.path.join(rel_dir, name) if rel_dir else name
+        if rel_path == journal_file:
+            return
+        self.journal.record(rel_dir)
+        if mask & _Inotify.IN_ISDIR:
+            if mask & _Inotify.IN_MOVED_FROM:
+                self._remove_tree(rel_path)
+            elif mask & (_Inotify.IN_CREATE | _Inotify.IN_MOVED_TO):
+                self.journal.record(rel_path, recursive=True)
+                try:
+                    self._add_tree(rel_path)
+                except OSError as e:
+                    self.journal.overflow(f"could not watch {rel_path}: {e}")
+
+    def _add_tree(self, rel_top):
+        """Watch `rel_top` and every folder below it."""
+        stack = [rel_top]
+        while stack:
+            rel_dir = stack.pop()
+            path = os.path.join(self.root, rel_dir) if rel_dir else self.root
+            try:
+                wd = self._check(self.libc.inotify_add_watch(self.fd, os.fsencode(path), _Inotify.MASK))
+            except OSError as e:
+                if e.errno in (errno.ENOENT, errno.ENOTDIR) and rel_dir:
+                    continue # Gone already; its parent's events record that
+                raise
+            self.paths[wd] = rel_dir
+            self.tick()
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(os.path.join(rel_dir, entry.name) if rel_dir else entry.name)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _remove_tree(self, rel_top):
+        prefix = rel_top + os.sep
+        for wd, rel_dir in list(self.paths.items()):
+            if rel_dir == rel_top or rel_dir.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.paths[wd]
+
+    def _check(self, result):
+        if result < 0:
+            code = self.ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        return result
@@ -0,0 +1,208 @@
+import os
+import json
+import shutil
+import zipfile
+import threading
+from datetime import datetime
+from src.utils.manifest import Manifest
+
+class ZipChain:
+    """
+    Full / differential / incremental ZIP archives for one source folder in a destination.
+
+    - full:         every file
+    - differential: files changed since the last full archive
+    - incremental:  files changed since the previous archive of any type
+
+    Every chain archive embeds MANIFEST_MEMBER describing what it holds and which files were
+    deleted relative to its parent, so any point in time can be rebuilt from the archives alone.
+    Bookkeeping kept next to the archives:
+        .<name>.zipchain.json           ordered list of archives and their parents
+        .<name>.zipchain.base.json      source state captured by the last full archive
+        .<name>.zipchain.last.json      source state captured by the newest archive
+    """
+    MODES = ("full", "differential", "incremental")
+    SUFFIXES = {"full": "full", "differential": "diff", "incremental": "inc"}
+    MANIFEST_MEMBER = "__backup_manifest__.json"
+    _chain_lock = threading.Lock() # Retention may prune the chain while a run appends to it
+
+    def __init__(self, dest, name):
+        self.dest = dest
+        self.name = name
+        self.chain_path = os.path.join(dest, f".{name}.zipchain.json")
+        self.archives = self._load()
+
+    def __repr__(self):
+        return f"ZipChain(dest='{self.dest}', name='{self.name}', archives={len(self.archives)})"
+
+    # --- Planning ---
+    def base_archive(self):
+        """Newest full archive that still exists, or None."""
+        for archive in reversed(self.archives):
+            if archive['type'] == "full" and os.path.exists(self.path(archive['file'])):
+                return archive
+        return None
+
+    def plan(self, index, mode):
+        """
+        Decide what the next archive must contain.
+        Returns (archive_type, changed_index, deleted_rel_paths); falls back to a full archive
+        when the chain has no usable base.
+        """
+        if mode not in ZipChain.MODES:
+            raise ValueError(f"Unknown ZIP mode: '{mode}'. Expected one of {ZipChain.MODES}")
+        base = self.base_archive()
+        if mode == "full" or base is None:
+            return "full", index, []
+        reference = Manifest.load(self._state_path("base" if mode == "differential" else "last"))
+        changed = index.subset(lambda rel_path, size, mtime, _: reference.is_changed(rel_path, size, mtime))
+        current = {rel_path for rel_path, _, _, _ in index}
+        deleted = [rel_path for rel_path in reference.entries if rel_path not in current]
+        return mode, changed, deleted
+
+    def archive_name(self, archive_type, created):
+        return f"{self.name}_{created:%Y-%m-%d_%H%M%S}_{ZipChain.SUFFIXES[archive_type]}.zip"
+
+    def path(self, archive_file):
+        return os.path.join(self.dest, archive_file)
+
+    def manifest_member(self, archive_type, created, added, deleted):
+        """
+        Bytes of the manifest embedded in a new archive.
+        `added` is [(rel_path, size, mtime, file_hash), ...]; file_hash may be None.
+        """
+        base, parent = self._parents(archive_type)
+        return json.dumps({
+            "type": archive_type,
+            "created": created.isoformat(timespec="seconds"),
+            "base": base,
+            "parent": parent,
+            "files": {self.arcname(rel_path): [size, mtime, file_hash] for rel_path, size, mtime, file_hash in added},
+            "deleted": [self.arcname(rel_path) for rel_path in deleted],
+        }).encode("utf-8")
+
+    def commit(self, archive_file, archive_type, created, state):
+        """
+        Record a finished archive. `state` is [(rel_path, size, mtime), ...] for every source
+        file the archive chain now covers.
+        """
+        base, parent = self._parents(archive_type)
+        with ZipChain._chain_lock:
+            self.archives = self._load()
+            self.archives.append({
+                "file": archive_file,
+                "type": archive_type,
+                "created": created.isoformat(timespec="seconds"),
+                "base": base or archive_file,
+                "parent": parent,
+            })
+            self._save()
+        manifest = Manifest(self._state_path("last"))
+        for rel_path, size, mtime in state:
+            manifest.set(rel_path, size, mtime)
+        manifest.save()
+        if archive_type == "full":
+            manifest.path = self._state_path("base")
+            manifest.save()
+
+    def forget(self, archive_files):
+        """Drop removed archives from the chain (retention deletes the files themselves)."""
+        gone = set(archive_files)
+        with ZipChain._chain_lock:
+            self.archives = [archive for archive in self._load() if archive['file'] not in gone]
+            self._save()
+
+    # --- Restore ---
+    def restore(self, target_dir, as_of=None, progress_callback=None, log=None):
+        """
+        Rebuild the source tree as of `as_of` (datetime or ISO string; default newest) in `target_dir`.
+        Returns the number of files restored.
+        """
+        log = log or (lambda msg, level="info": None)
+        target = self.find(as_of)
+        if target is None:
+            raise FileNotFoundError(f"No archive of '{self.name}' exists as of {as_of or 'now'}")
+        path = self.resolve(target)
+        log(f"Restoring {self.name} as of {target['created']} from {len(path)} archive(s).")
+        # Replay the chain: later archives override earlier ones and record deletions
+        state = {} # arcname -> (archive_file, mtime)
+        for archive in path:
+            manifest = self.read_manifest(archive['file'])
+            for arcname in manifest['deleted']:
+                state.pop(arcname, None)
+            for arcname, entry in manifest['files'].items():
+                state[arcname] = (archive['file'], entry[1])
+        by_archive = {}
+        for arcname, (archive_file, mtime) in state.items():
+            by_archive.setdefault(archive_file, []).append((arcname, mtime))
+        total = len(state)
+        processed = 0
+        for archive_file, members in by_archive.items():
+            with zipfile.ZipFile(self.path(archive_file)) as zipf:
+                for arcname, mtime in members:
+                    dst_file = os.path.join(target_dir, *arcname.split("/"))
+                    os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+                    with zipf.open(arcname) as src, open(dst_file, "wb") as dst:
+                        shutil.copyfileobj(src, dst, 1024 * 1024)
+                    os.utime(dst_file, (mtime, mtime))
+                    processed += 1
+                    if progress_callback:
+                        progress_callback(processed, total)
+        return total
+
+    def find(self, as_of=None):
+        """Newest archive created at or before `as_of`."""
+        if isinstance(as_of, datetime):
+            as_of = as_of.isoformat(timespec="seconds")
+        candidates = [a for a in self.archives if as_of is None or a['created'] <= as_of]
+        return candidates[-1] if candidates else None
+
+    def resolve(self, archive):
+        """Archives to replay, full first, to rebuild the state captured by `archive`."""
+        by_file = {a['file']: a for a in self.archives}
+        path = [archive]
+        while path[-1]['parent']:
+            parent = by_file.get(path[-1]['parent'])
+            if parent is None:
+                raise FileNotFoundError(f"Archive chain is broken: {path[-1]['parent']} is missing")
+            path.append(parent)
+        return list(reversed(path))
+
+    def read_manifest(self, archive_file):
+        with zipfile.ZipFile(self.path(archive_file)) as zipf:
+            return json.loads(zipf.read(ZipChain.MANIFEST_MEMBER))
+
+    def hashes(self, archive_file):
+        """{arcname: hex digest or None} recorded for the files in `archive_file`."""
+        files = self.read_manifest(archive_file)['files']
+        return {arcname: entry[2] if len(entry) > 2 else None for arcname, entry in files.items()}
+
+    # --- Internal ---
+    @staticmethod
+    def arcname(rel_path):
+        return rel_path.replace(os.sep, "/")
+
+    def _parents(self, archive_type):
+        """(base, parent) file names for a new archive of `archive_type`."""
+        if archive_type == "full":
+            return None, None
+        base = self.base_archive()['file']
+        if archive_type == "differential":
+            return base, base
+        return base, self.archives[-1]['file']
+
+    def _state_path(self, which):
+        return os.path.join(self.dest, f".{self.name}.zipchain.{which}.json")
+
+    def _load(self):
+        try:
+            with open(self.chain_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("archives", [])
+        except (OSError, ValueError):
+            return []
+
+    def _save(self):
+        tmp_path = f"{self.chain_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"name": self.name, "archives": self.archives}, f, indent=2)
+        os.replace(tmp_path, self.chain_path)
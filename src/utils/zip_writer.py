@@ -0,0 +1,413 @@
+import os
+import time
+import zlib
+import shutil
+import hashlib
+import zipfile
+import tempfile
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, Future
+from src.utils.compression_policy import CompressionPolicy
+
+_ZIP_EPOCH = time.mktime((1980, 1, 1, 0, 0, 0, 0, 0, -1))
+_LZMA_EOS_FLAG = 0x02 # General purpose flag bit 1: LZMA data ends with an end-of-stream marker
+
+def zip_info(arcname, size, mtime, mode, compress_type=zipfile.ZIP_DEFLATED):
+    """Build a ZipInfo from scanned metadata instead of letting zipfile stat the file again."""
+    date_time = time.localtime(max(mtime, _ZIP_EPOCH))[:6] # ZIP can't store dates before 1980
+    zinfo = zipfile.ZipInfo(arcname, date_time)
+    zinfo.external_attr = (mode & 0xFFFF) << 16
+    zinfo.file_size = size
+    zinfo.compress_type = compress_type
+    return zinfo
+
+def member_to_entry(zinfo, end, mtime, file_hash=None):
+    """Journal entry for a committed member, enough to re-register it when resuming."""
+    return {
+        "s": zinfo.file_size, "m": mtime, "o": zinfo.header_offset, "e": end,
+        "c": zinfo.compress_size, "crc": zinfo.CRC, "t": zinfo.compress_type,
+        "a": zinfo.external_attr, "f": zinfo.flag_bits, "dt": list(zinfo.date_time),
+        "h": file_hash,
+    }
+
+def begin_member(zipf, zinfo, method):
+    """Write a placeholder local header at the archive's end; returns whether the member uses ZIP64 sizes."""
+    zinfo.compress_type = method[0]
+    if zinfo.compress_type == zipfile.ZIP_LZMA:
+        zinfo.flag_bits |= _LZMA_EOS_FLAG
+    zip64 = zinfo.file_size * 1.05 > zipfile.ZIP64_LIMIT
+    zipf.fp.seek(zipf.start_dir)
+    zinfo.header_offset = zipf.start_dir
+    zipf.fp.write(zinfo.FileHeader(zip64)) # Patched with sizes and CRC in end_member
+    return zip64
+
+def end_member(zipf, zinfo, zip64):
+    """Patch the member's local header and register it with the archive's central directory."""
+    fp = zipf.fp
+    end = fp.tell()
+    fp.seek(zinfo.header_offset)
+    fp.write(zinfo.FileHeader(zip64))
+    fp.seek(end)
+    zipf.start_dir = end
+    zipf.filelist.append(zinfo)
+    zipf.NameToInfo[zinfo.filename] = zinfo
+
+def member_from_entry(arcname, entry):
+    zinfo = zipfile.ZipInfo(arcname, tuple(entry["dt"]))
+    zinfo.file_size = entry["s"]
+    zinfo.header_offset = entry["o"]
+    zinfo.compress_size = entry["c"]
+    zinfo.CRC = entry["crc"]
+    zinfo.compress_type = entry["t"]
+    zinfo.external_attr = entry["a"]
+    zinfo.flag_bits = entry["f"]
+    return zinfo
+
+class ZipWriteResult:
+    # MiB of incompressible data DEFLATE gets through per CPU second, by level; the estimate
+    # used when a run didn't deflate enough (MIN_MEASURED_*) to measure its own rate
+    DEFLATE_RATE = {1: 32, 2: 32, 3: 31, 4: 30, 5: 29, 6: 28, 7: 27, 8: 26, 9: 25}
+    MIN_MEASURED_BYTES = 16 * 1024 * 1024
+    MIN_MEASURED_RATIO = 0.1 # Deflated output below this share of the input is trivially compressible
+
+    def __init__(self):
+        self.added = 0
+        self.errors = [] # [(src_file, error), ...]
+        self.methods = {} # method name -> {'files', 'bytes_in', 'bytes_out', 'cpu_seconds'}
+        self.policy_stored_bytes = 0 # Bytes stored instead of compressed with the policy default
+        self.hashes = {} # arcname -> hex digest of the member's content
+
+    def __repr__(self):
+        return f"ZipWriteResult(added={self.added}, errors={len(self.errors)})"
+
+    def record(self, method, bytes_in, bytes_out, cpu_seconds):
+        stats = self.methods.setdefault(
+            CompressionPolicy.method_name(method),
+            {'files': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_seconds': 0.0}
+        )
+        stats['files'] += 1
+        stats['bytes_in'] += bytes_in
+        stats['bytes_out'] += bytes_out
+        stats['cpu_seconds'] += cpu_seconds
+
+    @property
+    def bytes_in(self):
+        return sum(s['bytes_in'] for s in self.methods.values())
+
+    @property
+    def bytes_out(self):
+        return sum(s['bytes_out'] for s in self.methods.values())
+
+    def to_dict(self, level=None):
+        """The compression summary for the run report; `level` as for estimated_cpu_saved()."""
+        return {
+            "methods": {
+                name: dict(stats, cpu_seconds=round(stats['cpu_seconds'], 3))
+                for name, stats in sorted(self.methods.items())
+            },
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "saved_bytes": self.bytes_in - self.bytes_out,
+            "policy_stored_bytes": self.policy_stored_bytes,
+            "estimated_cpu_saved_seconds": round(self.estimated_cpu_saved(level), 3),
+        }
+
+    def estimated_cpu_saved(self, level=None):
+        """
+        CPU seconds DEFLATE (at `level`, None for the default) would have spent on the files the
+        policy stored instead. Uses this run's DEFLATE rate when it deflated enough data that was
+        not trivially compressible (which deflates far faster than what gets stored), else the
+        typical rate on incompressible data in DEFLATE_RATE.
+        """
+        if not self.policy_stored_bytes:
+            return 0.0
+        deflated = [s for name, s in self.methods.items() if name.startswith("deflate")]
+        bytes_in = sum(s['bytes_in'] for s in deflated)
+        bytes_out = sum(s['bytes_out'] for s in deflated)
+        cpu_seconds = sum(s['cpu_seconds'] for s in deflated)
+        if bytes_in >= ZipWriteResult.MIN_MEASURED_BYTES and cpu_seconds \
+                and bytes_out >= bytes_in * ZipWriteResult.MIN_MEASURED_RATIO:
+            return self.policy_stored_bytes * cpu_seconds / bytes_in
+        rate = ZipWriteResult.DEFLATE_RATE.get(level, ZipWriteResult.DEFLATE_RATE[6]) * 1024 * 1024
+        return self.policy_stored_bytes / rate
+
+class _Piece:
+    """Output of one compression task: a whole small member, a spooled member, or one chunk."""
+    __slots__ = ("method", "raw", "crc", "payload", "size", "cpu", "digest")
+
+    def __init__(self, method, raw, crc, payload, size, cpu, digest=None):
+        self.method = method
+        self.raw = raw # Uncompressed chunk when the writer must extend the CRC and hash, else None
+        self.crc = crc
+        self.payload = payload # bytes or a spooled file object
+        self.size = size # Compressed length of payload
+        self.cpu = cpu
+        self.digest = digest # Content hash of a whole member
+
+    def write_to(self, fp):
+        if isinstance(self.payload, bytes):
+            fp.write(self.payload)
+        else:
+            with self.payload:
+                self.payload.seek(0)
+                shutil.copyfileobj(self.payload, fp, ParallelZipWriter.CHUNK_SIZE)
+
+class ParallelZipWriter:
+    """
+    Writes a standard ZIP archive while compression runs on a pool of threads (zlib, bz2 and
+    lzma all release the GIL). The method for each member comes from a CompressionPolicy.
+
+    Small files are one task each. Large DEFLATE/STORED members are cut into chunks that are
+    compressed independently, pigz style: each chunk is primed with the 32 KiB preceding it as
+    a dictionary and ends on a sync flush, so the pieces concatenate into one valid raw DEFLATE
+    stream. Large BZIP2/LZMA members can't be split and are compressed whole into a spool.
+    Finished work is appended in submission order, so member order matches the index.
+    With a `hash_algorithm`, each member's content is hashed from the buffers read for
+    compression (see ZipWriteResult.hashes), so the files are read only once.
+    A `throttle` (see throttle.Throttle) paces the archive writes: one file token per member
+    and the compressed bytes of every piece, paid for before the piece is written.
+    `progress(amount)` is told the uncompressed bytes of every piece as it is written, so
+    a large member moves a progress bar while it is compressed. `stats` (a RunStats) gets each
+    member's latency: from when the writer starts waiting for its first piece to its commit.
+    """
+    CHUNK_SIZE = 1024 * 1024 # 1 MiB
+    WINDOW_SIZE = 32 * 1024 # DEFLATE back-reference window
+    SPOOL_SIZE = 8 * 1024 * 1024 # Whole-member output kept in memory before spilling to disk
+    QUEUE_DEPTH = 4 # In-flight tasks per worker
+
+    def __init__(self, zip_path, workers=None, policy=None, chunk_size=CHUNK_SIZE, hash_algorithm=None,
+                 throttle=None, progress=None, stats=None):
+        self.zip_path = zip_path
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.policy = policy or CompressionPolicy()
+        self.chunk_size = chunk_size
+        self.hash_algorithm = hash_algorithm
+        self.throttle = throttle
+        self.progress = progress
+        self.stats = stats
+        self._fp = None
+
+    def __repr__(self):
+        return f"ParallelZipWriter(zip_path='{self.zip_path}', workers={self.workers}, policy={self.policy!r})"
+
+    def write_index(self, index, progress_callback=None, on_added=None, extras=None,
+                    resume=None, on_committed=None):
+        """
+        Add every file of a FileIndex to a new archive at `zip_path`.
+        A file that fails to read is rolled back out of the archive and reported, not fatal.
+        `on_added(arcname)` runs on the calling thread after each member is committed.
+        `extras` is a callable returning [(arcname, bytes), ...] to append after the files;
+        it runs once every file has been written, so it can describe what actually went in.
+        `resume` continues an interrupted archive instead of starting a new one: a list of
+        (arcname, journal_entry) for members already committed, as given to
+        `on_committed(arcname, journal_entry)`. Anything after the last of them is discarded.
+        """
+        result = ZipWriteResult()
+        total = len(index)
+        processed = 0
+        pending = deque()
+        limit = self.workers * ParallelZipWriter.QUEUE_DEPTH
+        zinfo = None # Member currently being appended, None once it failed
+        method = zip64 = hasher = digest = None
+        cpu = 0.0
+        started = 0.0
+        for arcname, entry in resume or ():
+            result.hashes[arcname] = entry.get("h")
+        with ExitStack() as stack:
+            stack.callback(setattr, self, "_fp", None) # Nothing left to sync once the archive is closed
+            zipf = stack.enter_context(self._open(resume, stack))
+            pool = stack.enter_context(ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="compress"))
+            fp = self._fp = zipf.fp
+            tasks = self._iter_tasks(index, pool)
+            while True:
+                for task in tasks:
+                    pending.append(task)
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    break
+                # Consume strictly in order; later tasks keep compressing meanwhile
+                arcname, size, mtime, mode, offset, last, future = pending.popleft()
+                src_file = index.abspath(arcname)
+                if offset == 0:
+                    zinfo = zip_info(arcname, size, mtime, mode)
+                    zinfo.compress_size = zinfo.CRC = 0
+                    method = digest = None
+                    hasher = hashlib.new(self.hash_algorithm) if self.hash_algorithm else None
+                    cpu = 0.0
+                    started = time.monotonic()
+                if zinfo is not None:
+                    try:
+                        piece = future.result()
+                        if self.throttle:
+                            if method is None:
+                                self.throttle.consume_file()
+                            self.throttle.consume_bytes(piece.size)
+                        if method is None:
+                            method = piece.method
+                            zip64 = begin_member(zipf, zinfo, method)
+                        if piece.raw is None:
+                            zinfo.CRC = piece.crc
+                            digest = piece.digest
+                        else:
+                            zinfo.CRC = zlib.crc32(piece.raw, zinfo.CRC)
+                            if hasher:
+                                hasher.update(piece.raw)
+                        piece.write_to(fp)
+                        zinfo.compress_size += piece.size
+                        cpu += piece.cpu
+                        if self.progress:
+                            self.progress(size - offset if last else self.chunk_size)
+                    except Exception as e:
+                        if method is not None:
+                            # Roll the partial member back out of the archive
+                            fp.seek(zinfo.header_offset)
+                            fp.truncate()
+                        zinfo = None
+                        result.errors.append((src_file, e))
+                if not last:
+                    continue
+                if zinfo is not None:
+                    end_member(zipf, zinfo, zip64)
+                    if digest is None and hasher:
+                        digest = hasher.hexdigest()
+                    result.hashes[arcname] = digest
+                    if on_committed:
+                        on_committed(arcname, member_to_entry(zinfo, zipf.start_dir, mtime, digest))
+                    result.added += 1
+                    result.record(method, size, zinfo.compress_size, cpu)
+                    if self.stats:
+                        self.stats.file_done(src_file, size, time.monotonic() - started)
+                    if method[0] == zipfile.ZIP_STORED and self.policy.default[0] != zipfile.ZIP_STORED:
+                        result.policy_stored_bytes += size
+                    if on_added:
+                        on_added(arcname)
+                processed += 1
+                if progress_callback:
+                    progress_callback(processed, total)
+            for arcname, data in (extras(result) if extras else ()):
+                zipf.writestr(zip_info(arcname, len(data), time.time(), 0o100644), data)
+        return result
+
+    def sync(self):
+        """Push committed members to disk. Call before journaling them so the journal never runs ahead."""
+        fp = self._fp
+        if fp is not None:
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    def _open(self, resume, stack):
+        if not resume:
+            return zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        end = max(entry["e"] for _, entry in resume)
+        fp = stack.enter_context(open(self.zip_path, "r+b")) # Closed after the ZipFile writes its directory
+        if os.fstat(fp.fileno()).st_size < end:
+            raise ValueError(f"Interrupted archive is shorter than its journal: {self.zip_path}")
+        fp.truncate(end)
+        fp.seek(end)
+        zipf = zipfile.ZipFile(fp, "w", zipfile.ZIP_DEFLATED, allowZip64=True)
+        for arcname, entry in resume:
+            zinfo = member_from_entry(arcname, entry)
+            zipf.filelist.append(zinfo)
+            zipf.NameToInfo[zinfo.filename] = zinfo
+        return zipf
+
+    # --- Scheduling ---
+    def _iter_tasks(self, index, pool):
+        """Submits work as the caller pulls; yields (arcname, size, mtime, mode, offset, last, future)."""
+        for arcname, size, mtime, mode in index:
+            src_file = index.abspath(arcname)
+            method = self.policy.by_name(arcname)
+            if size <= self.chunk_size:
+                future = pool.submit(self._compress_small, src_file, size, method)
+                yield arcname, size, mtime, mode, 0, True, future
+                continue
+            chunk_method = method or self.policy.default
+            if not CompressionPolicy.is_chunkable(chunk_method):
+                future = pool.submit(self._compress_whole, src_file, size, method)
+                yield arcname, size, mtime, mode, 0, True, future
+                continue
+            if method is None:
+                # Decide once for every chunk; FIFO scheduling starts this before any of them
+                method = pool.submit(self._sample, src_file)
+            offset = 0
+            while True:
+                length = min(self.chunk_size, size - offset)
+                last = offset + length >= size
+                future = pool.submit(self._compress_chunk, src_file, offset, length, last, method)
+                yield arcname, size, mtime, mode, offset, last, future
+                if last:
+                    break
+                offset += length
+
+    # --- Workers ---
+    def _sample(self, src_file):
+        with open(src_file, "rb") as f:
+            return self.policy.by_sample(f.read(self.policy.sample_size))
+
+    def _compress_small(self, src_file, size, method):
+        started = time.thread_time()
+        with open(src_file, "rb") as f:
+            raw = f.read(size) # A file that grew since the scan is captured at its scanned size
+        if len(raw) != size:
+            raise OSError(f"File changed size during backup: {src_file}")
+        method = method or self.policy.by_sample(raw)
+        compressor = CompressionPolicy.compressor(method)
+        payload = compressor.compress(raw) + compressor.flush() if compressor else raw
+        digest = hashlib.new(self.hash_algorithm, raw).hexdigest() if self.hash_algorithm else None
+        return _Piece(method, None, zlib.crc32(raw), payload, len(payload), time.thread_time() - started, digest)
+
+    def _compress_whole(self, src_file, size, method):
+        started = time.thread_time()
+        crc = length = 0
+        hasher = hashlib.new(self.hash_algorithm) if self.hash_algorithm else None
+        spool = tempfile.SpooledTemporaryFile(max_size=ParallelZipWriter.SPOOL_SIZE)
+        try:
+            with open(src_file, "rb") as f:
+                if method is None:
+                    method = self.policy.by_sample(f.read(self.policy.sample_size))
+                    f.seek(0)
+                compressor = CompressionPolicy.compressor(method)
+                while length < size:
+                    block = f.read(min(self.chunk_size, size - length))
+                    if not block:
+                        break
+                    crc = zlib.crc32(block, crc)
+                    if hasher:
+                        hasher.update(block)
+                    length += len(block)
+                    spool.write(compressor.compress(block) if compressor else block)
+                if compressor:
+                    spool.write(compressor.flush())
+            if length != size:
+                raise OSError(f"File changed size during backup: {src_file}")
+        except Exception:
+            spool.close()
+            raise
+        digest = hasher.hexdigest() if hasher else None
+        return _Piece(method, None, crc, spool, spool.tell(), time.thread_time() - started, digest)
+
+    def _compress_chunk(self, src_file, offset, length, last, method):
+        if isinstance(method, Future):
+            method = method.result()
+        started = time.thread_time()
+        with open(src_file, "rb") as f:
+            start = max(0, offset - ParallelZipWriter.WINDOW_SIZE)
+            if start:
+                f.seek(start)
+            data = f.read(offset - start + length)
+        zdict, raw = data[:offset - start], data[offset - start:]
+        if len(raw) != length:
+            raise OSError(f"File changed size during backup: {src_file}")
+        compress_type, level = method
+        if compress_type == zipfile.ZIP_STORED:
+            payload = raw
+        else:
+            level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+            if zdict:
+                compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+            else:
+                compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            payload = compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+        return _Piece(method, raw, 0, payload, len(payload), time.thread_time() - started)
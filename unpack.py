@@ -0,0 +1,52 @@
+"""
+Extractor for mirrors written with `pack_small_files`: restores packed files without
+needing the job that wrote them.
+
+    python unpack.py MIRROR TARGET [PATH ...] [--workers N]
+    python unpack.py MIRROR --list [PATH ...]
+
+MIRROR is a mirror folder (live or archived under backups/) or its .packs folder.
+PATHs are files or folders relative to the source root; without any, everything packed
+is restored. Exit status: 0 on success, 1 if some files failed, 3 on bad arguments.
+"""
+import os
+import sys
+import argparse
+from src.utils.pack import PackReader, PACK_DIR
+
+EXIT_INVALID = 3
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Restore files packed into bundles by a mirror backup.")
+    parser.add_argument("mirror", help="Mirror folder (or its .packs folder)")
+    parser.add_argument("target", nargs="?", help="Folder to restore into")
+    parser.add_argument("paths", nargs="*", metavar="PATH", help="Files or folders to restore (default: all)")
+    parser.add_argument("--list", action="store_true", help="List packed files instead of restoring")
+    parser.add_argument("--workers", type=int, default=4, help="Bundles read at once")
+    return parser.parse_intermixed_args(argv) # PATHs may follow --list
+
+def main(argv=None):
+    args = parse_args(argv)
+    pack_dir = args.mirror if os.path.basename(os.path.normpath(args.mirror)) == PACK_DIR \
+        else os.path.join(args.mirror, PACK_DIR)
+    reader = PackReader(pack_dir)
+    if not len(reader):
+        print(f"[ERROR] No packed files in {pack_dir}", file=sys.stderr)
+        return EXIT_INVALID
+    if args.list:
+        # With --list, the first PATH lands in `target`
+        paths = ([args.target] if args.target else []) + args.paths
+        for rel_path in sorted(reader.select(paths or None)):
+            print(rel_path)
+        return 0
+    if not args.target:
+        print("[ERROR] No target folder given", file=sys.stderr)
+        return EXIT_INVALID
+    result = reader.extract(args.target, args.paths or None, args.workers)
+    for rel_path, error in result.errors:
+        print(f"[ERROR] {rel_path}: {error}", file=sys.stderr)
+    print(f"Restored {result.copied} files to {args.target}" + (f", {len(result.errors)} failed" if result.errors else ""))
+    return 1 if result.errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Watch source folders and record what changes between backups, until stopped (Ctrl-C).
+
+    python watch.py SRC [SRC ...] [--journal-dir DIR] [--poll SECONDS] [--no-inotify]
+
+Incremental jobs with "watch": true (or BackupJob(watch=True)) then list only the folders
+recorded as changed instead of walking the whole source. Run it on the machine that runs
+the backups, e.g. as a service started at boot. While it is not running, or after it loses
+track of changes, the next run scans everything as usual. Uses inotify on Linux and lists
+the tree every --poll seconds elsewhere. Exit status: 0 when stopped, 3 on bad arguments.
+"""
+import os
+import sys
+import time
+import argparse
+from src.utils.watcher import Watcher
+
+EXIT_INVALID = 3
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Record which folders change between backups.")
+    parser.add_argument("sources", nargs="+", metavar="SRC", help="Source folders to watch")
+    parser.add_argument("--journal-dir", help="Folder for the change journals (default: local cache)")
+    parser.add_argument("--poll", type=float, default=60.0, metavar="SECONDS",
+                        help="Seconds between listings where inotify is not used")
+    parser.add_argument("--no-inotify", action="store_true", help="Always poll, e.g. for a network mount")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    missing = [src for src in args.sources if not os.path.isdir(src)]
+    if missing:
+        print(f"[ERROR] Source not found: {', '.join(missing)}", file=sys.stderr)
+        return EXIT_INVALID
+    log = lambda msg, level="info": print(f"[{level.upper()}] {msg}", file=sys.stderr, flush=True)
+    watchers = [
+        Watcher(src, args.journal_dir, poll_interval=args.poll, use_inotify=not args.no_inotify, log=log)
+        for src in args.sources
+    ]
+    for watcher in watchers:
+        watcher.start()
+        log(f"Journal for {watcher.root}: {watcher.journal.path}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for watcher in watchers:
+            watcher.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())